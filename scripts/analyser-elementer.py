@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
+import argparse
 import json
 import os
-import sys
 from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 import requests
-from dataclasses import dataclass
 import logging
 from urllib.parse import urlparse
 
+from lmditools.batch import open_manifest, run_batch
+from lmditools.elementindex import ElementIndex
+from lmditools.loader import get_default_loader
+from lmditools.prefetch import prefetch_for_files
+from lmditools.records import Cardinality, ElementRecord
+from lmditools.snapshot import SnapshotGenerator
+
 RESOURCE_NAME_MAPPING = {
     'lmdi-bundle': 'LegemiddelregisterBundle',
     'lmdi-condition': 'Diagnose',
@@ -28,23 +34,13 @@ RESOURCE_NAME_MAPPING = {
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
-class ElementInfo:
-    path: str
-    type: str
-    binding_name: str
-    cardinalityProfile: str
-    cardinalityBase: str
-    slicing: str
-    valueSetBinding: str
-    attributes: str
-
 class FHIRProfileAnalyzer:
     def __init__(self):
         self.cache = {}
         self.max_retries = 3
         self.timeout = 30
-        self.base_resources_cache = {}
+        self.loader = get_default_loader()
+        self.snapshot_generator = SnapshotGenerator(self.loader)
 
     def _get_resource_name(self, resource_id: str) -> str:
         """Oversetter resource ID til navn hvis det finnes i mappingen."""
@@ -71,52 +67,10 @@ class FHIRProfileAnalyzer:
             raise
 
     def get_base_resource(self, base_url: str) -> Optional[dict]:
-        """
-        Last ned (eller hent fra cache) en baseressurs for et gitt base_url.
-        Søker først lokalt i base_resources/<resource_type>.json, deretter
-        i http://hl7.org/fhir/R4/StructureDefinition-<resource_type>.json osv.
-        """
+        """Hent baseressursen for base_url via den delte loaderen (minne, disk-cache, nett)."""
         if not base_url:
             return None
-
-        if base_url in self.base_resources_cache:
-            return self.base_resources_cache[base_url]
-
-        resource_type = base_url.split('/')[-1]  # f.eks "Organization"
-
-        local_path = f"base_resources/{resource_type}.json"
-        if os.path.exists(local_path):
-            try:
-                with open(local_path, 'r', encoding='utf-8') as f:
-                    base = json.load(f)
-                self.base_resources_cache[base_url] = base
-                return base
-            except Exception as e:
-                logger.warning(f"Feil ved lasting av baseressurs lokalt for {resource_type}: {e}")
-
-        try:
-            api_url = f"http://hl7.org/fhir/R4/StructureDefinition-{resource_type}.json"
-            response = requests.get(api_url)
-            if response.status_code == 404:
-                api_url = f"http://hl7.org/fhir/R4/{resource_type}.profile.json"
-                response = requests.get(api_url)
-
-            if response.status_code != 200:
-                logger.warning(f"Kunne ikke laste baseressurs: {resource_type} (HTTP {response.status_code})")
-                return None
-
-            base = response.json()
-
-            os.makedirs("base_resources", exist_ok=True)
-            with open(local_path, 'w', encoding='utf-8') as f:
-                json.dump(base, f, ensure_ascii=False, indent=2)
-
-            self.base_resources_cache[base_url] = base
-            return base
-
-        except Exception as e:
-            logger.warning(f"Feil ved lasting av baseressurs {resource_type}: {e}")
-            return None
+        return self.loader.get(base_url)
 
     def get_element_type(self, element: dict) -> str:
         """Extract and format element type information."""
@@ -268,7 +222,7 @@ class FHIRProfileAnalyzer:
             logger.error("Exception details:", exc_info=True)
             raise
 
-    def _process_elements(self, profile: dict, base_resource: Optional[dict]) -> List[ElementInfo]:
+    def _process_elements(self, profile: dict, base_resource: Optional[dict]) -> List[ElementRecord]:
         """Process all elements in the profile."""
         elements = []
         snapshot = profile.get('snapshot', {}).get('element', [])
@@ -285,8 +239,8 @@ class FHIRProfileAnalyzer:
             path = element['path']
 
             if ':' in element_id:
-                base_path, slice_name = element_id.rsplit(':', 1)
-                formatted_path = f"{self._format_path(path, profile['type'])}:{slice_name}"
+                # Id-en har slicenavnet på riktig nivå, f.eks. identifier:FNR.system
+                formatted_path = self._format_path(element_id, profile['type'])
             else:
                 formatted_path = self._format_path(path, profile['type'])
 
@@ -297,25 +251,29 @@ class FHIRProfileAnalyzer:
                         binding_name = ext.get('valueString', '')
                         break
 
-            element_info = ElementInfo(
+            cardinality = Cardinality.from_element(element)
+            base_cardinality = self._get_base_cardinality(element, base_resource)
+            element_info = ElementRecord(
                 path=formatted_path,
                 type=self.get_element_type(element),
                 binding_name=binding_name,
-                cardinalityProfile=f"{element.get('min', '0')}..{element.get('max', '*')}",
-                cardinalityBase=self._get_base_cardinality(element, base_resource),
+                min=cardinality.min,
+                max=cardinality.max,
+                base_min=base_cardinality.min if base_cardinality else None,
+                base_max=base_cardinality.max if base_cardinality else None,
                 slicing=self.format_slicing(element),
-                valueSetBinding=self.get_valueset_binding(element),
+                value_set=self.get_valueset_binding(element),
                 attributes=self.get_attributes(element)
             )
             elements.append(element_info)
 
         return self._sort_elements(elements)
 
-    def _sort_elements(self, elements: List[ElementInfo]) -> List[ElementInfo]:
+    def _sort_elements(self, elements: List[ElementRecord]) -> List[ElementRecord]:
         """Sorter elementene alfabetisk etter path."""
         return sorted(elements, key=lambda e: e.path)
 
-    def _generate_tables(self, elements: List[ElementInfo]) -> List[str]:
+    def _generate_tables(self, elements: List[ElementRecord]) -> List[str]:
         """Generate all required Markdown tables."""
         kept, removed = self._split_removed_elements(elements)
 
@@ -333,7 +291,7 @@ class FHIRProfileAnalyzer:
 
         return tables
 
-    def _generate_element_table(self, elements: List[ElementInfo]) -> List[str]:
+    def _generate_element_table(self, elements: List[ElementRecord]) -> List[str]:
         """Generate a Markdown table for elements."""
         table = [
             "| Element | Type | Profile | Base |",
@@ -341,13 +299,13 @@ class FHIRProfileAnalyzer:
         ]
 
         for element in elements:
-            if element.cardinalityProfile == '0..0':
+            if element.is_removed:
                 continue
 
-            if element.cardinalityProfile != element.cardinalityBase:
-                cardinalityProfile = f"**{element.cardinalityProfile}**"
+            if element.cardinality_changed:
+                cardinalityProfile = f"**{element.cardinality}**"
             else:
-                cardinalityProfile = element.cardinalityProfile
+                cardinalityProfile = element.cardinality
 
             # Escaper '|' tegnet i type-kolonnen ved å erstatte det med '\|'
             type_column = element.type.replace('|', '\\|')
@@ -356,12 +314,12 @@ class FHIRProfileAnalyzer:
 
             table.append(
                 f"| {element.path} | {type_column} | {cardinalityProfile} | "
-                f"{element.cardinalityBase} | "
+                f"{element.base_cardinality} | "
             )
 
         return table
     
-    def _generate_removed_elements_table(self, elements: List[ElementInfo]) -> List[str]:
+    def _generate_removed_elements_table(self, elements: List[ElementRecord]) -> List[str]:
         """Generate a Markdown table for removed elements."""
         if not elements:
             return ["No removed elements."]
@@ -384,55 +342,39 @@ class FHIRProfileAnalyzer:
             return "..." + path[-40:]
         return path
 
-    def _get_base_cardinality(self, element: dict, base_resource: Optional[dict]) -> str:
-        """Get cardinality from base resource."""
+    def _get_base_cardinality(self, element: dict, base_resource: Optional[dict]) -> Optional[Cardinality]:
+        """Get cardinality from base resource (None without a base resource)."""
         if not base_resource:
-            return ""
+            return None
 
-        base_elements = base_resource.get('snapshot', {}).get('element', [])
+        base_index = ElementIndex.for_section(base_resource)
         element_path = element['path']
 
-        # Prøv eksakt match:
-        for base_element in base_elements:
-            if base_element['path'] == element_path:
-                return f"{base_element.get('min', '0')}..{base_element.get('max', '*')}"
+        # Prøv eksakt match (inkludert choice-typer, f.eks. valueQuantity -> value[x]):
+        base_element = base_index.find(element_path)
 
         # Hvis nested element, sjekk delvis match som en fallback:
-        if '.' in element_path:
-            base_path_parts = element_path.split('.')
-            for base_element in base_elements:
-                base_element_path = base_element['path'].split('.')
-                if all(part in base_element_path for part in base_path_parts):
-                    return f"{base_element.get('min', '0')}..{base_element.get('max', '*')}"
+        if base_element is None and '.' in element_path:
+            base_element = base_index.find_by_segments(element_path.split('.'))
 
-        return "0..1"  # fallback
+        if base_element is not None:
+            return Cardinality.from_element(base_element)
 
-    def _generate_snapshot(self, differential: List[dict], base: dict) -> List[dict]:
-        """Generate snapshot from differential and base resource (for simplicity)."""
-        base_elements = {e['path']: e for e in base.get('snapshot', {}).get('element', [])}
-        result = []
-
-        for element in differential:
-            path = element['path']
-            if path in base_elements:
-                # Merge base og differential
-                merged = {**base_elements[path], **element}
-                result.append(merged)
-            else:
-                # Nytt element
-                result.append(element)
+        return Cardinality(0, 1)  # fallback
 
-        return result
+    def _generate_snapshot(self, differential: List[dict], base: dict) -> List[dict]:
+        """Generate snapshot from differential and base resource (slices, choice types and datatypes included)."""
+        return self.snapshot_generator.generate({'differential': {'element': differential}}, base)
 
-    def _split_removed_elements(self, elements: List[ElementInfo]) -> (List[ElementInfo], List[ElementInfo]):
+    def _split_removed_elements(self, elements: List[ElementRecord]) -> (List[ElementRecord], List[ElementRecord]):
         """
         Returnerer to lister: (kept, removed).
-        - removed inneholder kun de elementene som har cardinalityProfile == '0..0' (altså "fjernede rot-elementer").
+        - removed inneholder kun de elementene som har max = 0 (altså "fjernede rot-elementer").
         - barne-elementer (path som starter med "<forelder>." eller "<forelder>:") blir helt skjult (er verken i kept eller removed).
         """
 
         # 1) Finn alle "rot-elementer" som eksplisitt har 0..0
-        removed_explicit = [e for e in elements if e.cardinalityProfile == '0..0']
+        removed_explicit = [e for e in elements if e.is_removed]
 
         # 2) Finn alle under-elementer/slices av disse fjernede elementene
         #    Disse vil vi utelukke fra "kept" og "removed" (helt skjult).
@@ -456,25 +398,52 @@ class FHIRProfileAnalyzer:
 
         return (kept, removed)
 
+_ANALYZER: Optional[FHIRProfileAnalyzer] = None
+
+def analyze_file(file_path: str) -> str:
+    """Analyze one profile with a per-process analyzer (usable from worker processes)."""
+    global _ANALYZER
+    if _ANALYZER is None:
+        _ANALYZER = FHIRProfileAnalyzer()
+    return _ANALYZER.analyze_profile(file_path)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Analyze FHIR StructureDefinition element changes.")
+    parser.add_argument("path", nargs='?', help="Path to FHIR StructureDefinition or directory")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse results for profiles unchanged since the previous run")
+    parser.add_argument("--manifest", help="Path to manifest file (default: in the cache directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes in directory mode (default: 1)")
+    return parser.parse_args()
+
 def main():
     """Main function to handle command line operation."""
-    if len(sys.argv) > 1:
-        path = sys.argv[1]
-    else:
+    args = parse_arguments()
+    path = args.path
+    if path is None:
         path = input("Enter path to FHIR StructureDefinition or directory: ").strip()
 
     if not path:
         path = "profiles"
 
-    analyzer = FHIRProfileAnalyzer()
+    global _ANALYZER
+    analyzer = _ANALYZER = FHIRProfileAnalyzer()
 
     try:
         if os.path.isdir(path):
-            for filename in os.listdir(path):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(path, filename)
-                    print(f"\nAnalyzing {filename}...")
-                    print(analyzer.analyze_profile(file_path))
+            filenames = sorted(f for f in os.listdir(path) if f.endswith('.json'))
+            file_paths = [os.path.join(path, f) for f in filenames]
+            prefetch_for_files(file_paths, analyzer.loader)
+            manifest = None
+            if args.incremental or args.manifest:
+                manifest = open_manifest(__file__, path, args.manifest)
+            for file_path, output in run_batch(file_paths, analyze_file, manifest,
+                                                analyzer.loader, args.jobs):
+                print(f"\nAnalyzing {os.path.basename(file_path)}...")
+                print(output)
+            if manifest:
+                manifest.save()
         else:
             print(analyzer.analyze_profile(path))
 
@@ -484,4 +453,4 @@ def main():
         print(f"Error: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
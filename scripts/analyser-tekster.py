@@ -1,134 +1,67 @@
+import argparse
 import os
-import json
 import sys
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
-import requests
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from lmditools.basetexts import EMPTY_TEXT, base_texts
+from lmditools.batch import capture_stdout, open_manifest, run_batch
+from lmditools.elementindex import ElementIndex
+from lmditools.loader import get_default_loader
+from lmditools.manifest import default_manifest_path
+from lmditools.prefetch import prefetch_for_files
+from lmditools.stream import load_structure_definition
+from lmditools.textreport import EMITTERS, TextReport, TextRow, write_csv, write_csv_header
+
+OUTPUT_BUFFER_SIZE = 1 << 16
 
 class FHIRProfileAnalyzer:
     def __init__(self):
         self.properties = ['short', 'definition', 'comment']
         self.profile_properties = ['description', 'purpose']
-        self.base_resources_cache = {}
+        self.loader = get_default_loader()
+        # Feilmeldinger går til stdout sammen med Markdown, ellers til stderr
+        self.message_file: Optional[TextIO] = None
 
     def load_json_file(self, file_path: str) -> dict:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_structure_definition(file_path)
         except Exception as e:
-            print(f"Feil ved lesing av fil {file_path}: {str(e)}")
+            print(f"Feil ved lesing av fil {file_path}: {str(e)}", file=self.message_file)
             return None
 
-    def get_base_elements(self, base_resource: dict) -> dict:
-        """
-        Bygger en dictionary med nøkkel = path og verdi = liste over alle base-elementene
-        for den pathen.
-        """
-        elements = {}
-        for elem in base_resource.get('snapshot', {}).get('element', []):
-            path = elem.get('path', '')
-            if not path:
-                continue
-            if path not in elements:
-                elements[path] = []
-            elements[path].append(elem)
-        return elements
-
-    def get_base_text(self, base_elements: dict, path: str, prop: str) -> str:
-        """
-        Returnerer verdien for en gitt egenskap (prop) fra det første base-elementet
-        for en gitt path som har en definert verdi.
-        """
-        elems = base_elements.get(path, [])
-        for elem in elems:
-            val = elem.get(prop, '')
-            if val:
-                return val
-        return ''
+    def get_base_texts(self, base_url: str):
+        """Basens tekster fra pakkeindeksen (lmditools/basetexts.py), ellers fra loaderen."""
+        texts = base_texts(base_url, self.loader)
+        if texts is None:
+            print(f"Kunne ikke laste baseressurs: {base_url.split('/')[-1]}", file=self.message_file)
+        return texts
 
-
-
-    def get_base_resource(self, base_url: str) -> dict:
-        if base_url in self.base_resources_cache:
-            return self.base_resources_cache[base_url]
-
-        resource_type = base_url.split('/')[-1]
-        
-        local_path = f"base_resources/{resource_type}.json"
-        if os.path.exists(local_path):
-            base = self.load_json_file(local_path)
-        else:
-            try:
-                api_url = f"http://hl7.org/fhir/R4/StructureDefinition-{resource_type}.json"
-                response = requests.get(api_url)
-                if response.status_code == 404:
-                    api_url = f"http://hl7.org/fhir/R4/{resource_type}.profile.json"
-                    response = requests.get(api_url)
-                
-                if response.status_code != 200:
-                    print(f"Kunne ikke laste baseressurs: {resource_type} (HTTP {response.status_code})")
-                    return None
-                    
-                base = response.json()
-                
-                with open(local_path, 'w', encoding='utf-8') as f:
-                    json.dump(base, f, ensure_ascii=False, indent=2)
-                    
-            except Exception as e:
-                print(f"Feil ved lasting av baseressurs {resource_type}: {str(e)}")
-                return None
-
-        self.base_resources_cache[base_url] = base
-        return base
-    
     def find_path_elements(self, profile: dict, path: str, include_slices: bool = True) -> List[dict]:
         """Find all elements that match a given path in the profile"""
-        elements = []
-        
-        # Check differential first
-        if 'differential' in profile:
-            for elem in profile['differential'].get('element', []):
-                elem_path = elem.get('path', '')
-                # If we don't want slices, skip elements with slice names
-                if not include_slices and ':' in elem_path:
-                    continue
-                if elem_path == path:
-                    elements.append(elem)
-        
-        # Check snapshot if none found in differential
-        if not elements and 'snapshot' in profile:
-            for elem in profile['snapshot'].get('element', []):
-                elem_path = elem.get('path', '')
-                # If we don't want slices, skip elements with slice names
-                if not include_slices and ':' in elem_path:
-                    continue
-                if elem_path == path:
-                    elements.append(elem)
-        
-        return elements
+        # Check differential first, then snapshot if none found in differential
+        for section in ('differential', 'snapshot'):
+            if section not in profile:
+                continue
+            elements = ElementIndex.for_section(profile, section).get_all(path)
+            # If we don't want slices, skip elements with slice names
+            if not include_slices and ':' in path:
+                elements = []
+            if elements:
+                return list(elements)
+        return []
 
     def find_slices(self, profile: dict, path: str) -> List[Tuple[str, dict]]:
         slices = []
         processed_paths = set()
 
-        # Sjekk først i differential
-        differential_elements = profile.get('differential', {}).get('element', [])
-        for element in differential_elements:
-            element_path = element.get('path', '')
-            
-            if not element_path.startswith(path):
-                continue
-                
-            # Sjekk for direkte slice-definisjon (med kolon)
-            if ':' in element_path and element_path not in processed_paths:
-                slice_name = element_path.split(':')[-1]
-                slices.append((element_path, element))
-                processed_paths.add(element_path)
-                continue
-                
+        # Sjekk først i differential. Path i en ElementDefinition inneholder aldri
+        # slicenavn, så bare elementer med eksakt samme path kan være slices.
+        for element in ElementIndex.for_section(profile, 'differential').get_all(path):
             # Sjekk for sliceName attributt
             slice_name = element.get('sliceName')
-            if slice_name and element_path == path:
+            if slice_name:
                 slice_path = f"{path}:{slice_name}"
                 if slice_path not in processed_paths:
                     slices.append((slice_path, element))
@@ -136,55 +69,35 @@ class FHIRProfileAnalyzer:
                 continue
                 
             # Sjekk for pattern
-            if element_path == path:
-                pattern_system = element.get('patternUri')
-                if pattern_system:
-                    # For identifier med pattern, bruk system-mønsteret for å finne slice-navnet
-                    if '2.16.578.1.12.4.1.4.101' in pattern_system:
-                        slice_path = f"{path}:ENH"
-                    elif '2.16.578.1.12.4.1.4.102' in pattern_system:
-                        slice_path = f"{path}:RESH"
-                    else:
-                        continue
-                        
-                    if slice_path not in processed_paths:
-                        slices.append((slice_path, element))
-                        processed_paths.add(slice_path)
-
-        # Hvis ingen slices funnet i differential, sjekk snapshot
-        if not slices and 'snapshot' in profile:
-            snapshot_elements = profile.get('snapshot', {}).get('element', [])
-            for element in snapshot_elements:
-                element_path = element.get('path', '')
-                if element_path.startswith(path + ':') and element_path not in processed_paths:
-                    slices.append((element_path, element))
-                    processed_paths.add(element_path)
+            pattern_system = element.get('patternUri')
+            if pattern_system:
+                # For identifier med pattern, bruk system-mønsteret for å finne slice-navnet
+                if '2.16.578.1.12.4.1.4.101' in pattern_system:
+                    slice_path = f"{path}:ENH"
+                elif '2.16.578.1.12.4.1.4.102' in pattern_system:
+                    slice_path = f"{path}:RESH"
+                else:
+                    continue
+                    
+                if slice_path not in processed_paths:
+                    slices.append((slice_path, element))
+                    processed_paths.add(slice_path)
 
         return sorted(slices, key=lambda x: x[0])
 
     def is_in_differential(self, path: str, profile: dict) -> bool:
         """Sjekker om et element er oppført i differential i profilen."""
-        differential_elements = profile.get('differential', {}).get('element', [])
-        for elem in differential_elements:
-            if elem.get('path') == path:
-                return True
-        return False
+        return path in ElementIndex.for_section(profile, 'differential')
 
     def has_modified_sub_element(self, path: str, profile: dict) -> bool:
         """Sjekker om noen under-elementer av path er oppført i differential."""
-        differential_elements = profile.get('differential', {}).get('element', [])
-        
-        # Sjekk om noen elementer starter med 'path.' (under-elementer)
-        for elem in differential_elements:
-            elem_path = elem.get('path', '')
-            if elem_path.startswith(path + '.'):
-                return True
-        return False
+        return ElementIndex.for_section(profile, 'differential').has_descendants(path)
 
 
 
-    def should_show_element(self, path: str, element_type: str, resource_type: str, 
-                            profile_elements: dict, base_elements: dict) -> bool:
+    def should_show_element(self, path: str, resource_type: str, profile_elems: List[dict],
+                            base_texts: Dict[str, str], slices: List[Tuple[str, dict]],
+                            differential: ElementIndex) -> bool:
         """
         Bestemmer om et element (gitt full path, f.eks. "Medication.code.coding")
         skal vises i tabellen.
@@ -196,14 +109,11 @@ class FHIRProfileAnalyzer:
             skal den generelle raden skjules – UNLESS base‑teksten (fra baseressursen) faktisk er definert.
           * Dersom ingen direkte endringer er gjort, men noen under‑elementer (med path som starter med "path.") er modifisert, vis forelderen.
         """
-        profile = profile_elements.get('profile', {})
-
         # 1. Toppelementer: resourceType + ett punkt vises alltid.
         if path.startswith(resource_type + ".") and path.count('.') == 1:
             return True
 
         # 2. Se etter differentialoppføringer (uten slices)
-        profile_elems = self.find_path_elements(profile, path, include_slices=False)
         if profile_elems:
             # Hvis en av oppføringene har en overstyrt tekst, vis elementet.
             for elem in profile_elems:
@@ -212,52 +122,18 @@ class FHIRProfileAnalyzer:
                         return True
             # Hvis det finnes differentialoppføringer uten overstyrt tekst,
             # sjekk om basen faktisk har definert tekst for noen egenskaper.
-            for prop in self.properties:
-                if self.get_base_text(base_elements, path, prop).strip():
-                    return True
+            if any(text.strip() for text in base_texts.values()):
+                return True
             # Dersom differentialoppføringer finnes og det også finnes slices,
             # undertrykk den generelle raden.
-            if self.find_slices(profile, path):
+            if slices:
                 return False
 
         # 3. Dersom ingen direkte differentialoppføringer finnes, men noen under-elementer er modifisert, vis forelderen.
-        if self.has_modified_sub_element(path, profile):
-            return True
-
-        return False
-
-
+        return differential.has_descendants(path)
 
     def is_root_element(self, path: str, resource_type: str) -> bool:
         return path == resource_type
-    
-
-    def escape_markdown(self, text: str) -> str:
-        if not text:
-            return ''
-            
-        escaped = text
-        escaped = escaped.replace('\\', '\\\\')
-        escaped = escaped.replace('|', '\\|')
-        special_chars = ['*', '_', '`', '[', ']', '(', ')', '#', '+', '-', '.', '!']
-        for char in special_chars:
-            escaped = escaped.replace(char, '\\' + char)
-        escaped = escaped.replace('\n', '<br>')
-        escaped = escaped.replace('\r', '')
-        
-        return escaped
-
-    def format_value(self, value: str, base_value: str, is_slice: bool = False) -> str:
-        if not value:
-            return ''
-            
-        escaped_value = self.escape_markdown(value)
-        
-        # For slices eller når verdien er forskjellig fra base
-        if is_slice or value != base_value:
-            return f"**{escaped_value}**"
-            
-        return escaped_value
 
     def clean_element_name(self, element_name: str, resource_type: str) -> str:
         if element_name.startswith(f"{resource_type}."):
@@ -278,106 +154,48 @@ class FHIRProfileAnalyzer:
             return type_code
         return ''
 
-    def format_binding(self, binding: dict) -> str:
-        if not binding:
-            return ''
-            
-        # Hent binding name fra extension
-        binding_name = ''
-        if 'extension' in binding:
-            for ext in binding['extension']:
-                if ext.get('url') == 'http://hl7.org/fhir/StructureDefinition/elementdefinition-bindingName':
-                    binding_name = ext.get('valueString', '')
-                    break
-        
-        # Capitalize strength
-        strength = binding.get('strength', '')
-        if strength:
-            strength = strength[0].upper() + strength[1:]
-        
-        # Escape alle verdier individuelt før de kombineres
-        strength = self.escape_markdown(strength)
-        binding_name = self.escape_markdown(binding_name)
-        value_set = self.escape_markdown(binding.get('valueSet', ''))
-        description = self.escape_markdown(binding.get('description', ''))
-        
-        # Konstruer binding tekst
-        binding_text = f"{strength} binding: "
-        
-        # Legg til binding name og valueSet
-        if binding_name and value_set:
-            binding_text += f"[{binding_name}]({value_set})"
-        elif value_set:
-            binding_text += f"[{value_set}]({value_set})"
-            
-        # Legg til description
-        if description:
-            binding_text += f": <br> {description}"
-
-        return binding_text
-
-
-    def analyze_profile(self, file_path: str):
+    def build_report(self, file_path: str) -> Optional[TextReport]:
+        """
+        Bygger radmodellen for profilen i én gjennomgang av alle paths. Hver
+        path slås opp én gang i indeksene for differential, snapshot og base.
+        """
         profile = self.load_json_file(file_path)
         if not profile:
-            return
+            return None
 
-        profile_name = self.escape_markdown(profile.get('name', ''))
         base_url = profile.get('baseDefinition', '')
         if not base_url:
-            print(f"Ingen baseDefinition funnet i profilen: {file_path}")
-            return
+            print(f"Ingen baseDefinition funnet i profilen: {file_path}", file=self.message_file)
+            return None
 
         base_type = base_url.split('/')[-1]
-        base_resource = self.get_base_resource(base_url)
-        if not base_resource:
-            return
-
-        print(f"# {profile_name} : {base_type}\n")
-        print("## Profilinformasjon\n")
-        print("| Egenskap | Verdi |")
-        print("|-----------|-------|")
-        for prop in self.profile_properties:
-            value = profile.get(prop, '')
-            formatted_value = self.escape_markdown(value)
-            print(f"| {prop.capitalize()} | {formatted_value} |")
-        print("\n## Elementinformasjon\n")
-
-        # Bygg en dictionary over base-elementer med path som nøkkel
-        base_elements = self.get_base_elements(base_resource)
-        print("| Elementnavn | Egenskap | Tekst |")
-        print("|------------------|-----------|-----------------------------------------------|")
+        base = self.get_base_texts(base_url)
+        if base is None:
+            return None
+
+        report = TextReport(file_path, profile.get('name', ''), base_type)
+        report.profile_properties = [(prop, profile.get(prop, '')) for prop in self.profile_properties]
+
+        differential = ElementIndex.for_section(profile, 'differential')
+        snapshot = ElementIndex.for_section(profile, 'snapshot')
+        has_differential = 'differential' in profile
+        has_snapshot = 'snapshot' in profile
 
-        processed_paths = set()
         # Samle alle paths fra både basen og profilen
-        all_paths = sorted(
-            set(base_elements.keys()) |
-            {elem.get('path', '') for elem in profile.get('snapshot', {}).get('element', [])} |
-            {elem.get('path', '') for elem in profile.get('differential', {}).get('element', [])}
-        )
+        all_paths = sorted(set(base.paths()) | set(snapshot.by_path) | set(differential.by_path))
 
         for path in all_paths:
-            if path in processed_paths or not path:
+            if not path:
                 continue
 
-            # Hent base-elementer (bruker den første for visning)
-            base_elem_list = base_elements.get(path, [])
-            base_elem = base_elem_list[0] if base_elem_list else {}
-
-            # Hent et tilsvarende profile-element (uten slice-navn)
-            profile_elem_base = None
-            if 'differential' in profile:
-                profile_elem_base = next(
-                    (elem for elem in profile['differential'].get('element', [])
-                    if elem.get('path') == path and ':' not in elem.get('path', '')),
-                    None
-                )
-            if not profile_elem_base and 'snapshot' in profile:
-                profile_elem_base = next(
-                    (elem for elem in profile['snapshot'].get('element', [])
-                    if elem.get('path') == path and ':' not in elem.get('path', '')),
-                    None
-                )
+            # Basens tekster for path (binding fra det første base-elementet)
+            base_elem = base.element(path) or EMPTY_TEXT
+            base_texts = {prop: base_elem.get(prop) for prop in self.properties}
+
+            # Profilens elementer for path: differential, ellers snapshot
+            profile_elems = (differential.get_all(path) if has_differential else []) or \
+                            (snapshot.get_all(path) if has_snapshot else [])
+            profile_elem_base = profile_elems[0] if profile_elems else None
 
             # Hvis profilen definerer slicing for dette elementet,
             # sjekk om noen av overstyringsegenskapene er satt.
@@ -386,79 +204,125 @@ class FHIRProfileAnalyzer:
                 if not any(profile_elem_base.get(prop, '').strip() for prop in self.properties):
                     profile_elem_base = None
 
-            # Bestem om elementet skal vises
-            element_type = self.get_element_type(profile_elem_base if profile_elem_base else base_elem)
-            if not self.should_show_element(path, element_type, base_type, {'profile': profile}, base_elements):
+            slices = self.find_slices(profile, path)
+            if not self.should_show_element(path, base_type, profile_elems, base_texts, slices, differential):
                 continue
 
             element_name = self.clean_element_name(path, base_type)
-            # Vis hovedinformasjon: for hver egenskap, bruk profilen dersom definert, ellers basetekst
-            first_row = True
+            # For hver egenskap: bruk profilen dersom definert, ellers basetekst
             for prop in self.properties:
-                base_value = self.get_base_text(base_elements, path, prop)
+                base_value = base_texts[prop]
                 profile_value = profile_elem_base.get(prop, '') if profile_elem_base else ''
-                # Bruk overstyrt tekst fra profilen dersom den finnes, ellers basetekst
                 value = profile_value if profile_value.strip() else base_value
-                formatted_value = self.format_value(value, base_value)
-                if first_row:
-                    print(f"| {element_name} | Short | {formatted_value} |")
-                    first_row = False
-                else:
-                    print(f"| | {prop.capitalize()} | {formatted_value} |")
+                report.rows.append(TextRow(element_name, path, prop, value, base_value))
 
-            # Vis binding dersom den finnes
-            base_binding = base_elem.get('binding', {})
+            # Binding dersom den finnes
             profile_binding = profile_elem_base.get('binding', {}) if profile_elem_base else {}
-            binding = profile_binding if profile_binding else base_binding
+            binding = profile_binding or base_elem.binding
             if binding:
-                formatted_binding = self.format_binding(binding)
-                if formatted_binding:
-                    print(f"| | Binding | {formatted_binding} |")
+                report.rows.append(TextRow(element_name, path, 'binding', binding.get('valueSet', ''),
+                                           base_elem.binding.get('valueSet', ''), binding=binding))
 
-            # Finn og vis slices
-            slices = self.find_slices(profile, path)
+            # Slices bruker teksten fra slice-elementet direkte
             for slice_path, slice_elem in slices:
                 slice_name = slice_path.split(':')[-1] if ':' in slice_path else ''
                 full_slice_name = f"{element_name}:{slice_name}"
-                first_row = True
                 for prop in self.properties:
-                    # For slices bruker vi teksten fra slice-elementet direkte
-                    value = slice_elem.get(prop, '')
-                    formatted_value = self.format_value(value, '', is_slice=True)
-                    if first_row:
-                        print(f"| {full_slice_name} | {prop.capitalize()} | {formatted_value} |")
-                        first_row = False
-                    else:
-                        print(f"| | {prop.capitalize()} | {formatted_value} |")
+                    report.rows.append(TextRow(full_slice_name, path, prop, slice_elem.get(prop, ''),
+                                               slice_name=slice_name))
                 slice_binding = slice_elem.get('binding')
                 if slice_binding:
-                    formatted_binding = self.format_binding(slice_binding)
-                    if formatted_binding:
-                        print(f"| | Binding | {formatted_binding} |")
-                processed_paths.add(slice_path)
-            processed_paths.add(path)
-
+                    report.rows.append(TextRow(full_slice_name, path, 'binding', slice_binding.get('valueSet', ''),
+                                               slice_name=slice_name, binding=slice_binding))
+        return report
+
+    def analyze_profile(self, file_path: str, out: Optional[TextIO] = None, fmt: str = 'markdown'):
+        report = self.build_report(file_path)
+        if report is not None:
+            EMITTERS[fmt](report, out or sys.stdout)
+
+
+_ANALYZER: Optional[FHIRProfileAnalyzer] = None
+
+def analyze_file(file_path: str, fmt: str = 'markdown') -> str:
+    """Analyserer én profil og returnerer teksten; brukes også i arbeiderprosesser."""
+    global _ANALYZER
+    if _ANALYZER is None:
+        _ANALYZER = FHIRProfileAnalyzer()
+    _ANALYZER.message_file = None if fmt == 'markdown' else sys.stderr
+    if fmt == 'csv':
+        # Overskriften skrives én gang av main
+        return capture_stdout(lambda: _write_rows(_ANALYZER.build_report(file_path)))
+    return capture_stdout(_ANALYZER.analyze_profile, file_path, None, fmt)
+
+def _write_rows(report: Optional[TextReport]) -> None:
+    if report is not None:
+        write_csv(report, sys.stdout, header=False)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Analyser tekster i FHIR-profiler mot basedefinisjonen.")
+    parser.add_argument("path", nargs='?', help="Sti til profil eller katalog")
+    parser.add_argument("--format", choices=sorted(EMITTERS), default='markdown',
+                        help="Utdataformat (standard: markdown)")
+    parser.add_argument("-o", "--output", help="Skriv til fil i stedet for stdout")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Gjenbruk resultat for profiler som ikke er endret siden forrige kjøring")
+    parser.add_argument("--manifest", help="Sti til manifestfil (standard: i cache-katalogen)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Antall prosesser i katalogmodus (standard: 1)")
+    return parser.parse_args()
+
+def analyze_directory(analyzer: FHIRProfileAnalyzer, path: str, args, out: TextIO) -> None:
+    file_paths = sorted(str(p) for p in Path(path).glob('*.json'))
+    prefetch_for_files(file_paths, analyzer.loader)
+    manifest = None
+    if args.incremental or args.manifest:
+        # Ett manifest per format, så lagret output alltid har riktig format
+        manifest_path = args.manifest or (None if args.format == 'markdown' else
+                                          default_manifest_path(f"analyser-tekster-{args.format}", path))
+        manifest = open_manifest(__file__, path, manifest_path)
+    results = run_batch(file_paths, partial(analyze_file, fmt=args.format), manifest, analyzer.loader, args.jobs)
+    if args.format == 'csv':
+        write_csv_header(out)
+    elif args.format == 'json':
+        out.write('[\n')
+    first = True
+    for file_path, output in results:
+        if args.format == 'markdown':
+            out.write(f"\nAnalyserer {file_path}:\n\n{output}")
+        elif args.format == 'json':
+            if output:
+                out.write(('' if first else ',\n') + output.rstrip('\n'))
+                first = False
+        else:
+            out.write(output)
+    if args.format == 'json':
+        out.write('\n]\n')
+    if manifest:
+        manifest.save()
 
+def main():
+    args = parse_arguments()
+    path = args.path or input("Angi sti til profil eller katalog (standard: 'profiles'): ").strip() or "profiles"
 
+    global _ANALYZER
+    analyzer = _ANALYZER = FHIRProfileAnalyzer()
+    if args.format != 'markdown':
+        analyzer.message_file = sys.stderr
 
-def main():
-    if len(sys.argv) > 1:
-        path = sys.argv[1]
-    else:
-        path = input("Angi sti til profil eller katalog (standard: 'profiles'): ").strip() or "profiles"
-
-    os.makedirs("base_resources", exist_ok=True)
-
-    analyzer = FHIRProfileAnalyzer()
-    
-    if os.path.isfile(path):
-        analyzer.analyze_profile(path)
-    elif os.path.isdir(path):
-        for file_path in Path(path).glob('*.json'):
-            print(f"\nAnalyserer {file_path}:\n")
-            analyzer.analyze_profile(str(file_path))
-    else:
+    if not os.path.exists(path):
         print(f"Feil: Kunne ikke finne fil eller katalog: {path}")
+        return
+    # Bufret filhåndtak; hver profil skrives med ett kall
+    out = open(args.output, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) if args.output else sys.stdout
+    try:
+        if os.path.isfile(path):
+            analyzer.analyze_profile(path, out, args.format)
+        else:
+            analyze_directory(analyzer, path, args, out)
+    finally:
+        if args.output:
+            out.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
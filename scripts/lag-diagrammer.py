@@ -1,58 +1,87 @@
 import os
 import sys
 import re
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from lmditools.fsh import CardRule, FlagRule, OnlyRule, TypeReference
+from lmditools.fshproject import FSHProject
+
+
+def _root_element(path: str) -> str:
+    """Første ledd av stien, f.eks. 'medication' for 'medication[x]'."""
+    match = re.match(r'\w+', path)
+    return match.group() if match else ''
+
+
+@dataclass
+class ElementRules:
+    """Reglene for én elementsti samlet fra hele profilen."""
+    cardinality: Optional[str] = None
+    types: List[TypeReference] = field(default_factory=list)
+    must_support: bool = False
+
+    def reference_target(self) -> Optional[str]:
+        """Målet hvis første Reference-type har nøyaktig ett mål."""
+        references = [t for t in self.types if t.name == 'Reference']
+        if not references or len(references[0].targets) != 1:
+            return None
+        return references[0].targets[0]
+
+
+def collect_element_rules(rules) -> Dict[str, ElementRules]:
+    """sti -> ElementRules i én gjennomgang, i rekkefølgen stiene først omtales."""
+    elements: Dict[str, ElementRules] = {}
+    for rule in rules:
+        if isinstance(rule, CardRule):
+            element = elements.setdefault(rule.path, ElementRules())
+            element.cardinality = rule.cardinality
+            element.must_support = element.must_support or 'MS' in rule.flags
+        elif isinstance(rule, FlagRule):
+            element = elements.setdefault(rule.path, ElementRules())
+            element.must_support = element.must_support or 'MS' in rule.flags
+        elif isinstance(rule, OnlyRule):
+            elements.setdefault(rule.path, ElementRules()).types = rule.types
+    return elements
+
 
 class FHIRProfileParser:
-    def __init__(self):
+    def __init__(self, project: Optional[FSHProject] = None):
         self.references: Dict[str, List[Tuple[str, str, str]]] = {}
-        
+        self.project = project
+
     def parse_file(self, file_path: str) -> None:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        # Skip if file contains Instance definitions
-        if content.strip().startswith('Instance:'):
-            return
-            
-        # Get profile name and parent
-        profile_match = re.search(r'^Profile:\s*(\w+)', content, re.MULTILINE)
-        if not profile_match:
+        if self.project is None:
+            self.project = FSHProject.load(file_path)
+        # Skip files without a profile (e.g. Instance definitions only)
+        profile = self.project.documents_under(file_path)[0].first('Profile')
+        if profile is None:
             return
-            
-        profile_name = profile_match.group(1)
+
+        profile_name = profile.name
         self.references[profile_name] = []
-        
+        elements = collect_element_rules(self.project.expanded_rules(profile))
+
         # Find zero cardinality elements
-        zero_elements = set()
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            if '0..0' in line:
-                elem_match = re.search(r'\*\s+(\w+)', line)
-                if elem_match:
-                    zero_elements.add(elem_match.group(1))
-        
-        # Parse references and cardinalities
-        for i, line in enumerate(lines):
-            if 'Reference(' in line and 'only' in line:
-                elem_match = re.search(r'\*\s+(\w+)', line)
-                ref_match = re.search(r'Reference\((\w+)\)', line)
-                
-                if elem_match and ref_match:
-                    element = elem_match.group(1)
-                    if element not in zero_elements:
-                        target = ref_match.group(1)
-                        
-                        # Look for cardinality in nearby lines
-                        cardinality = "0..1"  # default
-                        for j in range(max(0, i-2), min(len(lines), i+3)):
-                            card_match = re.search(rf'\*\s+{element}\s+(\d+\.\.[0-9*]+)', lines[j])
-                            if card_match:
-                                cardinality = card_match.group(1)
-                                break
-                                
-                        self.references[profile_name].append((target, element, cardinality))
+        zero_elements = {_root_element(path) for path, element in elements.items()
+                         if element.cardinality == '0..0'}
+
+        for path, element_rules in elements.items():
+            reference = element_rules.reference_target()
+            if reference is None:
+                continue
+            element = _root_element(path)
+            # Resolve Id, alias or URL to the profile name used as class name
+            target = self.project.reference_target(reference)
+            if not element or not target.isidentifier() or element in zero_elements:
+                continue
+
+            # Cardinality set on the path itself or on its root element, wherever in the file
+            cardinality = element_rules.cardinality
+            if cardinality is None and element in elements:
+                cardinality = elements[element].cardinality
+            self.references[profile_name].append((target, element, cardinality or "0..1"))
 
     def generate_plantuml(self) -> str:
         uml = ["@startuml", 
@@ -93,7 +122,7 @@ def main():
         if not path:
             path = default_path
     
-    parser = FHIRProfileParser()
+    parser = FHIRProfileParser(FSHProject.load(path) if os.path.exists(path) else None)
     
     if os.path.isfile(path):
         parser.parse_file(path)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Kompilerer FSH-profiler til differential StructureDefinitions uten SUSHI.
+
+Utdata skrives som StructureDefinition-<id>.json, samme navn som SUSHI
+bruker, slik at analyser-elementer, analyser-tekster og lag-plantuml-*
+kan kjøres direkte på katalogen. Se lmditools/fshcompiler.py for hvilken
+del av FSH som dekkes.
+
+Eksempel:
+    python lag-differensial.py ../LMDI/input/fsh -o forhandsvisning
+    python lag-differensial.py ../LMDI/input/fsh -o forhandsvisning --snapshot
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from lmditools.fshcompiler import compile_project
+from lmditools.fshproject import FSHProject
+from lmditools.loader import get_default_loader
+from lmditools.snapshot import SnapshotGenerator
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Kompiler FSH-profiler til StructureDefinitions uten SUSHI.")
+    parser.add_argument("path", help="FSH-fil eller katalog i prosjektet")
+    parser.add_argument("-o", "--output", default="forhandsvisning",
+                        help="Katalog for StructureDefinitions (standard: forhandsvisning)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Generer også snapshot fra basedefinisjonene")
+    return parser.parse_args()
+
+
+def add_snapshots(profiles: dict) -> None:
+    """Snapshot for alle profilene; lokale parents genereres først."""
+    by_url = {p['url']: p for p in profiles.values()}
+    generator = SnapshotGenerator()
+    done = set()
+
+    def generate(profile: dict) -> None:
+        if id(profile) in done:
+            return
+        done.add(id(profile))
+        base = by_url.get(profile.get('baseDefinition'))
+        if base is not None:
+            generate(base)
+        profile['snapshot'] = {'element': generator.generate(profile, base)}
+
+    for profile in profiles.values():
+        generate(profile)
+
+
+def main():
+    args = parse_arguments()
+    if not os.path.exists(args.path):
+        print(f"Feil: Fant ikke {args.path}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    project = FSHProject.load(args.path)
+    profiles = compile_project(project, get_default_loader())
+    if args.snapshot:
+        add_snapshots(profiles)
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(args.output, exist_ok=True)
+    for profile_id, profile in profiles.items():
+        out_path = os.path.join(args.output, f"StructureDefinition-{profile_id}.json")
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+
+    print(f"Kompilerte {len(profiles)} profiler på {elapsed:.3f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,101 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
 import sys
 import os
-from typing import Dict, List, Any, Optional
+import glob
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set
+
+from lmditools.elementindex import ElementIndex
+from lmditools.stream import StructureDefinitionHeader, read_header
+
+FORMATS = ["simple", "detailed", "tree", "references"]
+
+class SkipFile(Exception):
+    """Raised after an error has been printed for a file that cannot be shown."""
 
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
-        description="List all elements from a FHIR Structure Definition's snapshot."
-    )
-    parser.add_argument(
-        "path", 
-        help="Path to the FHIR Structure Definition JSON file"
+        description="List all elements from the snapshots of one or more FHIR Structure Definitions."
     )
     parser.add_argument(
-        "format", 
-        nargs="?",
-        choices=["simple", "detailed", "tree", "references"], 
-        default="simple",
-        help="Output format (simple, detailed, tree, or references)"
+        "path",
+        nargs="+",
+        help="FHIR Structure Definition JSON files, directories or glob patterns, "
+             "optionally followed by the output format (simple, detailed, tree, or references)"
     )
     parser.add_argument(
         "--filter", 
         help="Filter elements by path (e.g. 'Patient.name')"
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    # The format is an optional last positional argument, as when only one file was accepted
+    args.format = "simple"
+    if len(args.path) > 1 and args.path[-1] in FORMATS:
+        args.format = args.path.pop()
+    elif args.path[-1] in FORMATS:
+        parser.error("the following arguments are required: path")
+    return args
 
-def load_fhir_structure_definition(path: str) -> Dict:
-    """Load FHIR Structure Definition from JSON file."""
+def expand_inputs(inputs: List[str]) -> List[str]:
+    """Resolve files, directories (all *.json) and glob patterns to a list of files, in order."""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files.extend(sorted(glob.glob(os.path.join(item, "*.json"))))
+        elif glob.has_magic(item):
+            files.extend(sorted(glob.glob(item)))
+        else:
+            files.append(item)
+    return files
+
+def load_fhir_structure_definition(path: str) -> StructureDefinitionHeader:
+    """
+    Load the top-level fields of a FHIR Structure Definition.
+
+    The element lists are not loaded here; they are streamed from the file
+    when the output is produced, so memory does not grow with the snapshot.
+    """
     try:
         # Print file path for debugging
         print(f"Attempting to load file: {path}")
         print(f"File exists: {os.path.exists(path)}")
         
-        with open(path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
+        return read_header(path)
     except FileNotFoundError:
         print(f"Error: File not found: {path}")
-        sys.exit(1)
-    except json.JSONDecodeError:
+        raise SkipFile(path)
+    except ValueError:
         print(f"Error: Invalid JSON in file: {path}")
-        sys.exit(1)
+        raise SkipFile(path)
     except Exception as e:
         print(f"Error loading file: {str(e)}")
-        sys.exit(1)
+        raise SkipFile(path)
 
-def extract_snapshot_elements(structure_definition: Dict) -> List[Dict]:
-    """Extract all elements from the snapshot section of a FHIR Structure Definition."""
+def extract_snapshot_elements(structure_definition: StructureDefinitionHeader) -> Iterator[Dict]:
+    """Stream all elements from the snapshot section of a FHIR Structure Definition."""
     # Print structure keys for debugging
-    print(f"Structure definition keys: {list(structure_definition.keys())}")
+    print(f"Structure definition keys: {structure_definition.keys}")
     
-    if "snapshot" not in structure_definition:
+    if "snapshot" not in structure_definition.keys:
         print("Error: Structure Definition does not contain a snapshot section.")
-        sys.exit(1)
+        raise SkipFile()
     
-    if "element" not in structure_definition["snapshot"]:
+    if "snapshot" not in structure_definition.element_counts:
         print("Error: Snapshot section does not contain elements.")
-        sys.exit(1)
+        raise SkipFile()
     
-    return structure_definition["snapshot"]["element"]
+    return structure_definition.elements("snapshot")
 
-def filter_elements_by_path(elements: List[Dict], path_filter: str) -> List[Dict]:
+def filter_elements_by_path(elements: Iterable[Dict], path_filter: str) -> Iterable[Dict]:
     """Filter elements by path prefix."""
     if not path_filter:
         return elements
     
-    return [elem for elem in elements if elem.get("path", "").startswith(path_filter)]
+    return (elem for elem in elements if elem.get("path", "").startswith(path_filter))
 
-def format_simple_output(elements: List[Dict]) -> None:
+def format_simple_output(elements: Iterable[Dict]) -> None:
     """Print elements in a simple format."""
     for elem in elements:
         path = elem.get("path", "unknown")
@@ -82,7 +107,7 @@ def format_simple_output(elements: List[Dict]) -> None:
         cardinality = f"[{elem.get('min', '?')}..{elem.get('max', '?')}]"
         print(f"{path} {cardinality}{type_info}")
 
-def format_detailed_output(elements: List[Dict]) -> None:
+def format_detailed_output(elements: Iterable[Dict]) -> None:
     """Print elements in a detailed format."""
     for elem in elements:
         path = elem.get("path", "unknown")
@@ -156,32 +181,81 @@ def is_child_path(parent_path: str, potential_child_path: str) -> bool:
     
     return True
 
-def collect_child_elements(elements: List[Dict], parent_path: str) -> List[Dict]:
-    """Collect all child elements of a given parent path."""
-    child_elements = []
-    
-    for elem in elements:
-        path = elem.get("path", "")
-        if is_child_path(parent_path, path):
-            child_elements.append(elem)
-    
-    return child_elements
-
-def has_disabled_parent(path: str, elements: List[Dict]) -> bool:
-    """Check if any parent element in the path is disabled (max=0)."""
-    parts = path.split('.')
-    for i in range(1, len(parts)):
-        parent_path = '.'.join(parts[:i])
-        for elem in elements:
-            if elem.get('path') == parent_path and elem.get('max') == '0':
-                return True
-    return False
+def disabled_paths(index: ElementIndex) -> Set[str]:
+    """
+    All paths below an element with max=0, computed in one pass over the
+    prefix index. A path is disabled if its parent path has an element with
+    max=0 (any of them, e.g. a slice) or is itself disabled.
+    """
+    zero_paths = {path for path, elems in index.by_path.items()
+                  if any(elem.get('max') == '0' for elem in elems)}
+    disabled: Dict[str, bool] = {}
+
+    def is_disabled(path: str) -> bool:
+        # Missing intermediate paths are resolved the same way and remembered
+        pending = []
+        while path not in disabled:
+            parent = path.rpartition('.')[0]
+            if not parent:
+                disabled[path] = False
+                break
+            if parent in zero_paths:
+                disabled[path] = True
+                break
+            pending.append(path)
+            path = parent
+        result = disabled[path]
+        for child in pending:
+            disabled[child] = result
+        return result
+
+    return {path for path in index.by_path if is_disabled(path)}
+
+def reference_targets(reference_types: List[Dict]) -> List[str]:
+    """Resource names from the targetProfiles of the Reference types."""
+    targets = []
+    for ref_type in reference_types:
+        if "targetProfile" in ref_type:
+            target_profiles = ref_type["targetProfile"]
+            if isinstance(target_profiles, list):
+                targets.extend(extract_resource_name(profile) for profile in target_profiles)
+            else:
+                targets.append(extract_resource_name(target_profiles))
+    return targets
+
+def print_reference(path: str, elem: Dict, reference_types: List[Dict]) -> None:
+    cardinality = f"[{elem.get('min', '?')}..{elem.get('max', '?')}]"
+    print(f"Path: {path} {cardinality}")
+    targets = reference_targets(reference_types)
+    if targets:
+        print(f"  References to: {', '.join(targets)}")
+    else:
+        print("  References to: Any resource (no specific target profiles)")
+    print()  # Empty line between elements
 
 def format_references_output(elements: List[Dict]) -> None:
     """Print only elements that can be References and what they can reference."""
     reference_count = 0
     processed_paths = set()
-    
+    scanned_paths = set()
+    index = ElementIndex(elements)
+    disabled = disabled_paths(index)
+
+    def report(elem: Dict, path: str) -> None:
+        nonlocal reference_count
+        reference_types = [t for t in elem["type"] if t.get("code") == "Reference"]
+        if reference_types:
+            reference_count += 1
+            print_reference(path, elem, reference_types)
+            processed_paths.add(path)
+
+    def under_scanned(path: str) -> bool:
+        while '.' in path:
+            path = path.rpartition('.')[0]
+            if path in scanned_paths:
+                return True
+        return False
+
     # Sort elements by path to ensure parent paths are processed before children
     sorted_elements = sorted(elements, key=lambda e: e.get("path", ""))
     
@@ -196,91 +270,25 @@ def format_references_output(elements: List[Dict]) -> None:
             continue
         
         # Check if this element has max=0 or any parent is disabled
-        if elem.get("max") == "0" or has_disabled_parent(path, elements):
+        if elem.get("max") == "0" or path in disabled:
             continue
-            
-        # Check if any of the types is a Reference
-        reference_types = [t for t in elem["type"] if t.get("code") == "Reference"]
-        
-        # If this element is a reference, process it
-        if reference_types:
-            reference_count += 1
-            cardinality = f"[{elem.get('min', '?')}..{elem.get('max', '?')}]"
-            
-            print(f"Path: {path} {cardinality}")
-            
-            # Extract all possible reference targets
-            all_targets = []
-            for ref_type in reference_types:
-                if "targetProfile" in ref_type:
-                    target_profiles = ref_type["targetProfile"]
-                    if isinstance(target_profiles, list):
-                        # Multiple target profiles
-                        for profile in target_profiles:
-                            # Extract the resource name from the URL
-                            resource_name = extract_resource_name(profile)
-                            all_targets.append(resource_name)
-                    else:
-                        # Single target profile
-                        resource_name = extract_resource_name(target_profiles)
-                        all_targets.append(resource_name)
-            
-            if all_targets:
-                print(f"  References to: {', '.join(all_targets)}")
-            else:
-                print("  References to: Any resource (no specific target profiles)")
-                
-            print()  # Empty line between elements
-            processed_paths.add(path)
-        
-        # Now check for references in child elements
-        child_elements = collect_child_elements(elements, path)
-        for child_elem in child_elements:
+
+        report(elem, path)
+
+        # Now check for references in child elements. A subtree is scanned
+        # once: below an already scanned path every reference is reported.
+        if under_scanned(path):
+            continue
+        scanned_paths.add(path)
+        for child_elem in index.descendants(path):
             if "type" not in child_elem or not child_elem["type"]:
                 continue
-                
             child_path = child_elem.get("path", "unknown")
-            
-            # Skip if already processed
             if child_path in processed_paths:
                 continue
-                
-            # Skip if child has max=0 or any parent is disabled
-            if child_elem.get("max") == "0" or has_disabled_parent(child_path, elements):
+            if child_elem.get("max") == "0" or child_path in disabled:
                 continue
-                
-            # Check if any of the child types is a Reference
-            child_reference_types = [t for t in child_elem["type"] if t.get("code") == "Reference"]
-            
-            if child_reference_types:
-                reference_count += 1
-                child_cardinality = f"[{child_elem.get('min', '?')}..{child_elem.get('max', '?')}]"
-                
-                print(f"Path: {child_path} {child_cardinality}")
-                
-                # Extract all possible reference targets
-                child_targets = []
-                for ref_type in child_reference_types:
-                    if "targetProfile" in ref_type:
-                        target_profiles = ref_type["targetProfile"]
-                        if isinstance(target_profiles, list):
-                            # Multiple target profiles
-                            for profile in target_profiles:
-                                # Extract the resource name from the URL
-                                resource_name = extract_resource_name(profile)
-                                child_targets.append(resource_name)
-                        else:
-                            # Single target profile
-                            resource_name = extract_resource_name(target_profiles)
-                            child_targets.append(resource_name)
-                
-                if child_targets:
-                    print(f"  References to: {', '.join(child_targets)}")
-                else:
-                    print("  References to: Any resource (no specific target profiles)")
-                    
-                print()  # Empty line between elements
-                processed_paths.add(child_path)
+            report(child_elem, child_path)
     
     if reference_count == 0:
         print("No reference elements found in this structure definition.")
@@ -304,7 +312,7 @@ def extract_resource_name(profile_url: str) -> str:
     fragment_parts = last_part.split('#')
     return fragment_parts[0]
 
-def build_element_tree(elements: List[Dict]) -> Dict[str, Any]:
+def build_element_tree(elements: Iterable[Dict]) -> Dict[str, Any]:
     """Build a hierarchical tree of elements."""
     root = {}
     
@@ -365,19 +373,10 @@ def print_element_tree(tree: Dict[str, Any], indent: int = 0, is_last: bool = Tr
             child_indent = indent + 1
             print_element_tree(node["children"], child_indent, is_last_item)
 
-def main():
-    # Print command line arguments for debugging
-    print(f"Command line arguments: {sys.argv}")
-    
-    args = parse_arguments()
-    
-    # Print parsed arguments
-    print(f"Path: {args.path}")
-    print(f"Format: {args.format}")
-    print(f"Filter: {args.filter}")
-    
+def show_file(path: str, args) -> None:
+    """Print one Structure Definition in the chosen format."""
     # Load the Structure Definition
-    structure_definition = load_fhir_structure_definition(args.path)
+    structure_definition = load_fhir_structure_definition(path)
     
     # Get resource type and version info
     resource_type = structure_definition.get("type", "Unknown")
@@ -387,11 +386,14 @@ def main():
     
     # Extract and filter elements
     elements = extract_snapshot_elements(structure_definition)
+    total = structure_definition.element_counts["snapshot"]
     if args.filter:
         elements = filter_elements_by_path(elements, args.filter)
+        # Counting takes its own streaming pass, so the elements are never all held at once
+        total = sum(1 for _ in filter_elements_by_path(structure_definition.elements("snapshot"), args.filter))
         print(f"Filtered by: {args.filter}")
     
-    print(f"Total elements: {len(elements)}")
+    print(f"Total elements: {total}")
     print()
     
     # Format and display elements
@@ -403,7 +405,30 @@ def main():
         root_tree = build_element_tree(elements)
         print_element_tree(root_tree)
     elif args.format == "references":
-        format_references_output(elements)
+        format_references_output(list(elements))
+
+def main():
+    # Print command line arguments for debugging
+    print(f"Command line arguments: {sys.argv}")
+    
+    args = parse_arguments()
+    
+    # Print parsed arguments
+    print(f"Path: {' '.join(args.path)}")
+    print(f"Format: {args.format}")
+    print(f"Filter: {args.filter}")
+
+    # All files are shown by this one process; each file's elements are
+    # released before the next file is read
+    failed = 0
+    for path in expand_inputs(args.path):
+        try:
+            show_file(path, args)
+        except SkipFile:
+            failed += 1
+        sys.stdout.flush()
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Lager alle diagramvariantene fra én parsing av StructureDefinitions.
+
+lag-plantuml-diagrammer, lag-plantuml-komplette-diagrammer og
+lag-plantuml-enkel-diagrammer parser hver for seg de samme filene. Her
+bygges grafmodellen (lmditools/profilegraph.py) én gang, og hver variant
+skrives fra den:
+
+    profiler.puml            oversikt (som lag-plantuml-diagrammer)
+    profiler-komplett.puml   med attributter (som lag-plantuml-komplette-diagrammer)
+    profiler.mmd             oversikt som Mermaid
+    profiler.dot             oversikt som Graphviz DOT
+    enkel/<fil>.puml         én per profil (som lag-plantuml-enkel-diagrammer)
+
+Eksempel:
+    python lag-profildiagrammer.py ../LMDI/fsh-generated/resources -o diagrammer
+    python lag-profildiagrammer.py ../LMDI/fsh-generated/resources --format mermaid --format dot
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from lmditools.profilegraph import (ProfileGraph, RENDERERS, build_profile_node, find_structure_definitions,
+                                    render_plantuml_simple)
+from lmditools.stream import load_structure_definition
+
+OUTPUT_FILES = {
+    'plantuml': 'profiler.puml',
+    'plantuml-komplett': 'profiler-komplett.puml',
+    'mermaid': 'profiler.mmd',
+    'dot': 'profiler.dot',
+}
+SIMPLE_FORMAT = 'plantuml-enkel'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Lag PlantUML-, Mermaid- og DOT-diagrammer fra StructureDefinitions.")
+    parser.add_argument("path", help="StructureDefinition-fil eller katalog")
+    parser.add_argument("-o", "--output", default="diagrammer", help="Katalog for diagrammene (standard: diagrammer)")
+    parser.add_argument("--format", action="append", choices=[*OUTPUT_FILES, SIMPLE_FORMAT],
+                        help="Variant som skal lages; kan gis flere ganger (standard: alle)")
+    return parser.parse_args()
+
+
+def write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content + "\n")
+
+
+def main():
+    args = parse_arguments()
+    formats = args.format or [*OUTPUT_FILES, SIMPLE_FORMAT]
+    structure_files = sorted(find_structure_definitions(args.path))
+    if not structure_files:
+        print(f"Feil: Fant ingen StructureDefinition-filer i {args.path}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    graph = ProfileGraph()
+    nodes = {}
+    for file_path in structure_files:
+        try:
+            nodes[file_path] = graph.add_file(file_path)
+        except Exception as e:
+            print(f"Feil ved lesing av {file_path}: {e}")
+    parsed = time.perf_counter()
+
+    output = Path(args.output)
+    written = 0
+    for name in formats:
+        if name == SIMPLE_FORMAT:
+            for file_path, node in nodes.items():
+                # Enkel-diagrammet tegnes også for logiske modeller, som ikke er med i grafen
+                node = node or build_profile_node(load_structure_definition(file_path, sections=('snapshot',)),
+                                                  file_path)
+                write(output / 'enkel' / f"{Path(file_path).stem}.puml", render_plantuml_simple(node))
+                written += 1
+        else:
+            write(output / OUTPUT_FILES[name], RENDERERS[name](graph))
+            written += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"Leste {len(graph.nodes)} profiler på {parsed - start:.3f} s og skrev {written} diagrammer "
+          f"på {elapsed:.3f} s totalt -> {os.path.abspath(output)}")
+
+
+if __name__ == "__main__":
+    main()
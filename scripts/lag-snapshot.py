@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Lager snapshot for profiler som bare har differential, uten SUSHI/IG Publisher.
+
+Eksempel:
+    python lag-snapshot.py ../LMDI/fsh-generated/resources -o snapshots
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from lmditools.snapshot import SnapshotGenerator
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Generer snapshot fra differential for FHIR-profiler.")
+    parser.add_argument("path", help="StructureDefinition-fil eller katalog")
+    parser.add_argument("-o", "--output", default="snapshots",
+                        help="Katalog for profiler med snapshot (standard: snapshots)")
+    return parser.parse_args()
+
+
+def find_profiles(path: str) -> List[Path]:
+    if os.path.isfile(path):
+        return [Path(path)]
+    return sorted(Path(path).glob("StructureDefinition-*.json"))
+
+
+def main():
+    args = parse_arguments()
+    files = find_profiles(args.path)
+    if not files:
+        print(f"Feil: Fant ingen StructureDefinition-filer i {args.path}")
+        sys.exit(1)
+
+    profiles: Dict[str, dict] = {}
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            profiles[str(file_path)] = json.load(f)
+    by_url = {p.get('url'): p for p in profiles.values() if p.get('url')}
+
+    generator = SnapshotGenerator()
+    done = set()
+
+    def generate(profile: dict) -> None:
+        if id(profile) in done or profile.get('snapshot'):
+            return
+        done.add(id(profile))
+        base = by_url.get(profile.get('baseDefinition'))
+        if base is not None:
+            # Lokal profil som base: den må ha snapshot først
+            generate(base)
+        profile['snapshot'] = {'element': generator.generate(profile, base)}
+
+    start = time.perf_counter()
+    for profile in profiles.values():
+        if profile.get('differential'):
+            generate(profile)
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(args.output, exist_ok=True)
+    for file_path, profile in profiles.items():
+        out_path = os.path.join(args.output, os.path.basename(file_path))
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+
+    print(f"Genererte snapshot for {len(done)} profiler på {elapsed:.3f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
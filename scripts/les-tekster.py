@@ -1,62 +1,52 @@
 import os
 import sys
-import re
-import json
 from pathlib import Path
-import requests
+from typing import Optional
+
+from lmditools.basetexts import EMPTY_TEXT, ResourceTexts, base_texts
+from lmditools.fsh import CardRule, CaretValueRule, FSHDocument, OnlyRule, PathPrefixSet
+from lmditools.fshproject import FSHProject
+from lmditools.loader import get_default_loader
+from lmditools.stream import load_structure_definition
 
 class FSHProfileAnalyzer:
-    def __init__(self):
+    def __init__(self, project: Optional[FSHProject] = None):
         # Disse tre egenskapene er de vi ønsker å hente ut fra FSH
         self.properties = ['short', 'definition', 'comment']
-        self.base_resources_cache = {}
+        self.loader = get_default_loader()
+        self.project = project
+
+    def load_document(self, file_path: str) -> FSHDocument:
+        """Dokumentet fra prosjektindeksen (hele FSH-treet parses én gang)."""
+        if self.project is None:
+            self.project = FSHProject.load(file_path)
+        return self.project.documents_under(file_path)[0]
 
     def load_fsh_file(self, file_path: str) -> dict:
         """
-        Leser en FSH-fil linje for linje og ekstraherer:
+        Parser en FSH-fil og ekstraherer fra den første profilen:
         - Profilnavn (Profile:)
         - BaseDefinition (Parent:) -> baseDefinition-URL
         - Elementer med cardinalities som ikke er 0..0
-        - short/definition/comment hvis tilgjengelig (linjer med ^short, ^definition, ^comment)
+        - short/definition/comment hvis tilgjengelig (regler med ^short, ^definition, ^comment)
         """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Hvis filen kun beskriver Instanser (Instance:), hoppe over
-        if content.strip().startswith('Instance:'):
+        profile = self.load_document(file_path).first('Profile')
+        if profile is None:
+            # Ikke en profil (f.eks. bare Instance:), retur tom
+            return {}
+        if not profile.parent:
+            # Ingen parent, returer tom
             return {}
 
-        lines = content.split('\n')
         profile_data = {
-            'name': '',
-            'baseDefinition': '',
+            'name': profile.name,
+            'baseDefinition': self.project.parent_url(profile),
             'elements': {}
         }
 
-        # Finn profilnavn (Profile: XXXX)
-        profile_match = re.search(r'^Profile:\s*([^\r\n]+)', content, re.MULTILINE)
-        if profile_match:
-            profile_data['name'] = profile_match.group(1).strip()
-        else:
-            # Ikke en profil, retur tom
-            return {}
-
-        # Finn parent (Parent: XXXX)
-        parent_match = re.search(r'^Parent:\s*([^\r\n]+)', content, re.MULTILINE)
-        if parent_match:
-            parent_name = parent_match.group(1).strip()
-            base_url = f"http://hl7.org/fhir/StructureDefinition/{parent_name}"
-            profile_data['baseDefinition'] = base_url
-        else:
-            # Ingen parent, returer tom
-            return {}
-
-        # Først må vi finne alle elementer med 0..0 for å ekskludere dem
-        zero_zero_elements = set()
-        for line in lines:
-            zero_match = re.match(r'^\*\s+(\S+)\s+(0\..0)', line.strip())
-            if zero_match:
-                zero_zero_elements.add(zero_match.group(1))
+        # Først må vi finne alle elementer med 0..0; de og alt under dem ekskluderes
+        zero_zero_elements = PathPrefixSet(
+            rule.path for rule in profile.rules_of(CardRule) if rule.max == '0')
 
         # Hjelpestruktur for å lagre midlertidig cardinality per element
         # format: elements[elementName] = {
@@ -68,65 +58,30 @@ class FSHProfileAnalyzer:
         # }
         elements = {}
 
-        # Regex for cardinality-linjer (eksempel: "* subject 1..1")
-        card_pattern = re.compile(r'^\*\s+(\S+)\s+(\d+\..(\d+|\*))')
-
-        # Regex for only-linjer (eksempel: "* subject only Reference(Patient)")
-        only_pattern = re.compile(r'^\*\s+(\S+)\s+only\s+(.+)')
+        def element(name: str) -> dict:
+            if name not in elements:
+                elements[name] = {'card': '', 'short': '', 'definition': '', 'comment': '', 'type': ''}
+            return elements[name]
 
-        # Regex for short/definition/comment-linjer (eksempel: "* subject ^short = \"Tekst\"")
-        prop_pattern = re.compile(r'^\*\s+(\S+)\s+\^(short|definition|comment)\s*=\s*\"(.*)\"')
-
-        for line in lines:
-            line_stripped = line.strip()
-
-            if not line_stripped.startswith('*'):
+        for rule in self.project.expanded_rules(profile):
+            if not rule.path:
                 continue
 
-            # Hopp over 0..0-elementer
-            skip_elem = None
-            for zero_elem in zero_zero_elements:
-                if zero_elem in line_stripped:
-                    skip_elem = zero_elem
-                    break
-            if skip_elem:
+            # Hopp over 0..0-elementer og elementer under dem
+            if zero_zero_elements.covers(rule.path):
                 continue
 
-            # Sjekk cardinality
-            cm = card_pattern.match(line_stripped)
-            if cm:
-                elem_name = cm.group(1)
-                card = cm.group(2)
-                if elem_name not in elements:
-                    elements[elem_name] = {'card': card, 'short': '', 'definition': '', 'comment': '', 'type': ''}
-                else:
-                    elements[elem_name]['card'] = card
-
-            # Sjekk only-linje (eksempel: "* subject only Reference(Patient)")
-            om = only_pattern.match(line_stripped)
-            if om:
-                elem_name = om.group(1)
-                type_str = om.group(2).strip()
-                if elem_name not in elements:
-                    elements[elem_name] = {'card': '', 'short': '', 'definition': '', 'comment': '', 'type': type_str}
-                else:
-                    elements[elem_name]['type'] = type_str
-
-            # Sjekk short/definition/comment-linje
-            pm = prop_pattern.match(line_stripped)
-            if pm:
-                elem_name = pm.group(1)
-                prop_name = pm.group(2)
-                prop_value = pm.group(3)
-                if elem_name not in elements:
-                    elements[elem_name] = {'card': '', 'short': '', 'definition': '', 'comment': '', 'type': ''}
-                elements[elem_name][prop_name] = prop_value
+            if isinstance(rule, CardRule) and rule.min is not None:
+                element(rule.path)['card'] = rule.cardinality
+            elif isinstance(rule, OnlyRule):
+                # Eksempel: "* subject only Reference(Patient)"
+                element(rule.path)['type'] = rule.text.split(' only ', 1)[1].strip()
+            elif isinstance(rule, CaretValueRule) and rule.caret_path in self.properties:
+                element(rule.path)[rule.caret_path] = rule.value
 
         # Filtrer ut 0..0 og manglende cardinality
         filtered_elements = {}
         for ename, edata in elements.items():
-            if ename in zero_zero_elements:
-                continue
             if not edata['card']:
                 edata['card'] = '0..1'
             if edata['card'] == '0..0':
@@ -136,42 +91,18 @@ class FSHProfileAnalyzer:
         profile_data['elements'] = filtered_elements
         return profile_data
 
-    def get_base_resource(self, base_url: str) -> dict:
-        """Henter base-definisjonen fra HL7 FHIR eller lokal cache."""
+    def get_base_texts(self, base_url: str):
+        """Basens tekster: lokal parent fra fsh-generated, ellers pakkeindeksen eller loaderen."""
         if not base_url:
-            return {}
-        if base_url in self.base_resources_cache:
-            return self.base_resources_cache[base_url]
-
-        resource_type = base_url.split('/')[-1]
-        local_path = f"base_resources/{resource_type}.json"
-
-        if os.path.exists(local_path):
-            with open(local_path, 'r', encoding='utf-8') as f:
-                base = json.load(f)
-        else:
-            try:
-                api_url = f"http://hl7.org/fhir/R4/StructureDefinition-{resource_type}.json"
-                response = requests.get(api_url)
-                if response.status_code == 404:
-                    api_url = f"http://hl7.org/fhir/R4/{resource_type}.profile.json"
-                    response = requests.get(api_url)
-
-                if response.status_code != 200:
-                    print(f"Kunne ikke laste baseressurs: {resource_type} (HTTP {response.status_code})")
-                    return {}
-
-                base = response.json()
-                os.makedirs("base_resources", exist_ok=True)
-                with open(local_path, 'w', encoding='utf-8') as f:
-                    json.dump(base, f, ensure_ascii=False, indent=2)
-
-            except Exception as e:
-                print(f"Feil ved lasting av baseressurs {resource_type}: {str(e)}")
-                return {}
-
-        self.base_resources_cache[base_url] = base
-        return base
+            return None
+        # Lokal parent (en annen profil i IG-en): bruk SUSHI-generert JSON
+        generated = self.project.generated_path(base_url) if self.project else None
+        if generated is not None:
+            return ResourceTexts.from_resource(load_structure_definition(str(generated), sections=('snapshot',)))
+        texts = base_texts(base_url, self.loader)
+        if texts is None:
+            print(f"Kunne ikke laste baseressurs: {base_url.split('/')[-1]}")
+        return texts
 
     def escape_markdown(self, text: str) -> str:
         if not text:
@@ -190,15 +121,8 @@ class FSHProfileAnalyzer:
         base_url = profile.get('baseDefinition', '')
         base_type = base_url.split('/')[-1] if base_url else ''
 
-        base_resource = self.get_base_resource(base_url)
-        base_elements = {}
-        if base_resource:
-            snapshot = base_resource.get('snapshot', {})
-            base_elems = snapshot.get('element', [])
-            base_elements = {
-                elem.get('path', '').split('.')[-1]: elem
-                for elem in base_elems
-            }
+        # Baseelementene slås opp på siste path-ledd
+        base = self.get_base_texts(base_url)
 
         # Start med en HTML-header
         print(f"<html>")
@@ -210,22 +134,15 @@ class FSHProfileAnalyzer:
         print("  <tbody>")
 
         for element_name, profile_elem in profile.get('elements', {}).items():
-            base_elem = base_elements.get(element_name, {})
+            base_elem = (base.by_name(element_name) if base is not None else None) or EMPTY_TEXT
 
-            # Hvis vi ikke har type, sjekk base-elementets type
-            element_type = profile_elem['type']
-            if not element_type and base_elem.get('type'):
-                if isinstance(base_elem['type'], list) and len(base_elem['type']) > 0:
-                    element_type = base_elem['type'][0].get('code', '')
-                elif isinstance(base_elem['type'], dict):
-                    element_type = base_elem['type'].get('code', '')
-                else:
-                    element_type = ''
+            # Hvis vi ikke har type, bruk base-elementets type
+            element_type = profile_elem['type'] or base_elem.type
 
             first_row = True
             for prop in self.properties:
                 profile_value = profile_elem.get(prop, '')
-                base_value = base_elem.get(prop, '')
+                base_value = base_elem.get(prop)
                 value = profile_value if profile_value else base_value
 
                 if profile_value and profile_value != base_value:
@@ -252,12 +169,12 @@ def main():
     else:
         path = input("Angi sti til FSH-profil eller katalog (standard: 'profiles'): ").strip() or "profiles"
 
-    analyzer = FSHProfileAnalyzer()
-
     if os.path.isfile(path):
+        analyzer = FSHProfileAnalyzer(FSHProject.load(path))
         analyzer.analyze_profile(path)
     elif os.path.isdir(path):
-        for file_path in Path(path).glob('*.fsh'):
+        analyzer = FSHProfileAnalyzer(FSHProject.load(path))
+        for file_path in sorted(Path(path).glob('*.fsh')):
             print(f"\nAnalyserer {file_path}:\n")
             analyzer.analyze_profile(str(file_path))
     else:
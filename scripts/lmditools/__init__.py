@@ -0,0 +1 @@
+"""Felles hjelpemoduler for analyse- og diagramskriptene i scripts/."""
@@ -0,0 +1,346 @@
+"""
+Forhåndsbygd indeks over tekstene i basedefinisjonene.
+
+analyser-tekster og les-tekster sammenligner profilenes short, definition,
+comment og binding med basen. I stedet for å laste og indeksere basens
+StructureDefinition for hver profil bygges én indeksfil per pakkeversjon
+(f.eks. hl7.fhir.r4.core#4.0.1 og hl7.fhir.no.basis#2.2.0) med tekstene for
+alle elementene i alle StructureDefinitions i pakken:
+
+    <cache>/basetexts/<pakke-ID>.v1.idx
+
+Filen bygges første gang pakken brukes og åpnes deretter med mmap. Oppslag
+er en hashtabell direkte i filen, så en tekst slås opp i O(1) uten å parse
+JSON. Bare bindingen (et lite objekt) lagres som JSON og dekodes når den
+faktisk brukes.
+
+Filformat (little endian):
+
+    header   MAGIC, antall plasser i hashtabellen, antall poster
+    tabell   (nøkkelhash u64, postoffset u64) per plass, lineær probing
+    poster   nøkkellengde u32, nøkkel, antall felt u16, (lengde u32, UTF-8)*
+
+Nøklene er b'P' + url + NUL + path (første ikke-tomme tekst per egenskap
+blant elementene med path, som analyser-tekster bruker), b'N' + url + NUL +
+siste path-ledd (siste element med det navnet, som les-tekster bruker) og
+b'U' + url (alle paths i dokumentrekkefølge).
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from lmditools.elementindex import ElementIndex
+from lmditools.loader import StructureDefinitionLoader, default_cache_dir, get_default_loader
+from lmditools.packages import PackageResolver
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MAGIC = b'LMDIBTX' + bytes([FORMAT_VERSION])
+TEXT_PROPERTIES = ('short', 'definition', 'comment')
+
+_HEADER = struct.Struct('<8sQQ')
+_SLOT = struct.Struct('<QQ')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+
+_PATH, _NAME, _URL = b'P', b'N', b'U'
+
+
+def _key_hash(key: bytes) -> int:
+    # Offset 0 markerer en tom plass, så hashen trenger ingen egen markør
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def _key(kind: bytes, url: str, name: str = '') -> bytes:
+    key = kind + url.encode('utf-8')
+    return key + b'\0' + name.encode('utf-8') if kind != _URL else key
+
+
+def _type_code(element: dict) -> str:
+    types = element.get('type')
+    if isinstance(types, list) and types:
+        return types[0].get('code', '')
+    if isinstance(types, dict):
+        return types.get('code', '')
+    return ''
+
+
+class BaseText:
+    """Tekstene for ett baseelement. binding er JSON fra indeksen eller en ferdig dict."""
+    __slots__ = ('short', 'definition', 'comment', 'type', '_binding')
+
+    def __init__(self, short: str = '', definition: str = '', comment: str = '', type: str = '',
+                 binding=None):
+        self.short = short
+        self.definition = definition
+        self.comment = comment
+        self.type = type
+        self._binding = binding
+
+    def get(self, prop: str) -> str:
+        return getattr(self, prop) if prop in TEXT_PROPERTIES else ''
+
+    @property
+    def binding(self) -> dict:
+        if isinstance(self._binding, str):
+            self._binding = json.loads(self._binding) if self._binding else {}
+        return self._binding or {}
+
+    def fields(self) -> List[str]:
+        binding = self._binding
+        if not isinstance(binding, str):
+            binding = json.dumps(binding, ensure_ascii=False, separators=(',', ':')) if binding else ''
+        return [self.short, self.definition, self.comment, self.type, binding]
+
+
+EMPTY_TEXT = BaseText()
+
+
+class ResourceTexts:
+    """Tekstene i én basedefinisjon, bygget fra en lastet StructureDefinition."""
+
+    def __init__(self, elements: Iterable[dict]):
+        index = ElementIndex(elements)
+        self._by_path = index.by_path
+        self._by_name: Dict[str, dict] = {}
+        for element in index.elements:
+            self._by_name[element.get('path', '').split('.')[-1]] = element
+
+    @classmethod
+    def from_resource(cls, resource: dict) -> 'ResourceTexts':
+        return cls(resource.get('snapshot', {}).get('element', []))
+
+    def paths(self) -> List[str]:
+        return list(self._by_path)
+
+    def names(self) -> List[str]:
+        return list(self._by_name)
+
+    def element(self, path: str) -> Optional[BaseText]:
+        """Første ikke-tomme tekst per egenskap; type og binding fra første element."""
+        elements = self._by_path.get(path)
+        if not elements:
+            return None
+        texts = [next((e.get(prop) for e in elements if e.get(prop)), '') for prop in TEXT_PROPERTIES]
+        return BaseText(*texts, _type_code(elements[0]), elements[0].get('binding'))
+
+    def by_name(self, name: str) -> Optional[BaseText]:
+        """Siste element med name som siste path-ledd."""
+        element = self._by_name.get(name)
+        if element is None:
+            return None
+        return BaseText(*(element.get(prop, '') for prop in TEXT_PROPERTIES), _type_code(element),
+                        element.get('binding'))
+
+
+class IndexedResourceTexts:
+    """Samme grensesnitt som ResourceTexts, men med oppslag i en mmap-indeks."""
+
+    def __init__(self, index: 'BaseTextIndex', url: str, paths: List[str]):
+        self.index = index
+        self.url = url
+        self._paths = paths
+        self._elements: Dict[str, Optional[BaseText]] = {}
+
+    def paths(self) -> List[str]:
+        return self._paths
+
+    def element(self, path: str) -> Optional[BaseText]:
+        if path not in self._elements:
+            fields = self.index.lookup(_key(_PATH, self.url, path))
+            self._elements[path] = BaseText(*fields) if fields else None
+        return self._elements[path]
+
+    def by_name(self, name: str) -> Optional[BaseText]:
+        fields = self.index.lookup(_key(_NAME, self.url, name))
+        return BaseText(*fields) if fields else None
+
+
+class BaseTextIndex:
+    """Én indeksfil, åpnet med mmap."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._slots, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} er ikke en basetekstindeks (versjon {FORMAT_VERSION})")
+
+    def lookup(self, key: bytes) -> Optional[List[str]]:
+        """Feltene for nøkkelen, eller None."""
+        data = self._map
+        mask = self._slots - 1
+        wanted = _key_hash(key)
+        slot = wanted & mask
+        while True:
+            stored, offset = _SLOT.unpack_from(data, _HEADER.size + slot * _SLOT.size)
+            if offset == 0:
+                return None
+            if stored == wanted:
+                (key_length,) = _U32.unpack_from(data, offset)
+                offset += _U32.size
+                if data[offset:offset + key_length] == key:
+                    return self._fields(offset + key_length)
+            slot = (slot + 1) & mask
+
+    def _fields(self, offset: int) -> List[str]:
+        data = self._map
+        (count,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        fields = []
+        for _ in range(count):
+            (length,) = _U32.unpack_from(data, offset)
+            offset += _U32.size
+            fields.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        return fields
+
+    def resource(self, url: str) -> Optional[IndexedResourceTexts]:
+        fields = self.lookup(_key(_URL, url))
+        if fields is None:
+            return None
+        return IndexedResourceTexts(self, url, fields[0].split('\n') if fields[0] else [])
+
+    def close(self) -> None:
+        self._map.close()
+
+
+# ---------------------------------------------------------------- bygging
+
+def _resource_records(url: str, resource: dict) -> Dict[bytes, List[str]]:
+    texts = ResourceTexts.from_resource(resource)
+    paths = texts.paths()
+    records = {_key(_URL, url): ['\n'.join(paths)]}
+    for path in paths:
+        records[_key(_PATH, url, path)] = texts.element(path).fields()
+    for name in texts.names():
+        records[_key(_NAME, url, name)] = texts.by_name(name).fields()
+    return records
+
+
+def write_index(records: Dict[bytes, List[str]], path: Path) -> None:
+    """Skriver postene som en indeksfil (atomisk)."""
+    slots = 1
+    while slots < 2 * max(len(records), 1):
+        slots <<= 1
+    table = [(0, 0)] * slots
+    body = bytearray()
+    start = _HEADER.size + slots * _SLOT.size
+    for key, fields in records.items():
+        offset = start + len(body)
+        body += _U32.pack(len(key)) + key + _U16.pack(len(fields))
+        for field in fields:
+            encoded = field.encode('utf-8')
+            body += _U32.pack(len(encoded)) + encoded
+        key_hash = _key_hash(key)
+        slot = key_hash & (slots - 1)
+        while table[slot][1]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = (key_hash, offset)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.basetexts-', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, slots, len(records)))
+        f.write(b''.join(_SLOT.pack(*entry) for entry in table))
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def build_package_index(package, path: Path) -> int:
+    """Bygger indeksen for alle StructureDefinitions med snapshot i pakken."""
+    records: Dict[bytes, List[str]] = {}
+    resources = 0
+    for url, filename in sorted(package.urls.items()):
+        if not filename.startswith('StructureDefinition-'):
+            continue
+        try:
+            resource = json.loads(package.read(filename))
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Kunne ikke lese {filename} i {package.package_id}: {e}")
+            continue
+        if resource.get('resourceType') != 'StructureDefinition' or 'snapshot' not in resource:
+            continue
+        records.update(_resource_records(url, resource))
+        resources += 1
+    write_index(records, path)
+    logger.info(f"Bygde basetekstindeks for {package.package_id}: {resources} StructureDefinitions")
+    return resources
+
+
+# ---------------------------------------------------------------- oppslag
+
+class BaseTextIndexes:
+    """
+    Indeksene for de lokale pakkene. Bare pakken som definerer en oppslått
+    URL åpnes, og indeksen bygges første gang den trengs.
+    """
+
+    def __init__(self, packages: Optional[PackageResolver] = None, cache_dir: Optional[Path] = None):
+        self.packages = packages if packages is not None else PackageResolver()
+        self.root = Path(cache_dir or default_cache_dir()) / 'basetexts'
+        self._indexes: Dict[str, Optional[BaseTextIndex]] = {}
+        self._resources: Dict[str, Optional[IndexedResourceTexts]] = {}
+
+    def index_path(self, package) -> Path:
+        name = package.package_id.replace('/', '_')
+        return self.root / f"{name}.v{FORMAT_VERSION}.idx"
+
+    def _open(self, package) -> Optional[BaseTextIndex]:
+        path = self.index_path(package)
+        try:
+            if not path.exists():
+                build_package_index(package, path)
+            return BaseTextIndex(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Basetekstindeks for {package.package_id} er ikke tilgjengelig: {e}")
+            return None
+
+    def index_for(self, package) -> Optional[BaseTextIndex]:
+        if package.package_id not in self._indexes:
+            self._indexes[package.package_id] = self._open(package)
+        return self._indexes[package.package_id]
+
+    def for_url(self, url: str) -> Optional[IndexedResourceTexts]:
+        """Tekstene for url fra pakken som definerer den, eller None."""
+        url = url.split('|')[0]
+        if url not in self._resources:
+            located = self.packages.locate(url)
+            index = self.index_for(located[0]) if located else None
+            self._resources[url] = index.resource(url) if index is not None else None
+        return self._resources[url]
+
+
+_default_indexes: Optional[BaseTextIndexes] = None
+
+
+def get_default_indexes() -> BaseTextIndexes:
+    """Delte indekser for prosessen, over de samme pakkene som loaderen bruker."""
+    global _default_indexes
+    if _default_indexes is None:
+        _default_indexes = BaseTextIndexes(get_default_loader().packages)
+    return _default_indexes
+
+
+def base_texts(url: str, loader: Optional[StructureDefinitionLoader] = None):
+    """
+    Tekstene i basedefinisjonen url: fra pakkeindeksen når url finnes i en
+    lokal pakke, ellers fra StructureDefinitionen via loaderen. None hvis
+    basen ikke kan lastes.
+    """
+    if not url:
+        return None
+    texts = get_default_indexes().for_url(url)
+    if texts is not None:
+        return texts
+    resource = (loader or get_default_loader()).get(url)
+    return ResourceTexts.from_resource(resource) if resource is not None else None
@@ -0,0 +1,111 @@
+"""
+Felles kjøring av analyse over mange profiler, med valgfritt manifest.
+
+Med jobs > 1 analyseres profilene i en prosesspool. Hver arbeider laster
+basedefinisjonene fra disk-cachen inn i minnet når den starter, og
+resultatene gis tilbake i samme rekkefølge som paths, slik at output er
+identisk med en seriell kjøring. analyse må da kunne pickles, dvs. være en
+funksjon på modulnivå.
+"""
+import contextlib
+import hashlib
+import io
+import json
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lmditools.loader import StructureDefinitionLoader, get_default_loader
+from lmditools.manifest import Manifest, default_manifest_path, file_hash
+from lmditools.prefetch import collect_urls
+
+
+def tool_hash(script_path: str) -> str:
+    """Hash av skriptet og alle lmditools-modulene; endres når koden endres."""
+    digest = hashlib.sha256()
+    files = [Path(script_path)] + sorted(Path(__file__).parent.glob('*.py'))
+    for path in files:
+        digest.update(file_hash(str(path)).encode('ascii'))
+    return digest.hexdigest()
+
+
+def open_manifest(script_path: str, directory: str, manifest_path: Optional[str] = None) -> Manifest:
+    tool = Path(script_path).stem
+    path = manifest_path or default_manifest_path(tool, directory)
+    return Manifest(path, tool_hash(script_path))
+
+
+def capture_stdout(func: Callable, *args) -> str:
+    """Kjører func og returnerer det den skrev til stdout."""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        func(*args)
+    return buffer.getvalue()
+
+
+def _base_url(path: str) -> str:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('baseDefinition', '') or ''
+    except (OSError, ValueError):
+        return ''
+
+
+def _warm_worker(urls: List[str]) -> None:
+    """Initialiserer en arbeiderprosess med basedefinisjonene i minnet."""
+    loader = get_default_loader()
+    for url in urls:
+        loader.get(url)
+
+
+def _analyse_all(paths: List[str], analyse: Callable[[str], str], jobs: int) -> Iterator[str]:
+    """Output for hver path i rekkefølge, serielt eller i en prosesspool."""
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield analyse(path)
+        return
+    urls = sorted(collect_urls(paths))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths)),
+                             initializer=_warm_worker, initargs=(urls,)) as pool:
+        futures: List[Future] = [pool.submit(analyse, path) for path in paths]
+        for future in futures:
+            yield future.result()
+
+
+def run_batch(paths: Iterable[str], analyse: Callable[[str], str],
+              manifest: Optional[Manifest] = None,
+              loader: Optional[StructureDefinitionLoader] = None,
+              jobs: int = 1) -> Iterator[Tuple[str, str]]:
+    """
+    Gir (path, output) for hver profil i rekkefølge. Med manifest gjenbrukes
+    output for profiler der verken filen eller basedefinisjonen er endret.
+    """
+    loader = loader or get_default_loader()
+    paths = list(paths)
+    cached: Dict[str, str] = {}
+    input_hashes: Dict[str, str] = {}
+    if manifest is not None:
+        for path in paths:
+            input_hashes[path] = file_hash(path)
+            base_url = manifest.base_url(path)
+            if base_url is None:
+                continue
+            output = manifest.lookup(path, input_hashes[path], loader.content_hash(base_url))
+            if output is not None:
+                cached[path] = output
+
+    pending = [path for path in paths if path not in cached]
+    results = _analyse_all(pending, analyse, jobs)
+    for path in paths:
+        if path in cached:
+            yield path, cached[path]
+            continue
+        output = next(results)
+        if manifest is not None:
+            base_url = _base_url(path)
+            if base_url:
+                # Sørger for at basen er i cachen også når en arbeider lastet den
+                loader.get(base_url)
+            manifest.record(path, input_hashes[path], base_url,
+                            loader.content_hash(base_url) if base_url else '', output)
+        yield path, output
@@ -0,0 +1,172 @@
+"""
+Indeks over elementene i en StructureDefinition (snapshot eller differential).
+
+Erstatter lineære søk over snapshot.element med oppslag som bygges én gang:
+
+- eksakt path -> elementer (i dokumentrekkefølge, inkludert slices)
+- id -> element
+- barn per path (prefiks-tre), også når mellomliggende elementer mangler
+- slices per path (sliceName -> element)
+- choice-typer: 'Observation.valueQuantity' -> 'Observation.value[x]'
+"""
+from typing import Dict, Iterable, Iterator, List, Optional
+
+_INDEX_CACHE: Dict[int, tuple] = {}
+_INDEX_CACHE_SIZE = 64
+
+
+def parent_path(path: str) -> str:
+    """'Patient.contact.name' -> 'Patient.contact' (tom streng for roten)."""
+    return path.rpartition('.')[0]
+
+
+def choice_base(path: str) -> str:
+    """'Observation.value[x]' -> 'Observation.value'."""
+    return path[:-3] if path.endswith('[x]') else path
+
+
+def choice_name(path: str, type_code: str) -> str:
+    """'Observation.value[x]' + 'Quantity' -> 'Observation.valueQuantity'."""
+    return choice_base(path) + type_code[:1].upper() + type_code[1:]
+
+
+class ElementIndex:
+    """Oppslagsstrukturer over en liste ElementDefinitions, bygget i én gjennomgang."""
+
+    def __init__(self, elements: Iterable[dict]):
+        self.elements: List[dict] = list(elements)
+        self.by_path: Dict[str, List[dict]] = {}
+        self.by_id: Dict[str, dict] = {}
+        self._positions: Dict[str, List[int]] = {}
+        self._children: Dict[str, Dict[str, None]] = {}
+        self._slices: Dict[str, Dict[str, dict]] = {}
+        self._choices: Dict[str, str] = {}
+        self._segments: Optional[Dict[str, List[int]]] = None
+
+        for position, element in enumerate(self.elements):
+            path = element.get('path', '')
+            if not path:
+                continue
+            self.by_path.setdefault(path, []).append(element)
+            self._positions.setdefault(path, []).append(position)
+            if element.get('id'):
+                self.by_id[element['id']] = element
+            if element.get('sliceName'):
+                self._slices.setdefault(path, {})[element['sliceName']] = element
+            if path.endswith('[x]'):
+                for type_def in element.get('type', []):
+                    if type_def.get('code'):
+                        self._choices[choice_name(path, type_def['code'])] = path
+            self._register(path)
+
+    def _register(self, path: str) -> None:
+        """Legger path og alle forfedre inn i prefiks-treet."""
+        while path:
+            parent = parent_path(path)
+            siblings = self._children.setdefault(parent, {})
+            if path in siblings:
+                return
+            siblings[path] = None
+            path = parent
+
+    @classmethod
+    def for_section(cls, resource: dict, section: str = 'snapshot') -> 'ElementIndex':
+        """Indeks for resource[section].element, bygget én gang per ressurs."""
+        key = id(resource)
+        cached = _INDEX_CACHE.get(key)
+        if cached is None or cached[0] is not resource:
+            if len(_INDEX_CACHE) >= _INDEX_CACHE_SIZE:
+                _INDEX_CACHE.pop(next(iter(_INDEX_CACHE)))
+            # Ressursen holdes i cachen så id() ikke kan gjenbrukes
+            cached = (resource, {})
+            _INDEX_CACHE[key] = cached
+        indexes = cached[1]
+        if section not in indexes:
+            indexes[section] = cls(resource.get(section, {}).get('element', []))
+        return indexes[section]
+
+    # ---------------------------------------------------------------- path
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.by_path
+
+    def get_all(self, path: str) -> List[dict]:
+        """Alle elementer med eksakt path (basiselement og slices)."""
+        return self.by_path.get(path, [])
+
+    def first(self, path: str) -> Optional[dict]:
+        """Første element med eksakt path, eller None."""
+        elements = self.by_path.get(path)
+        return elements[0] if elements else None
+
+    def resolve(self, path: str) -> Optional[str]:
+        """
+        Finner path slik den står i indeksen, med choice-typer ekspandert:
+        'Observation.valueQuantity.unit' -> 'Observation.value[x].unit'.
+        """
+        if path in self.by_path:
+            return path
+        parts = path.split('.')
+        resolved = parts[0]
+        for part in parts[1:]:
+            candidate = f"{resolved}.{part}"
+            if candidate not in self.by_path and candidate not in self._children:
+                candidate = self._choices.get(candidate, candidate)
+            resolved = candidate
+        return resolved if resolved in self.by_path else None
+
+    def find(self, path: str) -> Optional[dict]:
+        """Som first(), men løser også opp choice-typer."""
+        resolved = self.resolve(path)
+        return self.first(resolved) if resolved else None
+
+    # ---------------------------------------------------------------- tre
+
+    def children(self, path: str) -> List[str]:
+        """Direkte barne-paths under path, i dokumentrekkefølge."""
+        return list(self._children.get(path, ()))
+
+    def has_descendants(self, path: str) -> bool:
+        return bool(self._children.get(path))
+
+    def descendant_paths(self, path: str) -> Iterator[str]:
+        """Alle paths under path (dybde først)."""
+        stack = list(reversed(self.children(path)))
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(self.children(current)))
+
+    def descendants(self, path: str) -> List[dict]:
+        """Alle elementer under path, i dokumentrekkefølge."""
+        positions = []
+        for descendant in self.descendant_paths(path):
+            positions.extend(self._positions.get(descendant, ()))
+        return [self.elements[p] for p in sorted(positions)]
+
+    # ---------------------------------------------------------------- slices
+
+    def slices(self, path: str) -> Dict[str, dict]:
+        """sliceName -> element for slices definert på path."""
+        return self._slices.get(path, {})
+
+    def slice(self, path: str, slice_name: str) -> Optional[dict]:
+        return self._slices.get(path, {}).get(slice_name)
+
+    # ---------------------------------------------------------------- segmenter
+
+    def find_by_segments(self, segments: List[str]) -> Optional[dict]:
+        """Første element (i dokumentrekkefølge) der path inneholder alle segmentene."""
+        if not segments:
+            return None
+        if self._segments is None:
+            self._segments = {}
+            for position, element in enumerate(self.elements):
+                for segment in set(element.get('path', '').split('.')):
+                    self._segments.setdefault(segment, []).append(position)
+        wanted = set(segments)
+        for position in self._segments.get(segments[0], ()):
+            element = self.elements[position]
+            if wanted.issubset(element['path'].split('.')):
+                return element
+        return None
@@ -0,0 +1,541 @@
+"""
+Tokenizer og regelparser for FHIR Shorthand (FSH).
+
+Hver fil leses i én gjennomgang. Lexeren fjerner kommentarer, holder
+strenger (også flerlinjes \"\"\"-strenger) samlet og deler teksten i
+utsagn: et nøkkelord (Profile:, Parent:, ...) eller en regel som starter
+med '*'. Linjer som ikke starter et nytt utsagn er fortsettelser av
+forrige (f.eks. 'contains' over flere linjer).
+
+Utsagnene blir til entiteter (Profile, Extension, Instance, RuleSet, ...)
+med metadata og en typet regelliste:
+
+    CardRule, FlagRule, OnlyRule, BindingRule, CaretValueRule,
+    AssignmentRule, ContainsRule, ObeysRule, InsertRule, ConceptRule,
+    PathRule og RawRule (alt parseren ikke tolker)
+
+Innrykkede regler får stien til regelen over som prefiks, og myk
+indeksering ([+] og [=]) løses opp til tall per entitet.
+"""
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+ENTITY_KEYWORDS = ('Alias', 'Profile', 'Extension', 'Logical', 'Resource', 'Instance',
+                   'Invariant', 'ValueSet', 'CodeSystem', 'RuleSet', 'Mapping')
+METADATA_KEYWORDS = ('Parent', 'Id', 'Title', 'Description', 'InstanceOf', 'Usage',
+                     'Severity', 'Expression', 'XPath', 'Source', 'Target',
+                     'Characteristics', 'Context')
+FLAGS = frozenset(('MS', 'SU', '?!', 'TU', 'N', 'D'))
+
+# Økes når parseren gir andre entiteter/regler for samme tekst (se fshcache.py)
+PARSER_VERSION = 2
+
+_LEXEME = re.compile(r'"""|"(?:[^"\\]|\\.)*"|/\*|//|\n', re.DOTALL)
+_STATEMENT_START = re.compile(
+    r'[ \t]*(?:(\*)(?=\s|$)|(' + '|'.join(ENTITY_KEYWORDS + METADATA_KEYWORDS) + r')[ \t]*:)')
+_TOKEN = re.compile(r'"""(.*?)"""|"((?:[^"\\]|\\.)*)"|([^\s"(]*\([^)]*\)\S*)|(\S+)', re.DOTALL)
+_CARD = re.compile(r'^(\d*)\.\.(\d+|\*)?$')
+_SOFT_INDEX = re.compile(r'\[([+=])\]')
+_ESCAPE = re.compile(r'\\(.)')
+
+
+# ---------------------------------------------------------------- regler
+
+@dataclass
+class Rule:
+    path: str
+    line: int
+    text: str = ''
+    indent: int = 0
+
+
+@dataclass
+class CardRule(Rule):
+    min: Optional[int] = None
+    max: str = ''
+    flags: List[str] = field(default_factory=list)
+
+    @property
+    def cardinality(self) -> str:
+        return f"{'' if self.min is None else self.min}..{self.max}"
+
+
+@dataclass
+class FlagRule(Rule):
+    flags: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TypeReference:
+    """'Reference(A or B)' -> name='Reference', targets=['A', 'B']."""
+    name: str
+    targets: List[str] = field(default_factory=list)
+
+
+@dataclass
+class OnlyRule(Rule):
+    types: List[TypeReference] = field(default_factory=list)
+
+
+@dataclass
+class BindingRule(Rule):
+    value_set: str = ''
+    strength: str = ''
+
+
+@dataclass
+class CaretValueRule(Rule):
+    caret_path: str = ''
+    value: str = ''
+    is_string: bool = False
+
+
+@dataclass
+class AssignmentRule(Rule):
+    value: str = ''
+    exactly: bool = False
+    is_string: bool = False
+
+
+@dataclass
+class ContainsItem:
+    name: str
+    alias: Optional[str] = None
+    min: Optional[int] = None
+    max: str = ''
+    flags: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ContainsRule(Rule):
+    items: List[ContainsItem] = field(default_factory=list)
+
+
+@dataclass
+class ObeysRule(Rule):
+    invariants: List[str] = field(default_factory=list)
+
+
+@dataclass
+class InsertRule(Rule):
+    ruleset: str = ''
+    params: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ConceptRule(Rule):
+    codes: List[str] = field(default_factory=list)
+    display: str = ''
+    definition: str = ''
+
+
+@dataclass
+class PathRule(Rule):
+    pass
+
+
+@dataclass
+class RawRule(Rule):
+    pass
+
+
+# ---------------------------------------------------------------- entiteter
+
+@dataclass
+class FSHEntity:
+    kind: str
+    name: str
+    file: str = ''
+    line: int = 0
+    metadata: Dict[str, str] = field(default_factory=dict)
+    rules: List[Rule] = field(default_factory=list)
+    params: List[str] = field(default_factory=list)
+
+    @property
+    def parent(self) -> str:
+        return self.metadata.get('Parent', '')
+
+    @property
+    def id(self) -> str:
+        return self.metadata.get('Id', '')
+
+    @property
+    def title(self) -> str:
+        return self.metadata.get('Title', '')
+
+    @property
+    def description(self) -> str:
+        return self.metadata.get('Description', '')
+
+    def rules_of(self, rule_type: type) -> Iterator[Rule]:
+        return (rule for rule in self.rules if isinstance(rule, rule_type))
+
+
+@dataclass
+class FSHDocument:
+    path: str
+    entities: List[FSHEntity] = field(default_factory=list)
+    aliases: Dict[str, str] = field(default_factory=dict)
+
+    def of_kind(self, kind: str) -> List[FSHEntity]:
+        return [entity for entity in self.entities if entity.kind == kind]
+
+    def first(self, kind: str) -> Optional[FSHEntity]:
+        return next((entity for entity in self.entities if entity.kind == kind), None)
+
+
+# ---------------------------------------------------------------- lexer
+
+@dataclass
+class _Statement:
+    line: int
+    indent: int
+    keyword: Optional[str]
+    parts: List[str]
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts).strip()
+
+
+def _begin(text: str, at: int, line: int) -> Optional[Tuple[_Statement, int]]:
+    """Utsagnet som starter ved at (starten av en linje), og posisjonen etter '*'/'Nøkkelord:'."""
+    match = _STATEMENT_START.match(text, at)
+    if not match:
+        return None
+    if match.group(1):
+        indent = len(text[at:match.start(1)].expandtabs(2))
+        return _Statement(line, indent, None, []), match.end(1)
+    return _Statement(line, 0, match.group(2), []), match.end()
+
+
+def _statements(text: str) -> Iterator[_Statement]:
+    """Deler teksten i utsagn, uten kommentarer, i én gjennomgang."""
+    current: Optional[_Statement] = None
+    line = 1
+    pos = 0
+    started = _begin(text, 0, line)
+    if started:
+        current, pos = started
+    while True:
+        match = _LEXEME.search(text, pos)
+        if match is None:
+            break
+        token = match.group()
+        if current is not None:
+            current.parts.append(text[pos:match.start()])
+        pos = match.end()
+        if token == '\n':
+            line += 1
+            started = _begin(text, pos, line)
+            if started:
+                if current is not None:
+                    yield current
+                current, pos = started
+            elif current is not None:
+                current.parts.append(' ')
+        elif token == '"""':
+            end = text.find('"""', pos)
+            end = len(text) if end < 0 else end + 3
+            if current is not None:
+                current.parts.append(text[match.start():end])
+            line += text.count('\n', match.start(), end)
+            pos = end
+        elif token.startswith('"'):
+            if current is not None:
+                current.parts.append(token)
+            line += token.count('\n')
+        elif token == '/*':
+            end = text.find('*/', pos)
+            end = len(text) if end < 0 else end + 2
+            line += text.count('\n', match.start(), end)
+            pos = end
+        elif match.start() == 0 or text[match.start() - 1].isspace():
+            # '//' først i et token er en kommentar ut linjen
+            end = text.find('\n', pos)
+            pos = len(text) if end < 0 else end
+        elif current is not None:
+            # Del av en URL (http://...)
+            current.parts.append(token)
+    if current is not None:
+        current.parts.append(text[pos:])
+        yield current
+
+
+def _unescape(value: str) -> str:
+    return _ESCAPE.sub(r'\1', value)
+
+
+def _tokens(text: str) -> List[Tuple[str, bool]]:
+    """(verdi, er_streng) for hvert token; strenger uten anførselstegn."""
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        triple, string, grouped, plain = match.groups()
+        if triple is not None:
+            tokens.append((_dedent(triple), True))
+        elif string is not None:
+            tokens.append((_unescape(string), True))
+        else:
+            tokens.append((grouped or plain, False))
+    return tokens
+
+
+def _dedent(value: str) -> str:
+    """Flerlinjes streng: fjerner første/siste tomme linje og felles innrykk."""
+    lines = value.split('\n')
+    if lines and not lines[0].strip():
+        lines = lines[1:]
+    if lines and not lines[-1].strip():
+        lines = lines[:-1]
+    indents = [len(l) - len(l.lstrip()) for l in lines if l.strip()]
+    margin = min(indents) if indents else 0
+    return '\n'.join(l[margin:] for l in lines)
+
+
+def _metadata_value(text: str) -> str:
+    tokens = _tokens(text)
+    if len(tokens) == 1 and tokens[0][1]:
+        return tokens[0][0]
+    return text.strip()
+
+
+# ---------------------------------------------------------------- regelparser
+
+def _parse_card(value: str) -> Optional[Tuple[Optional[int], str]]:
+    match = _CARD.match(value)
+    if not match:
+        return None
+    return (int(match.group(1)) if match.group(1) else None), (match.group(2) or '')
+
+
+def _split_on(tokens: List[Tuple[str, bool]], word: str) -> List[List[Tuple[str, bool]]]:
+    groups: List[List[Tuple[str, bool]]] = [[]]
+    for token in tokens:
+        if token == (word, False):
+            groups.append([])
+        else:
+            groups[-1].append(token)
+    return [group for group in groups if group]
+
+
+def _type_reference(value: str) -> TypeReference:
+    name, _, rest = value.partition('(')
+    if not rest:
+        return TypeReference(value)
+    inner = rest.rsplit(')', 1)[0]
+    targets = [t.strip() for t in re.split(r'\s+or\s+|\|', inner) if t.strip()]
+    return TypeReference(name.strip(), targets)
+
+
+def _build_rule(path: str, rest: List[Tuple[str, bool]], line: int, text: str) -> Rule:
+    if not rest:
+        return PathRule(path, line, text)
+    head, head_is_string = rest[0]
+    if head_is_string:
+        return RawRule(path, line, text)
+
+    if head.startswith('^'):
+        value, is_string = '', False
+        if len(rest) > 2 and rest[1] == ('=', False):
+            value = rest[2][0] if len(rest) == 3 else ' '.join(v for v, _ in rest[2:])
+            is_string = len(rest) == 3 and rest[2][1]
+        return CaretValueRule(path, line, text, caret_path=head[1:], value=value, is_string=is_string)
+
+    card = _parse_card(head)
+    if card is not None:
+        return CardRule(path, line, text, min=card[0], max=card[1],
+                        flags=[v for v, _ in rest[1:] if v in FLAGS])
+
+    if head in FLAGS:
+        return FlagRule(path, line, text, flags=[v for v, _ in rest if v in FLAGS])
+
+    if head == 'only':
+        return OnlyRule(path, line, text,
+                        types=[_type_reference(' '.join(v for v, _ in group))
+                               for group in _split_on(rest[1:], 'or')])
+
+    if head == 'from' and len(rest) > 1:
+        strength = rest[2][0].strip('()') if len(rest) > 2 else ''
+        return BindingRule(path, line, text, value_set=rest[1][0], strength=strength)
+
+    if head == '=':
+        values = rest[1:]
+        exactly = bool(values) and values[-1] == ('(exactly)', False)
+        if exactly:
+            values = values[:-1]
+        value = values[0][0] if len(values) == 1 else ' '.join(v for v, _ in values)
+        return AssignmentRule(path, line, text, value=value, exactly=exactly,
+                              is_string=len(values) == 1 and values[0][1])
+
+    if head == 'contains':
+        items = []
+        for group in _split_on(rest[1:], 'and'):
+            values = [v for v, _ in group]
+            item = ContainsItem(values[0])
+            if len(values) > 2 and values[1] == 'named':
+                item.alias, item.name = values[0], values[2]
+                values = values[2:]
+            for value in values[1:]:
+                card = _parse_card(value)
+                if card is not None:
+                    item.min, item.max = card
+                elif value in FLAGS:
+                    item.flags.append(value)
+            items.append(item)
+        return ContainsRule(path, line, text, items=items)
+
+    if head == 'obeys':
+        return ObeysRule(path, line, text,
+                         invariants=[v for v, _ in rest[1:] if v != 'and'])
+
+    if head == 'insert' and len(rest) > 1:
+        name, _, params = rest[1][0].partition('(')
+        return InsertRule(path, line, text, ruleset=name,
+                          params=[p.strip() for p in params.rstrip(')').split(',')] if params else [])
+
+    return RawRule(path, line, text)
+
+
+def _parse_rule(text: str, line: int) -> Rule:
+    tokens = _tokens(text)
+    if not tokens:
+        return RawRule('', line, text)
+    head, head_is_string = tokens[0]
+    if head_is_string:
+        return RawRule('', line, text)
+    if '#' in head and not head.startswith(('^', '$')) or head.startswith('#'):
+        strings = [v for v, is_string in tokens if is_string]
+        return ConceptRule('', line, text, codes=[v for v, s in tokens if not s and v.startswith('#')],
+                           display=strings[0] if strings else '',
+                           definition=strings[1] if len(strings) > 1 else '')
+    if head.startswith('^') or head in ('insert', 'obeys', 'include', 'exclude', '->'):
+        return _build_rule('', tokens, line, text)
+    return _build_rule(head, tokens[1:], line, text)
+
+
+class _PathContext:
+    """Innrykk -> sti for regler med innrykk, og tellere for myk indeksering."""
+
+    def __init__(self):
+        self.stack: List[Tuple[int, str]] = []
+        self.indices: Dict[str, int] = {}
+
+    def full_path(self, indent: int, path: str) -> str:
+        while self.stack and self.stack[-1][0] >= indent:
+            self.stack.pop()
+        prefix = self.stack[-1][1] if self.stack else ''
+        if prefix and path:
+            return f"{prefix}.{path}"
+        return prefix or path
+
+    def push(self, indent: int, path: str) -> None:
+        if path:
+            self.stack.append((indent, path))
+
+    def resolve_soft_indices(self, path: str) -> str:
+        if '[' not in path or not _SOFT_INDEX.search(path):
+            return path
+        resolved = []
+        for segment in path.split('.'):
+            match = _SOFT_INDEX.search(segment)
+            if match:
+                key = '.'.join(resolved + [segment[:match.start()]])
+                if match.group(1) == '+':
+                    self.indices[key] = self.indices.get(key, -1) + 1
+                index = max(self.indices.get(key, 0), 0)
+                segment = f"{segment[:match.start()]}[{index}]{segment[match.end():]}"
+            resolved.append(segment)
+        return '.'.join(resolved)
+
+
+# ---------------------------------------------------------------- stier
+
+def path_prefixes(path: str) -> Iterator[str]:
+    """
+    Stien og alle forfedrene, kortest først:
+    'identifier[FNR].value' -> 'identifier', 'identifier[FNR]', 'identifier[FNR].value'.
+    """
+    depth = 0
+    for index, char in enumerate(path):
+        if char == '[':
+            if depth == 0 and index:
+                yield path[:index]
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == '.' and depth == 0:
+            yield path[:index]
+    if path:
+        yield path
+
+
+class PathPrefixSet:
+    """Mengde stier der en sti regnes som med hvis den selv eller en forfar er lagt til."""
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self.paths: Set[str] = set(paths)
+
+    def add(self, path: str) -> None:
+        self.paths.add(path)
+
+    def covers(self, path: str) -> bool:
+        if not self.paths:
+            return False
+        return any(prefix in self.paths for prefix in path_prefixes(path))
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.paths
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+# ---------------------------------------------------------------- API
+
+def parse_text(text: str, path: str = '<string>') -> FSHDocument:
+    document = FSHDocument(path)
+    entity: Optional[FSHEntity] = None
+    context = _PathContext()
+    for statement in _statements(text):
+        body = statement.text
+        if statement.keyword == 'Alias':
+            name, _, value = body.partition('=')
+            document.aliases[name.strip()] = value.strip()
+            continue
+        if statement.keyword in ENTITY_KEYWORDS:
+            name, _, params = body.partition('(')
+            entity = FSHEntity(statement.keyword, name.strip(), path, statement.line,
+                               params=[p.strip() for p in params.rstrip(')').split(',')] if params else [])
+            document.entities.append(entity)
+            context = _PathContext()
+            continue
+        if entity is None:
+            continue
+        if statement.keyword:
+            entity.metadata[statement.keyword] = _metadata_value(body)
+            continue
+        rule = _parse_rule(body, statement.line)
+        rule.indent = statement.indent
+        rule.path = context.resolve_soft_indices(context.full_path(statement.indent, rule.path))
+        context.push(statement.indent, rule.path)
+        entity.rules.append(rule)
+    return document
+
+
+def parse_file(path: str) -> FSHDocument:
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_text(f.read(), str(path))
+
+
+def find_fsh_files(directory: str, recursive: bool = True) -> List[Path]:
+    root = Path(directory)
+    if root.is_file():
+        return [root]
+    return sorted(root.rglob('*.fsh') if recursive else root.glob('*.fsh'))
+
+
+def parse_directory(directory: str, recursive: bool = True) -> List[FSHDocument]:
+    """Parser alle .fsh-filer under directory i sortert rekkefølge."""
+    return [parse_file(str(path)) for path in find_fsh_files(directory, recursive)]
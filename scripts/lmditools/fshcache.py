@@ -0,0 +1,97 @@
+"""
+Disk-cache for parsede FSH-filer.
+
+Hver fil parses bare første gang innholdet sees. Resultatet (FSHDocument med
+entiteter og regler) lagres ferdig parset under hash av filinnholdet og
+PARSER_VERSION:
+
+    <cache>/fsh/v<PARSER_VERSION>/ab/<sha256>.pickle
+
+Uendrede filer lastes derfor fra cache uten lexing og parsing, også på tvers
+av skript som kjøres etter hverandre. Samme innhold på en annen sti gjenbruker
+objektet; stiene settes på ved lasting. Med LMDI_FSH_CACHE=0 parses alt på nytt.
+"""
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from lmditools.fsh import PARSER_VERSION, FSHDocument, parse_text
+from lmditools.loader import content_hash, default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+def cache_enabled_from_env() -> bool:
+    return os.environ.get('LMDI_FSH_CACHE', '').lower() not in ('0', 'false', 'no')
+
+
+class FSHParseCache:
+    def __init__(self, cache_dir: Optional[str] = None, enabled: Optional[bool] = None):
+        base = Path(cache_dir).expanduser() if cache_dir else default_cache_dir()
+        self.root = base / 'fsh' / f"v{PARSER_VERSION}"
+        self.enabled = cache_enabled_from_env() if enabled is None else enabled
+        self.hits = 0
+        self.misses = 0
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.pickle"
+
+    def _load(self, digest: str) -> Optional[FSHDocument]:
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Ødelagt FSH-cache-objekt {digest}: {e}")
+            return None
+
+    def _store(self, digest: str, document: FSHDocument) -> None:
+        obj_path = self._object_path(digest)
+        try:
+            obj_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=obj_path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(document, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, obj_path)
+        except OSError as e:
+            logger.warning(f"Kunne ikke skrive FSH-cache for {document.path}: {e}")
+
+    def parse_file(self, path: str) -> FSHDocument:
+        """Som fsh.parse_file, men fra cache når innholdet er parset før."""
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if not self.enabled:
+            return parse_text(_decode(raw), str(path))
+        digest = content_hash(raw)
+        document = self._load(digest)
+        if document is None:
+            self.misses += 1
+            document = parse_text(_decode(raw), str(path))
+            self._store(digest, document)
+            return document
+        self.hits += 1
+        if document.path != str(path):
+            document.path = str(path)
+            for entity in document.entities:
+                entity.file = str(path)
+        return document
+
+
+def _decode(raw: bytes) -> str:
+    """Som open(..., 'r'): UTF-8 med universelle linjeskift."""
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+_default_cache: Optional[FSHParseCache] = None
+
+
+def get_default_cache() -> FSHParseCache:
+    """Delt parse-cache for prosessen, konfigurert fra miljøet."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FSHParseCache()
+    return _default_cache
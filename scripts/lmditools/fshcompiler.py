@@ -0,0 +1,438 @@
+"""
+Kompilering av FSH-profiler til differential StructureDefinitions.
+
+Dekker delen av FSH som LMDI bruker, slik at analyse- og diagramskriptene
+kan kjøres på FSH-kildene uten SUSHI/Node:
+
+- kardinalitet og flagg (MS, SU, ?!)
+- only (datatyper, Reference(...), lokale profiler)
+- from (binding med styrke)
+- caret-regler (^short, ^slicing.discriminator.type, ^status, ...)
+- contains (slices, og extensions med 'named')
+- faste verdier (= ... og = ... (exactly))
+- obeys (invarianter fra Invariant:-entiteter)
+- insert (RuleSets, via FSHProject.expanded_rules)
+
+Resultatet er ikke en fullstendig SUSHI-erstatning: Instances, ValueSets,
+CodeSystems og logiske modeller kompileres ikke, og typen til en fast verdi
+gjettes fra basedefinisjonen når den kan lastes, ellers fra verdien selv.
+"""
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from lmditools.fsh import (AssignmentRule, BindingRule, CardRule, CaretValueRule, ContainsRule,
+                           FSHEntity, FlagRule, ObeysRule, OnlyRule, path_prefixes)
+from lmditools.fshproject import FSHProject
+from lmditools.loader import FHIR_CORE_CANONICAL, StructureDefinitionLoader, resource_type_from_url
+
+logger = logging.getLogger(__name__)
+
+FHIR_VERSION = '4.0.1'
+COMPILED_KINDS = ('Profile', 'Extension')
+
+FLAG_FIELDS = {'MS': 'mustSupport', 'SU': 'isSummary', '?!': 'isModifier'}
+
+# Caret-felter som er lister i FHIR; uten indeks brukes første element
+LIST_FIELDS = {'discriminator', 'constraint', 'example', 'context', 'contact', 'jurisdiction',
+               'useContext', 'keyword', 'alias', 'code', 'mapping', 'condition', 'telecom',
+               'identifier', 'extension', 'contextInvariant', 'type', 'targetProfile', 'profile'}
+# Felter fra LIST_FIELDS som er skalarer under en bestemt forelder
+# (StructureDefinition.type, slicing.discriminator.type, context.type, type.code)
+SCALAR_FIELDS = {'StructureDefinition': {'type'}, 'discriminator': {'type'}, 'context': {'type'},
+                 'type': {'code'}}
+
+# Primitive typer har liten forbokstav i type.code, men stor i choice-navnet (effectiveDateTime)
+PRIMITIVE_TYPES = {'base64Binary', 'boolean', 'canonical', 'code', 'date', 'dateTime', 'decimal', 'id',
+                   'instant', 'integer', 'markdown', 'oid', 'positiveInt', 'string', 'time', 'unsignedInt',
+                   'uri', 'url', 'uuid'}
+
+_INDEX = re.compile(r'^(\w+)\[(\d+|\+|=)\]$')
+_CODE = re.compile(r'^(\S*)#(\S+)(?:\s+(.*))?$')
+_INTEGER = re.compile(r'^-?\d+$')
+_DECIMAL = re.compile(r'^-?\d+\.\d+$')
+
+
+def _segments(path: str) -> List[str]:
+    """'a.b[S1][S2].c' -> ['a', 'b[S1][S2]', 'c'] (punktum i klammer deler ikke)."""
+    segments, previous = [], ''
+    for prefix in path_prefixes(path):
+        if prefix.startswith(previous) and prefix[len(previous):len(previous) + 1] == '[':
+            segments[-1] = segments[-1] + prefix[len(previous):]
+        else:
+            segments.append(prefix[len(previous) + 1 if previous else 0:])
+        previous = prefix
+    return segments
+
+
+def _split_segment(segment: str) -> Tuple[str, List[str]]:
+    """'coding[SCT]' -> ('coding', ['SCT']); 'value[x]' -> ('value[x]', [])."""
+    name = segment
+    slices: List[str] = []
+    while name.endswith(']') and not name.endswith('[x]'):
+        start = name.rindex('[')
+        slices.insert(0, name[start + 1:-1])
+        name = name[:start]
+    return name, slices
+
+
+def _scalar(value: str, is_string: bool) -> Any:
+    if is_string:
+        return value
+    if value in ('true', 'false'):
+        return value == 'true'
+    if _INTEGER.match(value):
+        return int(value)
+    if _DECIMAL.match(value):
+        return float(value)
+    if value.startswith('#'):
+        return value[1:]
+    return value
+
+
+def _type_suffix(type_code: str) -> str:
+    return type_code[:1].upper() + type_code[1:]
+
+
+class DifferentialCompiler:
+    """Kompilerer Profile- og Extension-entiteter i et FSHProject."""
+
+    def __init__(self, project: FSHProject, loader: Optional[StructureDefinitionLoader] = None):
+        self.project = project
+        self.loader = loader
+        self._base_types: Dict[str, Dict[str, List[str]]] = {}
+
+    # ---------------------------------------------------------------- oppslag
+
+    def base_type(self, entity: FSHEntity) -> str:
+        """Ressurstypen profilen til slutt bygger på (følger lokale parents)."""
+        seen = set()
+        current = entity
+        while current is not None and current.name not in seen:
+            seen.add(current.name)
+            if current.kind == 'Extension' and not current.parent:
+                return 'Extension'
+            parent = self.project.resolve(current.parent) if current.parent else None
+            if parent is None or parent is current:
+                return resource_type_from_url(self.project.resolve_url(current.parent or 'Extension'))
+            current = parent
+        return resource_type_from_url(entity.parent or '')
+
+    def base_url(self, entity: FSHEntity) -> str:
+        if entity.kind == 'Extension' and not entity.parent:
+            return f"{FHIR_CORE_CANONICAL}Extension"
+        return self.project.parent_url(entity)
+
+    def url(self, entity: FSHEntity) -> str:
+        return self.project.canonical_url(entity) or f"{self.project.canonical}/StructureDefinition/{entity.id or entity.name}"
+
+    def _element_types(self, base_url: str) -> Dict[str, List[str]]:
+        """path -> typekoder i basens snapshot (tom hvis basen ikke kan lastes)."""
+        if base_url not in self._base_types:
+            types: Dict[str, List[str]] = {}
+            base = self.loader.get(base_url) if self.loader else None
+            for element in (base or {}).get('snapshot', {}).get('element', []):
+                types.setdefault(element.get('path', ''),
+                                 [t.get('code', '') for t in element.get('type', [])])
+            self._base_types[base_url] = types
+        return self._base_types[base_url]
+
+    def _resolve_value_url(self, key: str) -> str:
+        """ValueSet/CodeSystem/profil: lokal entitet, alias eller URL som den er."""
+        entity = self.project.resolve(key)
+        if entity is not None and self.project.canonical_url(entity):
+            return self.project.canonical_url(entity)
+        return self.project.aliases.get(key, key)
+
+    def _target_url(self, key: str) -> str:
+        """Reference(...)-mål: lokal profil, alias, URL eller FHIR-kjernetype."""
+        if self.project.resolve(key) is not None or key in self.project.aliases or '/' in key:
+            return self._resolve_value_url(key)
+        return f"{FHIR_CORE_CANONICAL}{key}"
+
+    # ---------------------------------------------------------------- kompilering
+
+    def compile(self, entity: FSHEntity) -> dict:
+        root = self.base_type(entity)
+        base_url = self.base_url(entity)
+        url = self.url(entity)
+        definition: Dict[str, Any] = {
+            'resourceType': 'StructureDefinition',
+            'id': entity.id or entity.name,
+            'url': url,
+            'name': entity.name,
+            'title': entity.title or None,
+            'status': 'draft',
+            'description': entity.description or None,
+            'fhirVersion': FHIR_VERSION,
+            'kind': 'complex-type' if root == 'Extension' else 'resource',
+            'abstract': False,
+            'type': root,
+            'baseDefinition': base_url,
+            'derivation': 'constraint',
+        }
+        state = _CompileState(root, self._element_types(base_url))
+        if root == 'Extension':
+            url_element = state.element('url')
+
+        for rule in self.project.expanded_rules(entity):
+            if isinstance(rule, CaretValueRule) and not rule.path:
+                _assign_caret(definition, rule.caret_path, _scalar(rule.value, rule.is_string),
+                              'StructureDefinition')
+                continue
+            self._apply(rule, state, url)
+        if root == 'Extension':
+            # Etter reglene, så en '* ^url = ...' (eller RuleSet med ^url) gjelder også her
+            url_element['fixedUri'] = definition['url']
+
+        definition = {k: v for k, v in definition.items() if v is not None}
+        definition['differential'] = {'element': state.elements()}
+        return definition
+
+    def _apply(self, rule, state: '_CompileState', url: str) -> None:
+        if isinstance(rule, CardRule):
+            element = state.element(rule.path)
+            if rule.min is not None:
+                element['min'] = rule.min
+            if rule.max:
+                element['max'] = rule.max
+            _apply_flags(element, rule.flags)
+        elif isinstance(rule, FlagRule):
+            _apply_flags(state.element(rule.path), rule.flags)
+        elif isinstance(rule, OnlyRule):
+            state.element(rule.path)['type'] = [self._type(t) for t in rule.types]
+        elif isinstance(rule, BindingRule):
+            state.element(rule.path)['binding'] = {
+                'strength': rule.strength or 'required',
+                'valueSet': self._resolve_value_url(rule.value_set),
+            }
+        elif isinstance(rule, CaretValueRule):
+            _assign_caret(state.element(rule.path), rule.caret_path, _scalar(rule.value, rule.is_string))
+        elif isinstance(rule, AssignmentRule):
+            self._assign(rule, state)
+        elif isinstance(rule, ContainsRule):
+            self._contains(rule, state)
+        elif isinstance(rule, ObeysRule):
+            element = state.element(rule.path)
+            for key in rule.invariants:
+                element.setdefault('constraint', []).append(self._constraint(key, url))
+        else:
+            logger.info(f"Hopper over regel som ikke kompileres: {rule.text}")
+
+    def _type(self, reference) -> dict:
+        if reference.name in ('Reference', 'Canonical', 'CodeableReference'):
+            return {'code': 'canonical' if reference.name == 'Canonical' else reference.name,
+                    'targetProfile': [self._target_url(t) for t in reference.targets]}
+        profile = self.project.resolve(reference.name)
+        if profile is not None and profile.kind in COMPILED_KINDS:
+            return {'code': self.base_type(profile), 'profile': [self.url(profile)]}
+        if reference.name in self.project.aliases or '/' in reference.name:
+            url = self.project.aliases.get(reference.name, reference.name)
+            return {'code': resource_type_from_url(url), 'profile': [url]}
+        return {'code': reference.name}
+
+    def _constraint(self, key: str, url: str) -> dict:
+        invariant = self.project.resolve(key)
+        constraint = {'key': key}
+        if invariant is not None and invariant.kind == 'Invariant':
+            constraint['severity'] = invariant.metadata.get('Severity', '#error').lstrip('#')
+            constraint['human'] = invariant.description
+            if invariant.metadata.get('Expression'):
+                constraint['expression'] = invariant.metadata['Expression']
+            if invariant.metadata.get('XPath'):
+                constraint['xpath'] = invariant.metadata['XPath']
+        constraint['source'] = url
+        return constraint
+
+    def _assign(self, rule: AssignmentRule, state: '_CompileState') -> None:
+        types = state.types_for(rule.path)
+        type_code = types[0] if len(types) == 1 else ''
+        prefix = 'fixed' if rule.exactly else 'pattern'
+        value = rule.value
+        code = None if rule.is_string else _CODE.match(value)
+        if code:
+            system, code_value, display = code.groups()
+            system = self.project.aliases.get(system, system)
+            coding = {k: v for k, v in (('system', system), ('code', code_value),
+                                        ('display', display)) if v}
+            if type_code == 'Coding':
+                typed = ('Coding', coding)
+            elif type_code == 'CodeableConcept' or (not type_code and system):
+                typed = ('CodeableConcept', {'coding': [coding]})
+            else:
+                typed = (_type_suffix(type_code or 'code'), code_value)
+        elif rule.is_string:
+            typed = (_type_suffix(type_code or 'string'), value)
+        elif value in ('true', 'false'):
+            typed = ('Boolean', value == 'true')
+        elif _INTEGER.match(value) or _DECIMAL.match(value):
+            typed = (_type_suffix(type_code or ('integer' if _INTEGER.match(value) else 'decimal')),
+                     _scalar(value, False))
+        else:
+            logger.info(f"Hopper over fast verdi som ikke kompileres: {rule.text}")
+            return
+        state.element(rule.path)[prefix + typed[0]] = typed[1]
+
+    def _contains(self, rule: ContainsRule, state: '_CompileState') -> None:
+        owner = state.element(rule.path)
+        is_extension = _split_segment(_segments(rule.path)[-1])[0] in ('extension', 'modifierExtension')
+        if is_extension and 'slicing' not in owner:
+            owner['slicing'] = {'discriminator': [{'type': 'value', 'path': 'url'}],
+                                'ordered': False, 'rules': 'open'}
+        state.declare_slices(rule.path, [item.name for item in rule.items])
+        for item in rule.items:
+            # 'contains X named y': alias er extensionen X, name er slicenavnet y
+            element = state.element(f"{rule.path}[{item.name}]")
+            if item.min is not None:
+                element['min'] = item.min
+            if item.max:
+                element['max'] = item.max
+            _apply_flags(element, item.flags)
+            extension = self.project.resolve(item.alias or item.name) if is_extension else None
+            if is_extension and (extension is not None or item.alias):
+                element['type'] = [{'code': 'Extension',
+                                    'profile': [self._resolve_value_url(item.alias or item.name)]}]
+
+
+class _CompileState:
+    """Differential-elementene for én profil, i rekkefølgen de først omtales."""
+
+    def __init__(self, root: str, base_types: Dict[str, List[str]]):
+        self.root = root
+        self.base_types = base_types
+        self.by_id: Dict[str, dict] = {root: {'id': root, 'path': root}}
+        self.choices = {path for path in base_types if path.endswith('[x]')}
+        # element-id -> slicenavnene contains-regler har deklarert på elementet
+        self.declared: Dict[str, set] = {}
+
+    def declare_slices(self, fsh_path: str, names: List[str]) -> None:
+        self.declared.setdefault(self._ids(fsh_path)[0], set()).update(names)
+
+    def _choice(self, parent_path: str, name: str) -> Optional[Tuple[str, str]]:
+        """'effectiveDateTime' -> ('effective[x]', 'effectiveDateTime') når effective[x] finnes."""
+        for end in range(len(name) - 1, 0, -1):
+            if name[end].isupper() and f"{parent_path}.{name[:end]}[x]" in self.choices:
+                return f"{name[:end]}[x]", name
+        return None
+
+    def _choice_slice(self, choice_id: str, path: str, slice_name: str) -> None:
+        """
+        Som SUSHI: effectivePeriod gir type-slicing på effective[x] og slicen
+        effective[x]:effectivePeriod med den ene typen, så barna kan plasseres.
+        """
+        slice_id = f"{choice_id}:{slice_name}"
+        if slice_id in self.by_id:
+            return
+        choice = self.by_id.setdefault(choice_id, {'id': choice_id, 'path': path})
+        choice.setdefault('slicing', {'discriminator': [{'type': 'type', 'path': '$this'}],
+                                      'ordered': False, 'rules': 'open'})
+        suffix = slice_name[len(path.rsplit('.', 1)[-1]) - len('[x]'):]
+        # Typen fra en only-regel (med eventuelle profiler), ellers fra basen eller navnet
+        candidates = choice.get('type') or [{'code': code} for code in self.base_types.get(path, [])]
+        narrowed = next((t for t in candidates if t.get('code', '').lower() == suffix.lower()), None)
+        if narrowed is None:
+            code = suffix[:1].lower() + suffix[1:]
+            narrowed = {'code': code if code in PRIMITIVE_TYPES else suffix}
+        self.by_id[slice_id] = {'id': slice_id, 'path': path, 'sliceName': slice_name, 'type': [dict(narrowed)]}
+
+    def _ids(self, fsh_path: str, create: bool = False) -> Tuple[str, str]:
+        """Element-id og path for fsh_path; med create opprettes omdøpte choice-slices underveis."""
+        element_id, path = self.root, self.root
+        for segment in _segments(fsh_path):
+            name, slices = _split_segment(segment)
+            if name.endswith('[x]'):
+                self.choices.add(f"{path}.{name}")
+            choice = None if name.endswith('[x]') else self._choice(path, name)
+            if choice:
+                name, slice_name = choice
+                slices = [slice_name] + slices
+            element_id = f"{element_id}.{name}"
+            path = f"{path}.{name}"
+            if choice and create:
+                self._choice_slice(element_id, path, choice[1])
+            kept: List[str] = []
+            for slice_name in slices:
+                owner = f"{element_id}:{'/'.join(kept)}" if kept else element_id
+                # Et tall er en indeks (f.eks. fra myk indeksering) med mindre contains har deklarert det
+                if not slice_name.isdigit() or slice_name in self.declared.get(owner, ()):
+                    kept.append(slice_name)
+            if kept:
+                element_id = f"{element_id}:{'/'.join(kept)}"
+        return element_id, path
+
+    def element(self, fsh_path: str) -> dict:
+        if not fsh_path:
+            return self.by_id[self.root]
+        element_id, path = self._ids(fsh_path, create=True)
+        element = self.by_id.get(element_id)
+        if element is None:
+            element = {'id': element_id, 'path': path}
+            last = element_id.rsplit('.', 1)[-1]
+            if ':' in last:
+                element['sliceName'] = last.split(':', 1)[1]
+            self.by_id[element_id] = element
+        return element
+
+    def types_for(self, fsh_path: str) -> List[str]:
+        element_id, path = self._ids(fsh_path, create=True)
+        element = self.by_id.get(element_id, {})
+        if element.get('type'):
+            return [t['code'] for t in element['type']]
+        return self.base_types.get(path, [])
+
+    def elements(self) -> List[dict]:
+        return list(self.by_id.values())
+
+
+def _apply_flags(element: dict, flags: List[str]) -> None:
+    for flag in flags:
+        if flag in FLAG_FIELDS:
+            element[FLAG_FIELDS[flag]] = True
+
+
+def _assign_caret(target: dict, caret_path: str, value: Any, parent: str = 'ElementDefinition') -> None:
+    """Setter value på caret_path ('slicing.discriminator[0].type') i target (av typen parent)."""
+    parts = caret_path.split('.')
+    current: Any = target
+    for position, part in enumerate(parts):
+        last = position == len(parts) - 1
+        match = _INDEX.match(part)
+        name, index = (match.group(1), match.group(2)) if match else (part, None)
+        if index is None and name in LIST_FIELDS and name not in SCALAR_FIELDS.get(parent, ()):
+            index = '0'
+        parent = name
+        if index is None:
+            if last:
+                current[name] = value
+                continue
+            child = current.setdefault(name, {})
+            # Feltet kan allerede være en liste (f.eks. satt av en only-regel)
+            current = child[0] if isinstance(child, list) and child else child
+            continue
+        items = current.setdefault(name, [])
+        if index == '+' or (index == '=' and not items):
+            items.append(None)
+            slot = len(items) - 1
+        elif index == '=':
+            slot = len(items) - 1
+        else:
+            slot = int(index)
+            items.extend([None] * (slot + 1 - len(items)))
+        if last:
+            items[slot] = value
+        else:
+            if not isinstance(items[slot], dict):
+                items[slot] = {}
+            current = items[slot]
+
+
+def compile_project(project: FSHProject, loader: Optional[StructureDefinitionLoader] = None) -> Dict[str, dict]:
+    """id -> differential StructureDefinition for alle profiler og extensions i prosjektet."""
+    compiler = DifferentialCompiler(project, loader)
+    compiled = {}
+    for document in project.documents:
+        for entity in document.entities:
+            if entity.kind in COMPILED_KINDS:
+                definition = compiler.compile(entity)
+                compiled[definition['id']] = definition
+    return compiled
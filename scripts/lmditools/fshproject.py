@@ -0,0 +1,248 @@
+"""
+Prosjektindeks over alle FSH-filene i en IG.
+
+FSHProject parser hele FSH-treet én gang (profiles, extensions, valuesets,
+namingsystems, examples og aliases.fsh) og slår opp entiteter på navn, Id
+og Title, og aliaser på navn, i O(1):
+
+    project = FSHProject.load('LMDI/input/fsh/profiles')
+    project.resolve('lmdi-patient')          # -> FSHEntity for Pasient
+    project.parent_url(profile)              # canonical URL for Parent:
+    project.reference_target('lmdi-patient') # -> 'Pasient'
+
+Prosjektroten er nærmeste katalog over stien med sushi-config.yaml; da
+leses FSH-filene fra input/fsh og canonical fra konfigurasjonen. Uten
+sushi-config.yaml brukes katalogen selv.
+"""
+import os
+import re
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from lmditools.fsh import (CaretValueRule, FSHDocument, FSHEntity, InsertRule, Rule, find_fsh_files,
+                           parse_text)
+from lmditools.fshcache import FSHParseCache, get_default_cache
+from lmditools.loader import FHIR_CORE_CANONICAL
+
+SUSHI_CONFIG = 'sushi-config.yaml'
+
+# Entiteter med canonical URL, og ressurstypen i URL-en
+CANONICAL_KINDS = {
+    'Profile': 'StructureDefinition',
+    'Extension': 'StructureDefinition',
+    'Logical': 'StructureDefinition',
+    'Resource': 'StructureDefinition',
+    'ValueSet': 'ValueSet',
+    'CodeSystem': 'CodeSystem',
+}
+
+# Grense for nøstede insert-regler (beskytter mot RuleSets som inkluderer seg selv)
+MAX_INSERT_DEPTH = 16
+
+_CANONICAL_LINE = re.compile(r'^canonical:\s*(\S+)', re.MULTILINE)
+
+
+def find_project_root(path: str) -> Optional[Path]:
+    """Nærmeste katalog fra path og oppover som har sushi-config.yaml."""
+    current = Path(path).resolve()
+    if current.is_file():
+        current = current.parent
+    for directory in (current, *current.parents):
+        if (directory / SUSHI_CONFIG).is_file():
+            return directory
+    return None
+
+
+def read_canonical(root: Path) -> str:
+    """canonical fra sushi-config.yaml (uten avsluttende '/'), eller ''."""
+    try:
+        with open(root / SUSHI_CONFIG, 'r', encoding='utf-8') as f:
+            match = _CANONICAL_LINE.search(f.read())
+    except OSError:
+        return ''
+    return match.group(1).strip('"\'').rstrip('/') if match else ''
+
+
+class FSHProject:
+    """Alle FSH-dokumentene i et prosjekt med oppslag på navn, Id, Title og alias."""
+
+    def __init__(self, documents: List[FSHDocument], canonical: str = '',
+                 root: Optional[Path] = None):
+        self.canonical = canonical
+        self.root = root
+        self.by_file: Dict[str, FSHDocument] = {
+            str(Path(document.path).resolve()): document for document in documents}
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.documents: List[FSHDocument] = [self.by_file[f] for f in sorted(self.by_file)]
+        self.by_name: Dict[str, FSHEntity] = {}
+        self.by_id: Dict[str, FSHEntity] = {}
+        self.by_title: Dict[str, FSHEntity] = {}
+        self.by_url: Dict[str, FSHEntity] = {}
+        self.aliases: Dict[str, str] = {}
+        self.rulesets: Dict[str, FSHEntity] = {}
+        for document in self.documents:
+            self._add(document)
+
+    def _add(self, document: FSHDocument) -> None:
+        self.aliases.update(document.aliases)
+        for entity in document.entities:
+            if entity.kind == 'RuleSet':
+                self.rulesets[entity.name] = entity
+                continue
+            self.by_name.setdefault(entity.name, entity)
+            if entity.id:
+                self.by_id.setdefault(entity.id, entity)
+            if entity.title:
+                self.by_title.setdefault(entity.title, entity)
+            url = self.canonical_url(entity)
+            if url:
+                self.by_url.setdefault(url, entity)
+
+    @classmethod
+    def load(cls, path: str, cache: Optional[FSHParseCache] = None) -> 'FSHProject':
+        """Parser prosjektet som path (fil eller katalog) hører til; uendrede filer hentes fra cache."""
+        cache = cache or get_default_cache()
+        root = find_project_root(path)
+        if root is not None:
+            fsh_dir = root / 'input' / 'fsh'
+            source = fsh_dir if fsh_dir.is_dir() else root
+            canonical = read_canonical(root)
+        else:
+            source = Path(path)
+            source = source.parent if source.is_file() else source
+            canonical = ''
+        files = find_fsh_files(str(source))
+        # En enkeltfil utenfor prosjektkatalogen tas også med
+        requested = Path(path)
+        if requested.is_file() and requested.resolve() not in {f.resolve() for f in files}:
+            files.append(requested)
+        return cls([cache.parse_file(str(f)) for f in files], canonical, root)
+
+    def documents_under(self, path: str) -> List[FSHDocument]:
+        """Dokumentene for filen path, eller .fsh-filene direkte i katalogen path."""
+        target = Path(path).resolve()
+        if target.is_file():
+            document = self.by_file.get(str(target))
+            return [document] if document else [get_default_cache().parse_file(str(target))]
+        return [document for file, document in sorted(self.by_file.items())
+                if Path(file).parent == target]
+
+    def update_file(self, path: str, cache: Optional[FSHParseCache] = None) -> Optional[FSHDocument]:
+        """
+        Parser én endret fil på nytt (eller fjerner den hvis den er slettet)
+        og bygger oppslagene på nytt. Øvrige filer parses ikke.
+        """
+        key = str(Path(path).resolve())
+        if os.path.isfile(key):
+            self.by_file[key] = (cache or get_default_cache()).parse_file(key)
+        else:
+            self.by_file.pop(key, None)
+        self._reindex()
+        return self.by_file.get(key)
+
+    def dependencies(self, entity: FSHEntity) -> Set[str]:
+        """Filene entity bygger på: egen fil, lokal parent og RuleSets som settes inn."""
+        files = {str(Path(entity.file).resolve())}
+        parent = self.resolve(entity.parent) if entity.parent else None
+        if parent is not None and parent is not entity:
+            files.add(str(Path(parent.file).resolve()))
+        pending = [entity]
+        seen: Set[str] = set()
+        while pending:
+            current = pending.pop()
+            for rule in current.rules_of(InsertRule):
+                ruleset = self.rulesets.get(rule.ruleset)
+                if ruleset is not None and ruleset.name not in seen:
+                    seen.add(ruleset.name)
+                    files.add(str(Path(ruleset.file).resolve()))
+                    pending.append(ruleset)
+        return files
+
+    # ---------------------------------------------------------------- oppslag
+
+    def resolve(self, key: str) -> Optional[FSHEntity]:
+        """Entiteten key viser til: navn, Id, Title, alias eller canonical URL."""
+        key = key.strip()
+        entity = self.by_name.get(key) or self.by_id.get(key) or self.by_title.get(key)
+        if entity is not None:
+            return entity
+        url = self.aliases.get(key, key).split('|')[0]
+        return self.by_url.get(url)
+
+    def canonical_url(self, entity: FSHEntity) -> str:
+        """'* ^url = ...' på roten overstyrer URL-en fra canonical og Id."""
+        resource_type = CANONICAL_KINDS.get(entity.kind)
+        if not resource_type:
+            return ''
+        for rule in entity.rules_of(CaretValueRule):
+            if not rule.path and rule.caret_path == 'url' and rule.value:
+                return rule.value
+        if not self.canonical:
+            return ''
+        return f"{self.canonical}/{resource_type}/{entity.id or entity.name}"
+
+    def resolve_url(self, key: str) -> str:
+        """
+        Canonical URL for en Parent:/InstanceOf:-verdi: lokal entitet, alias,
+        URL som den er, ellers en FHIR-kjernetype.
+        """
+        key = key.strip()
+        entity = self.resolve(key)
+        if entity is not None and self.canonical_url(entity):
+            return self.canonical_url(entity)
+        if key in self.aliases:
+            return self.aliases[key]
+        if '/' in key or ':' in key:
+            return key
+        return f"{FHIR_CORE_CANONICAL}{key}"
+
+    def parent_url(self, entity: FSHEntity) -> str:
+        return self.resolve_url(entity.parent) if entity.parent else ''
+
+    def reference_target(self, key: str) -> str:
+        """Navnet på profilen key (navn, Id, alias eller URL) viser til, ellers key."""
+        entity = self.resolve(key)
+        return entity.name if entity is not None else key
+
+    def generated_path(self, url: str) -> Optional[Path]:
+        """SUSHI-generert JSON for en lokal canonical URL, hvis den finnes."""
+        entity = self.by_url.get(url.split('|')[0])
+        if entity is None or self.root is None:
+            return None
+        resource_type = CANONICAL_KINDS[entity.kind]
+        path = self.root / 'fsh-generated' / 'resources' / f"{resource_type}-{entity.id or entity.name}.json"
+        return path if path.is_file() else None
+
+    # ---------------------------------------------------------------- regler
+
+    def expanded_rules(self, entity: FSHEntity) -> List[Rule]:
+        """Reglene i entity med insert-regler erstattet av reglene i RuleSet-et."""
+        return list(self._expand(entity.rules, '', 0))
+
+    def _expand(self, rules: List[Rule], prefix: str, depth: int) -> Iterator[Rule]:
+        for rule in rules:
+            if not isinstance(rule, InsertRule):
+                if prefix:
+                    rule = replace(rule, path=f"{prefix}.{rule.path}" if rule.path else prefix)
+                yield rule
+                continue
+            ruleset = self.rulesets.get(rule.ruleset)
+            if ruleset is None or depth >= MAX_INSERT_DEPTH:
+                yield rule
+                continue
+            path = f"{prefix}.{rule.path}" if prefix and rule.path else (prefix or rule.path)
+            yield from self._expand(self._ruleset_rules(ruleset, rule.params), path, depth + 1)
+
+    def _ruleset_rules(self, ruleset: FSHEntity, params: List[str]) -> List[Rule]:
+        if not ruleset.params:
+            return ruleset.rules
+        # Parametriserte RuleSets parses på nytt med verdiene satt inn
+        values = dict(zip(ruleset.params, params))
+        text = '\n'.join(' ' * rule.indent + '* ' + rule.text for rule in ruleset.rules)
+        text = re.sub(r'\{(\w+)\}', lambda m: values.get(m.group(1), m.group()), text)
+        entity = parse_text(f"RuleSet: {ruleset.name}\n{text}", ruleset.file).entities[0]
+        return entity.rules
+
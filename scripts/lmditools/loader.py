@@ -0,0 +1,280 @@
+"""
+Felles lasting av StructureDefinitions med innholdsadressert disk-cache.
+
+Basedefinisjoner (f.eks. http://hl7.org/fhir/StructureDefinition/Patient) lastes
+ned én gang per maskin og lagres under cache-katalogen:
+
+    <cache>/structuredefinitions/index.json           canonical URL -> sha256
+    <cache>/structuredefinitions/objects/ab/<sha256>.pickle
+
+Objektene lagres ferdig parset, slik at senere kjøringer (og andre skript)
+slipper både nettverk og JSON-parsing. Cache-katalogen settes med
+miljøvariabelen LMDI_CACHE_DIR, ellers brukes $XDG_CACHE_HOME/lmdi eller
+~/.cache/lmdi.
+
+Oppslag går i rekkefølgen minne -> lokale FHIR-pakker (se packages.py) ->
+disk-cache -> nettverk. Med LMDI_OFFLINE=1 brukes aldri nettverket.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from lmditools.packages import PackageResolver
+
+try:
+    import requests
+except ImportError:  # Nettverk er valgfritt når alt ligger i cache
+    requests = None
+
+logger = logging.getLogger(__name__)
+
+FHIR_R4_BASE_URL = "http://hl7.org/fhir/R4/"
+FHIR_CORE_CANONICAL = "http://hl7.org/fhir/StructureDefinition/"
+
+INDEX_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    """Returnerer cache-katalogen fra LMDI_CACHE_DIR eller XDG-standarden."""
+    configured = os.environ.get('LMDI_CACHE_DIR')
+    if configured:
+        return Path(configured).expanduser()
+    xdg = os.environ.get('XDG_CACHE_HOME')
+    base = Path(xdg).expanduser() if xdg else Path.home() / '.cache'
+    return base / 'lmdi'
+
+
+def canonical_for_type(resource_type: str) -> str:
+    """Bygger canonical URL for en FHIR R4-basetype, f.eks. 'Patient'."""
+    return f"{FHIR_CORE_CANONICAL}{resource_type}"
+
+
+def resource_type_from_url(url: str) -> str:
+    """Henter siste del av en canonical URL (uten versjon og fragment)."""
+    return url.split('|')[0].split('#')[0].rstrip('/').split('/')[-1]
+
+
+def offline_from_env() -> bool:
+    return os.environ.get('LMDI_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class StructureDefinitionLoader:
+    """Henter StructureDefinitions via minne, lokale pakker, disk-cache og til slutt nettverk."""
+
+    def __init__(self, cache_dir: Optional[str] = None, timeout: int = 30, max_retries: int = 3,
+                 packages: Optional[PackageResolver] = None, offline: Optional[bool] = None,
+                 pool_size: int = 8):
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else default_cache_dir()
+        self.packages = packages if packages is not None else PackageResolver()
+        self.offline = offline_from_env() if offline is None else offline
+        self.root = self.cache_dir / 'structuredefinitions'
+        self.index_path = self.root / 'index.json'
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._memory: Dict[str, dict] = {}
+        self._index: Optional[Dict[str, str]] = None
+        self._session = None
+        self._lock = threading.RLock()
+
+    # ---------------------------------------------------------------- index
+
+    def _read_index(self) -> Dict[str, str]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('urls', {})
+
+    @property
+    def index(self) -> Dict[str, str]:
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    def _write_index(self, updates: Dict[str, str]) -> None:
+        """Fletter inn nye oppføringer og skriver indeksen atomisk."""
+        with self._lock:
+            merged = self._read_index()
+            merged.update(updates)
+            self._index = merged
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.index-', suffix='.json')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'urls': merged}, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.index_path)
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / 'objects' / digest[:2] / f"{digest}.pickle"
+
+    # ---------------------------------------------------------------- lagring
+
+    def store(self, url: str, raw: bytes, key: Optional[str] = None) -> dict:
+        """Parser rå JSON, lagrer den under sin hash og registrerer URL-en."""
+        resource = json.loads(raw)
+        digest = content_hash(raw)
+        obj_path = self._object_path(digest)
+        if not obj_path.exists():
+            obj_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=obj_path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(resource, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, obj_path)
+        if key is not None:
+            # Pakkeinnhold registreres under pakke-ID, slik at nye pakkeversjoner
+            # ikke skygges av gamle oppføringer
+            aliases = {key: digest}
+        else:
+            aliases = {url: digest}
+            if resource.get('url'):
+                aliases[resource['url']] = digest
+        if any(self.index.get(k) != digest for k in aliases):
+            self._write_index(aliases)
+        self._memory[url] = resource
+        return resource
+
+    def _load_cached(self, key: str) -> Optional[dict]:
+        digest = self.index.get(key)
+        if not digest:
+            return None
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Ødelagt cache-objekt for {key}: {e}")
+            return None
+
+    def _package_key(self, url: str) -> Optional[str]:
+        located = self.packages.locate(url)
+        if not located:
+            return None
+        package, _ = located
+        return f"{package.package_id}::{url}"
+
+    def content_hash(self, url: str) -> Optional[str]:
+        """Returnerer innholdshashen for en URL som allerede ligger i cache."""
+        url = url.split('|')[0]
+        package_key = self._package_key(url)
+        return self.index.get(package_key or url)
+
+    def is_cached(self, url: str) -> bool:
+        """Sann hvis url kan løses uten nettverk."""
+        url = url.split('|')[0]
+        return (url in self._memory or url in self.index
+                or self.packages.locate(url) is not None)
+
+    # ---------------------------------------------------------------- nettverk
+
+    def candidate_urls(self, url: str):
+        """Mulige nedlastingsadresser for en canonical URL, i prioritert rekkefølge."""
+        resource_type = resource_type_from_url(url)
+        yield f"{FHIR_R4_BASE_URL}StructureDefinition-{resource_type}.json"
+        yield f"{FHIR_R4_BASE_URL}{resource_type}.profile.json"
+        yield f"{FHIR_R4_BASE_URL}{resource_type.lower()}.profile.json"
+
+    @property
+    def session(self):
+        """Delt HTTP-sesjon med keep-alive, tilkoblingspool og backoff ved feil."""
+        if self._session is None:
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=self.max_retries, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=('GET',), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """Laster ned rå JSON for en canonical URL. Returnerer None ved feil."""
+        if self.offline:
+            return None
+        if requests is None:
+            logger.warning(f"Kan ikke laste ned {url}: requests er ikke installert")
+            return None
+        for api_url in self.candidate_urls(url):
+            try:
+                response = self.session.get(api_url, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Nedlasting fra {api_url} feilet: {e}")
+                continue
+            if response.status_code == 200:
+                return response.content
+            if response.status_code != 404:
+                logger.warning(f"HTTP {response.status_code} fra {api_url}")
+        return None
+
+    # ---------------------------------------------------------------- oppslag
+
+    def get(self, url: str) -> Optional[dict]:
+        """Henter StructureDefinition for canonical URL (minne -> disk -> nettverk)."""
+        if not url:
+            return None
+        url = url.split('|')[0]
+        if url in self._memory:
+            return self._memory[url]
+
+        resource = self._load_from_package(url)
+        if resource is None:
+            resource = self._load_cached(url)
+        if resource is None:
+            raw = self.fetch(url)
+            if raw is None:
+                logger.warning(f"Kunne ikke laste StructureDefinition: {url}"
+                               f"{' (offline)' if self.offline else ''}")
+                return None
+            try:
+                resource = self.store(url, raw)
+            except ValueError as e:
+                logger.warning(f"Ugyldig JSON for {url}: {e}")
+                return None
+
+        self._memory[url] = resource
+        return resource
+
+    def _load_from_package(self, url: str) -> Optional[dict]:
+        key = self._package_key(url)
+        if key is None:
+            return None
+        resource = self._load_cached(key)
+        if resource is not None:
+            return resource
+        try:
+            raw = self.packages.read(url)
+            return self.store(url, raw, key=key)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Kunne ikke lese {url} fra lokal pakke: {e}")
+            return None
+
+    def get_type(self, resource_type: str) -> Optional[dict]:
+        """Henter basedefinisjonen for en FHIR R4-type, f.eks. 'Organization'."""
+        return self.get(canonical_for_type(resource_type))
+
+
+_default_loader: Optional[StructureDefinitionLoader] = None
+
+
+def get_default_loader() -> StructureDefinitionLoader:
+    """Delt loader for prosessen, konfigurert fra miljøet."""
+    global _default_loader
+    if _default_loader is None:
+        _default_loader = StructureDefinitionLoader()
+    return _default_loader
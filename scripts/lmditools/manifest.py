@@ -0,0 +1,88 @@
+"""
+Manifest for inkrementell analyse av en profilkatalog.
+
+For hver inputfil lagres hash av innholdet, baseDefinition-URL og hash av
+den oppløste basedefinisjonen, sammen med teksten analysen ga. Ved neste
+kjøring gjenbrukes teksten for filer der ingen av hashene er endret.
+Manifestet forkastes hvis skriptet som laget det er endret (tool_hash).
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from lmditools.loader import default_cache_dir
+
+MANIFEST_VERSION = 1
+
+
+def file_hash(path: str) -> str:
+    """sha256 av filinnholdet."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_manifest_path(tool: str, directory: str) -> Path:
+    """Manifest per skript og inputkatalog under cache-katalogen."""
+    key = hashlib.sha256(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+    return default_cache_dir() / 'manifests' / f"{tool}-{key}.json"
+
+
+class Manifest:
+    def __init__(self, path: str, tool_hash: str = ''):
+        self.path = Path(path)
+        self.tool_hash = tool_hash
+        self.entries: Dict[str, dict] = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION and data.get('tool_hash') == self.tool_hash:
+            self.entries = data.get('entries', {})
+
+    def lookup(self, input_path: str, input_hash: str, base_hash: Optional[str]) -> Optional[str]:
+        """Lagret output hvis input og base er uendret, ellers None."""
+        entry = self.entries.get(os.path.abspath(input_path))
+        if not entry or base_hash is None:
+            return None
+        if entry['input_hash'] != input_hash or entry['base_hash'] != base_hash:
+            return None
+        return entry['output']
+
+    def base_url(self, input_path: str) -> Optional[str]:
+        entry = self.entries.get(os.path.abspath(input_path))
+        return entry.get('base_url') if entry else None
+
+    def record(self, input_path: str, input_hash: str, base_url: str,
+               base_hash: Optional[str], output: str) -> None:
+        # Uten oppløst base kan resultatet skyldes manglende nettverk; ikke cache
+        if base_hash is None:
+            return
+        self.entries[os.path.abspath(input_path)] = {
+            'input_hash': input_hash,
+            'base_url': base_url,
+            'base_hash': base_hash,
+            'output': output,
+        }
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'tool_hash': self.tool_hash,
+                       'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
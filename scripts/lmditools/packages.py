@@ -0,0 +1,186 @@
+"""
+Oppslag i lokale FHIR-pakker (~/.fhir/packages) uten nettverk.
+
+Støtter både utpakkede pakker (<navn>#<versjon>/package/ som SUSHI og IG
+Publisher legger dem) og .tgz-filer slik de lastes ned fra pakkeregisteret.
+Pakkens .index.json brukes til å slå opp canonical URL -> fil. Tarballer
+åpnes først når en URL faktisk trengs, og bare medlemmene som etterspørres
+leses ut.
+
+Flere pakkekataloger kan angis med LMDI_PACKAGE_DIRS (skilt med os.pathsep).
+"""
+import json
+import logging
+import os
+import tarfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = '.index.json'
+
+
+def default_package_roots() -> List[Path]:
+    """Pakkekataloger fra LMDI_PACKAGE_DIRS, ellers standard FHIR-pakkecache."""
+    configured = os.environ.get('LMDI_PACKAGE_DIRS')
+    if configured:
+        return [Path(p).expanduser() for p in configured.split(os.pathsep) if p]
+    return [Path.home() / '.fhir' / 'packages']
+
+
+def _index_entries(index: dict) -> Iterator[Tuple[str, str]]:
+    for entry in index.get('files', []):
+        url = entry.get('url')
+        filename = entry.get('filename')
+        if url and filename:
+            yield url, filename
+
+
+class DirectoryPackage:
+    """Utpakket pakke, f.eks. ~/.fhir/packages/hl7.fhir.r4.core#4.0.1/package."""
+
+    def __init__(self, package_id: str, directory: Path):
+        self.package_id = package_id
+        self.directory = directory
+        self._urls: Optional[Dict[str, str]] = None
+
+    @property
+    def urls(self) -> Dict[str, str]:
+        if self._urls is None:
+            self._urls = self._build_url_map()
+        return self._urls
+
+    def _build_url_map(self) -> Dict[str, str]:
+        index_path = self.directory / INDEX_FILE
+        if index_path.exists():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return dict(_index_entries(json.load(f)))
+
+        # Eldre pakker mangler .index.json: les url fra hver fil én gang
+        logger.info(f"{self.package_id} mangler {INDEX_FILE}, skanner filene")
+        urls = {}
+        for path in sorted(self.directory.glob('*.json')):
+            if path.name == 'package.json':
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    url = json.load(f).get('url')
+            except (OSError, ValueError):
+                continue
+            if url:
+                urls.setdefault(url, path.name)
+        return urls
+
+    def read(self, filename: str) -> bytes:
+        with open(self.directory / filename, 'rb') as f:
+            return f.read()
+
+
+class TarballPackage:
+    """Pakke som .tgz. Arkivet åpnes først ved første oppslag."""
+
+    def __init__(self, package_id: str, archive: Path):
+        self.package_id = package_id
+        self.archive = archive
+        self._tar: Optional[tarfile.TarFile] = None
+        self._members: Dict[str, tarfile.TarInfo] = {}
+        self._urls: Optional[Dict[str, str]] = None
+
+    def _open(self) -> tarfile.TarFile:
+        if self._tar is None:
+            self._tar = tarfile.open(self.archive, 'r:gz')
+            # Én gjennomgang av headerne; innholdet leses først ved behov
+            for member in self._tar:
+                if member.isfile():
+                    self._members[member.name.split('/', 1)[-1]] = member
+        return self._tar
+
+    @property
+    def urls(self) -> Dict[str, str]:
+        if self._urls is None:
+            tar = self._open()
+            urls = {}
+            if INDEX_FILE in self._members:
+                index = json.load(tar.extractfile(self._members[INDEX_FILE]))
+                urls = dict(_index_entries(index))
+            else:
+                logger.info(f"{self.package_id} mangler {INDEX_FILE}, skanner medlemmene")
+                for name, member in sorted(self._members.items()):
+                    if '/' in name or not name.endswith('.json') or name == 'package.json':
+                        continue
+                    try:
+                        url = json.load(tar.extractfile(member)).get('url')
+                    except ValueError:
+                        continue
+                    if url:
+                        urls.setdefault(url, name)
+            self._urls = urls
+        return self._urls
+
+    def read(self, filename: str) -> bytes:
+        tar = self._open()
+        return tar.extractfile(self._members[filename]).read()
+
+
+def _package_id_from_manifest(manifest: Path, fallback: str) -> str:
+    try:
+        with open(manifest, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return f"{data['name']}#{data['version']}"
+    except (OSError, ValueError, KeyError):
+        return fallback
+
+
+class PackageResolver:
+    """Slår opp canonical URL-er i alle pakker under de angitte katalogene."""
+
+    def __init__(self, roots: Optional[List[Path]] = None):
+        self.roots = [Path(r) for r in roots] if roots is not None else default_package_roots()
+        self._packages: Optional[list] = None
+
+    @property
+    def packages(self) -> list:
+        if self._packages is None:
+            self._packages = self._discover()
+        return self._packages
+
+    def _discover(self) -> list:
+        packages = []
+        for root in self.roots:
+            if not root.is_dir():
+                continue
+            if (root / 'package' / 'package.json').exists():
+                packages.append(DirectoryPackage(
+                    _package_id_from_manifest(root / 'package' / 'package.json', root.name),
+                    root / 'package'))
+                continue
+            for entry in sorted(root.iterdir()):
+                if entry.is_dir() and (entry / 'package').is_dir():
+                    packages.append(DirectoryPackage(
+                        _package_id_from_manifest(entry / 'package' / 'package.json', entry.name),
+                        entry / 'package'))
+                elif entry.is_file() and entry.name.endswith('.tgz'):
+                    packages.append(TarballPackage(entry.name[:-len('.tgz')], entry))
+        return packages
+
+    def locate(self, url: str) -> Optional[Tuple[object, str]]:
+        """Returnerer (pakke, filnavn) for første pakke som definerer url."""
+        url = url.split('|')[0]
+        for package in self.packages:
+            try:
+                filename = package.urls.get(url)
+            except (OSError, tarfile.TarError, ValueError) as e:
+                logger.warning(f"Kunne ikke lese pakke {package.package_id}: {e}")
+                continue
+            if filename:
+                return package, filename
+        return None
+
+    def read(self, url: str) -> Optional[bytes]:
+        """Leser rå JSON for url fra lokale pakker, eller None."""
+        located = self.locate(url)
+        if not located:
+            return None
+        package, filename = located
+        return package.read(filename)
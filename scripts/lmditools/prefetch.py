@@ -0,0 +1,72 @@
+"""
+Forhåndshenting av alle basedefinisjoner som profilene i en katalog trenger.
+
+Skriptene analyserer profilene én og én; uten forhåndshenting blir hver
+manglende baseDefinition lastet ned sekvensielt midt i analysen. Her samles
+alle baseDefinition- og type.profile-URL-er først, og de som ikke kan løses
+lokalt hentes parallelt gjennom loaderens delte HTTP-sesjon. Selve analysen
+går deretter bare mot varm cache.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set
+
+from lmditools.loader import StructureDefinitionLoader, get_default_loader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = 8
+
+
+def referenced_urls(structure_definition: dict) -> Set[str]:
+    """baseDefinition og alle type.profile-URL-er i differential og snapshot."""
+    urls = set()
+    base = structure_definition.get('baseDefinition')
+    if base:
+        urls.add(base.split('|')[0])
+    for section in ('differential', 'snapshot'):
+        for element in structure_definition.get(section, {}).get('element', []):
+            for type_def in element.get('type', []):
+                for profile in type_def.get('profile', []):
+                    urls.add(profile.split('|')[0])
+    return urls
+
+
+def collect_urls(paths: Iterable[str]) -> Set[str]:
+    """Samler URL-er fra alle StructureDefinition-filene i paths."""
+    urls = set()
+    local_urls = set()
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                resource = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Hopper over {path} under forhåndshenting: {e}")
+            continue
+        if resource.get('resourceType') != 'StructureDefinition':
+            continue
+        urls |= referenced_urls(resource)
+        if resource.get('url'):
+            local_urls.add(resource['url'].split('|')[0])
+    # Profiler i samme katalog skal ikke lastes ned, uansett rekkefølgen filene leses i
+    return urls - local_urls
+
+
+def prefetch(urls: Iterable[str], loader: StructureDefinitionLoader = None,
+             jobs: int = DEFAULT_JOBS) -> Dict[str, bool]:
+    """Laster alle urls inn i cachen, med høyst jobs samtidige nedlastinger."""
+    loader = loader or get_default_loader()
+    missing: List[str] = sorted(url for url in urls if not loader.is_cached(url))
+    if not missing:
+        return {}
+    logger.info(f"Forhåndshenter {len(missing)} basedefinisjoner ({jobs} parallelt)")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(loader.get, missing))
+    return {url: result is not None for url, result in zip(missing, results)}
+
+
+def prefetch_for_files(paths: Iterable[str], loader: StructureDefinitionLoader = None,
+                       jobs: int = DEFAULT_JOBS) -> Dict[str, bool]:
+    """Forhåndshenter alt profilene i paths refererer til."""
+    return prefetch(collect_urls(paths), loader, jobs)
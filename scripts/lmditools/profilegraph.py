@@ -0,0 +1,567 @@
+"""
+Felles grafmodell for diagramskriptene.
+
+Hver StructureDefinition parses én gang til en ProfileNode med attributter,
+referansekanter (med kardinalitet propagert fra foreldrene) og lenke til
+dokumentasjonen. Alle diagramvariantene lages fra samme ProfileGraph:
+
+    graph = ProfileGraph.from_files(find_structure_definitions('fsh-generated/resources'))
+    render_plantuml(graph)            # lag-plantuml-diagrammer
+    render_plantuml_complete(graph)   # lag-plantuml-komplette-diagrammer
+    render_plantuml_simple(node)      # lag-plantuml-enkel-diagrammer
+    render_mermaid(graph)
+    render_dot(graph)
+"""
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from lmditools.loader import StructureDefinitionLoader, canonical_for_type, get_default_loader
+from lmditools.prefetch import prefetch
+from lmditools.records import Cardinality, ElementRecord, parse_max
+from lmditools.stream import load_structure_definition
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_NAME_MAPPING = {
+    'lmdi-bundle': 'LegemiddelregisterBundle',
+    'lmdi-condition': 'Diagnose',
+    'lmdi-encounter': 'Episode',
+    'lmdi-episodeofcare': 'Institusjonsopphold',
+    'lmdi-medication': 'Legemiddel',
+    'lmdi-medicationadministration': 'Legemiddeladministrering',
+    'lmdi-medicationrequest': 'Legemiddelrekvirering',
+    'lmdi-organization': 'Organisasjon',
+    'lmdi-patient': 'Pasient',
+    'lmdi-practitioner': 'Helsepersonell',
+    'lmdi-practitionerrole': 'Helsepersonellrolle',
+    'lmdi-adresse': 'Adresse',
+    'lmdi-diagnose': 'Diagnose',
+    'lmdi-institusjonsopphold': 'Institusjonsopphold',
+    'lmdi-legemiddel': 'Legemiddel',
+    'lmdiLegemiddelrekvirering': 'Legemiddelrekvirering',
+    'lmdLegemiddeladministrering': 'Legemiddeladministrering',
+    'episode': 'Episode'
+}
+
+STANDARD_ELEMENTS = {
+    'id', 'meta', 'implicitRules', 'language', 'text', 'contained',
+    'extension', 'modifierExtension', 'resourceType'
+}
+
+LMDI_DOCS_BASE_URL = "https://hl7norway.github.io/LMDI/currentbuild/StructureDefinition-"
+FHIR_DOCS_BASE_URL = "https://hl7.org/fhir/R4/"
+
+PLANTUML_HEADER = [
+    "@startuml",
+    "",
+    "hide empty members",
+    "skinparam class {",
+    "    BackgroundColor White",
+    "    ArrowColor Black",
+    "    BorderColor Black",
+    "}",
+    ""
+]
+
+
+def strip_structure_prefix(value: str) -> str:
+    if value.startswith('StructureDefinition-'):
+        return value[len('StructureDefinition-'):]
+    return value
+
+
+def get_resource_name(resource_id: str) -> str:
+    """Oversetter resource ID til navn hvis det finnes i mappingen."""
+    resource_id = strip_structure_prefix(resource_id)
+    return RESOURCE_NAME_MAPPING.get(resource_id, resource_id)
+
+
+@dataclass
+class ReferenceEdge:
+    source: str
+    target: str
+    name: str
+    cardinality: str
+    path: str = ''
+    # Elementet er selv en extension (utelates i oversiktsdiagrammet)
+    in_extension: bool = False
+    # Første type og første targetProfile på elementet (enkel-diagrammet)
+    is_first: bool = False
+    # Målet er en Extension-profil (vises bare i enkel-diagrammet)
+    to_extension: bool = False
+
+    @property
+    def depth(self) -> int:
+        return self.path.count('.')
+
+    @property
+    def element_name(self) -> str:
+        return self.path.rsplit('.', 1)[-1]
+
+
+class ProfileNode:
+    """Én StructureDefinition i grafen."""
+
+    def __init__(self, resource_id: str, name: str):
+        self.resource_id = resource_id  # Id fra profilen (eller filnavnet), f.eks. lmdi-condition
+        self.name = name  # name/id/type fra profilen, f.eks. Diagnose
+        self.type: str = ""
+        self.base_type: str = ""
+        self.is_local_profile: bool = True
+        self.references: Dict[str, ReferenceEdge] = {}
+        self.zero_cardinality_paths: Set[str] = set()
+        self.element_cardinalities: Dict[str, Cardinality] = {}
+        self.attributes: List[ElementRecord] = []
+
+    @property
+    def display_name(self) -> str:
+        return get_resource_name(self.resource_id)
+
+    def diagram_references(self) -> List[ReferenceEdge]:
+        """Referansene i oversiktsdiagrammene: ikke de som peker på Extension-profiler."""
+        return [ref for ref in self.references.values() if not ref.to_extension]
+
+    @property
+    def simple_name(self) -> str:
+        """Navnet i enkel-diagrammet: mappet Id, ellers ressurstypen."""
+        return get_resource_name(self.resource_id if self.resource_id in RESOURCE_NAME_MAPPING else self.type)
+
+    def documentation_url(self) -> str:
+        if self.is_local_profile:
+            return f"{LMDI_DOCS_BASE_URL}{self.resource_id}.html"
+        return f"{FHIR_DOCS_BASE_URL}{self.resource_id.lower()}.html"
+
+
+class PathCardinalities:
+    """
+    Effektiv kardinalitet og fjernet-status per elementsti.
+
+    Hver sti beregnes én gang ovenfra og ned: forelderens kombinerte
+    kardinalitet mellomlagres og gjenbrukes for alle barna, og en sti er
+    fjernet hvis den selv eller forelderen er fjernet. Rotelementets egen
+    kardinalitet telles ikke med, og stier uten element (i en differential)
+    bidrar ikke.
+    """
+
+    def __init__(self, elements: List[dict]):
+        self.cardinalities: Dict[str, Cardinality] = {}
+        self.zero_paths: Set[str] = set()
+        for element in elements:
+            path = element.get('path', '')
+            if not path:
+                continue
+            max_value = element.get('max', '*')
+            # Siste element med stien (f.eks. siste slice) bestemmer kardinaliteten
+            self.cardinalities[path] = Cardinality(int(element.get('min', 0)), parse_max(max_value))
+            if max_value == '0':
+                self.zero_paths.add(path)
+                logger.debug(f"Identified zero cardinality path: {path}")
+        self._effective: Dict[str, Cardinality] = {}
+        self._removed: Dict[str, bool] = {}
+
+    def effective(self, path: str) -> Cardinality:
+        result = self._effective.get(path)
+        if result is None:
+            if '.' not in path:
+                result = Cardinality(1, 1)
+            else:
+                result = self.effective(path.rsplit('.', 1)[0])
+                if path in self.cardinalities:
+                    result = result.combine(self.cardinalities[path])
+            self._effective[path] = result
+        return result
+
+    def is_removed(self, path: str) -> bool:
+        removed = self._removed.get(path)
+        if removed is None:
+            removed = path in self.zero_paths or ('.' in path and self.is_removed(path.rsplit('.', 1)[0]))
+            self._removed[path] = removed
+        return removed
+
+
+def should_include_as_attribute(path: str, type_info: List[dict], element_by_path: Dict[str, dict]) -> bool:
+    parts = path.split('.')
+    # Direkte barn (dybde 2, f.eks. "Diagnose.code")
+    if len(parts) == 2:
+        if parts[-1] in STANDARD_ELEMENTS:
+            return False
+        return not any(t.get('code') == 'Reference' for t in type_info)
+    # Under-elementer av et BackboneElement (dybde 3, f.eks. "Diagnose.stage.summary")
+    if len(parts) == 3:
+        if parts[-1] in STANDARD_ELEMENTS:
+            return False
+        parent_element = element_by_path.get('.'.join(parts[:2]))
+        if parent_element:
+            return any(pt.get('code') == 'BackboneElement' for pt in parent_element.get('type', []))
+    return False
+
+
+def _attribute(path: str, element: dict, type_info: List[dict], cardinality: Cardinality) -> ElementRecord:
+    # Fjern klassenavnet (første del) fra elementnavnet
+    short_name = path.split('.', 1)[1] if '.' in path else path
+    type_name = "unknown"
+    if type_info:
+        if short_name.endswith('[x]'):
+            type_name = ' | '.join(t.get('code', 'unknown') for t in type_info)
+        else:
+            type_name = type_info[0].get('code', 'unknown')
+    slice_name = element.get('sliceName')
+    if not slice_name and 'slicing' in element:
+        slice_name = "sliced"
+    return ElementRecord(path=path, name=short_name, type=type_name,
+                         min=cardinality.min, max=cardinality.max, slice_name=slice_name)
+
+
+def parse_element_definition(elements: List[dict], node: ProfileNode) -> None:
+    """Finner attributter og referanser med effektiv kardinalitet."""
+    element_by_path = {}
+    for element in elements:
+        path = element.get('path', '')
+        if path:
+            element_by_path[path] = element
+
+    cardinalities = PathCardinalities(elements)
+    node.element_cardinalities = cardinalities.cardinalities
+    node.zero_cardinality_paths = cardinalities.zero_paths
+
+    for element in elements:
+        path = element.get('path', '')
+        if not path or path.count('.') < 1:
+            continue
+        if cardinalities.is_removed(path):
+            logger.debug(f"Skipping {path} - path or parent has zero cardinality")
+            continue
+        type_info = element.get('type', [])
+        effective_cardinality = cardinalities.effective(path)
+        cardinality_str = str(effective_cardinality)
+        if should_include_as_attribute(path, type_info, element_by_path):
+            node.attributes.append(_attribute(path, element, type_info, effective_cardinality))
+
+        in_extension = path.endswith('extension') or path.endswith('modifierExtension')
+        source_part = path.split('.')[0]
+        # Hele stien uten ressursnavnet, uten [x]
+        friendly_name = path[len(source_part) + 1:].replace('[x]', '')
+        for type_index, type_def in enumerate(type_info):
+            if type_def.get('code') != 'Reference':
+                continue
+            target_profiles = type_def.get('targetProfile', [])
+            for target_index, target_profile in enumerate(target_profiles):
+                target_type = strip_structure_prefix(target_profile.split('/')[-1])
+                # Unik nøkkel når det er flere mål
+                ref_key = f"{friendly_name}_to_{target_type}" if len(target_profiles) > 1 else friendly_name
+                node.references[ref_key] = ReferenceEdge(
+                    source=source_part,
+                    target=target_type,
+                    name=friendly_name,
+                    cardinality=cardinality_str,
+                    path=path,
+                    in_extension=in_extension,
+                    is_first=type_index == 0 and target_index == 0,
+                    to_extension='Extension' in target_profile
+                )
+                logger.debug(f"Found reference: {source_part} -- {friendly_name} --> {target_type} [{cardinality_str}]")
+
+
+def parse_structure_definition(profile_json: dict, filename: str) -> Optional[ProfileNode]:
+    """ProfileNode for en StructureDefinition, eller None hvis den ikke er en ressurs/datatype."""
+    if profile_json.get('kind') not in ['resource', 'complex-type']:
+        logger.debug(f"Skipping {filename} - not a resource or complex-type")
+        return None
+    return build_profile_node(profile_json, filename)
+
+
+def build_profile_node(profile_json: dict, filename: str) -> ProfileNode:
+    """ProfileNode for en StructureDefinition av alle slag (enkel-diagrammet tegner også logiske modeller)."""
+    # Id fra profilen, ellers filnavnet
+    resource_id = profile_json.get('id') or strip_structure_prefix(
+        os.path.splitext(os.path.basename(filename))[0])
+    name = None
+    for field in ['name', 'id', 'type']:
+        if profile_json.get(field):
+            name = RESOURCE_NAME_MAPPING.get(profile_json[field], profile_json[field])
+            break
+    node = ProfileNode(resource_id, name or resource_id)
+    node.type = profile_json.get('type', '')
+    node.is_local_profile = not filename.startswith("fetched-")
+    node.base_type = strip_structure_prefix(profile_json.get('baseDefinition', '').split('/')[-1])
+
+    elements = (profile_json.get('snapshot', {}).get('element', []) or
+                profile_json.get('differential', {}).get('element', []))
+    parse_element_definition(elements, node)
+    return node
+
+
+def find_structure_definitions(path: str) -> List[str]:
+    """Finn alle StructureDefinition-*.json filer i angitt sti."""
+    if os.path.isfile(path):
+        return [path] if os.path.basename(path).startswith('StructureDefinition-') else []
+    structure_files = []
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.startswith('StructureDefinition-') and file.endswith('.json'):
+                structure_files.append(os.path.join(root, file))
+    return structure_files
+
+
+class ProfileGraph:
+    """
+    Profilene som noder, med oppslag på navn, Id og basetype. Basedefinisjoner
+    for refererte typer som ikke er profiler hentes samlet med resolve_missing
+    før rendering, så structure_for aldri gjør I/O.
+    """
+
+    def __init__(self, nodes: Optional[List[ProfileNode]] = None,
+                 loader: Optional[StructureDefinitionLoader] = None):
+        self.nodes: List[ProfileNode] = []
+        self.fetched: List[ProfileNode] = []
+        self.loader = loader
+        self.by_name: Dict[str, ProfileNode] = {}
+        self.by_id: Dict[str, ProfileNode] = {}
+        self.by_base_type: Dict[str, ProfileNode] = {}
+        for node in nodes or []:
+            self.add(node)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str]) -> 'ProfileGraph':
+        graph = cls()
+        for path in paths:
+            try:
+                graph.add_file(path)
+            except Exception as e:
+                print(f"Error processing {path}: {str(e)}")
+        return graph
+
+    def _index(self, node: ProfileNode) -> None:
+        self.by_name.setdefault(node.name, node)
+        self.by_name.setdefault(get_resource_name(node.name), node)
+        self.by_id.setdefault(node.resource_id, node)
+        self.by_id.setdefault(node.display_name, node)
+
+    def add(self, node: ProfileNode) -> None:
+        self.nodes.append(node)
+        self._index(node)
+
+    def add_file(self, path: str) -> Optional[ProfileNode]:
+        node = parse_structure_definition(load_structure_definition(path), path)
+        if node is not None:
+            self.add(node)
+        return node
+
+    def structure_for(self, resource_type: str) -> Optional[ProfileNode]:
+        """Profilen med navnet eller Id-en resource_type, ellers en hentet basedefinisjon."""
+        return (self.by_name.get(resource_type) or self.by_id.get(resource_type)
+                or self.by_base_type.get(resource_type))
+
+    def resolve_missing(self, resource_types: Iterable[str]) -> None:
+        """Henter basedefinisjonene for alle typene uten profil i én runde (lokal cache først)."""
+        missing = sorted({t for t in resource_types if self.structure_for(t) is None})
+        if not missing:
+            return
+        loader = self.loader or get_default_loader()
+        urls = {resource_type: canonical_for_type(resource_type) for resource_type in missing}
+        # Bare typene prefetch ikke fikk hentet er False; de forsøkes ikke på nytt
+        fetched = prefetch(urls.values(), loader)
+        for resource_type, url in urls.items():
+            profile_json = loader.get(url) if fetched.get(url, True) else None
+            if profile_json is None:
+                print(f"Failed to fetch resource definition for {resource_type}")
+                continue
+            node = parse_structure_definition(profile_json, f"fetched-{resource_type}")
+            if node:
+                node.is_local_profile = False
+                node.resource_id = resource_type.lower()
+                self.fetched.append(node)
+                self.by_base_type.setdefault(resource_type, node)
+
+
+# ---------------------------------------------------------------- renderere
+
+def render_plantuml(graph: ProfileGraph) -> str:
+    """Oversikt: klasser med relasjoner, stereotype og lenker, uten attributter."""
+    uml = list(PLANTUML_HEADER)
+    display_to_resource_map = {node.display_name: node.resource_id for node in graph.nodes}
+
+    classes_with_relationships = set()
+    for node in graph.nodes:
+        references = [ref for ref in node.diagram_references() if not ref.in_extension]
+        if references:
+            classes_with_relationships.add(node.display_name)
+        for ref in references:
+            classes_with_relationships.add(get_resource_name(ref.target))
+
+    base_types = {}
+    for node in graph.nodes:
+        if node.display_name in classes_with_relationships:
+            base_types[node.display_name] = get_resource_name(node.base_type) if node.base_type else "Resource"
+
+    for class_name in sorted(classes_with_relationships):
+        base_type = base_types.get(class_name, "")
+        resource_id = display_to_resource_map.get(class_name)
+        if resource_id:
+            link = f"{LMDI_DOCS_BASE_URL}{resource_id}.html"
+        else:
+            link = f"{FHIR_DOCS_BASE_URL}{class_name.lower()}.html"
+        if base_type:
+            uml.append(f'class {class_name} <<{base_type}>> [[{link} {class_name} _blank]]')
+        else:
+            uml.append(f'class {class_name} [[{link} {class_name} _blank]]')
+
+    uml.append("")
+    for node in graph.nodes:
+        for ref in node.diagram_references():
+            if not ref.in_extension:
+                uml.append(f'{node.display_name} "{ref.cardinality}" --> {get_resource_name(ref.target)} : "{ref.name}"')
+    uml.extend(["", "@enduml"])
+    return "\n".join(uml)
+
+
+def _plantuml_class(uml: List[str], class_name: str, base_type: str, node: ProfileNode) -> None:
+    doc_url = node.documentation_url()
+    if base_type:
+        uml.append(f'class {class_name} <<{base_type}>> [[{doc_url} {class_name} _blank]] {{')
+    else:
+        uml.append(f'class {class_name} [[{doc_url} {class_name} _blank]] {{')
+    grouped_attributes: Dict[str, List[ElementRecord]] = {}
+    for attr in node.attributes:
+        grouped_attributes.setdefault(attr.name, []).append(attr)
+    for attr_name, attr_list in sorted(grouped_attributes.items()):
+        if len(attr_list) == 1:
+            attr = attr_list[0]
+            uml.append(f'    {attr.name} : {attr.type} [{attr.cardinality}]')
+        else:
+            for i, attr in enumerate(attr_list):
+                slice_info = f" ({attr.slice_name})" if attr.slice_name else f" (slice {i+1})"
+                uml.append(f'    {attr.name}{slice_info} : {attr.type} [{attr.cardinality}]')
+    uml.append('}')
+
+
+def render_plantuml_complete(graph: ProfileGraph) -> str:
+    """Klasser med attributter; refererte basetyper hentes og vises også."""
+    uml = list(PLANTUML_HEADER)
+    classes_with_relationships = set()
+    for node in graph.nodes:
+        references = node.diagram_references()
+        if references:
+            classes_with_relationships.add(get_resource_name(node.name))
+        for ref in references:
+            classes_with_relationships.add(get_resource_name(ref.target))
+
+    base_types = {}
+    for node in graph.nodes:
+        node_name = get_resource_name(node.name)
+        if node_name in classes_with_relationships:
+            base_types[node_name] = get_resource_name(node.base_type) if node.base_type else "Resource"
+
+    defined_classes = set()
+    for node in graph.nodes:
+        node_name = get_resource_name(node.name)
+        if node_name in classes_with_relationships and node_name not in defined_classes:
+            _plantuml_class(uml, node_name, base_types.get(node_name, ""), node)
+            defined_classes.add(node_name)
+
+    referenced_classes = sorted(classes_with_relationships - defined_classes)
+    graph.resolve_missing(referenced_classes)
+    for class_name in referenced_classes:
+        node = graph.structure_for(class_name)
+        if node:
+            _plantuml_class(uml, class_name, base_types.get(class_name, ""), node)
+        else:
+            base_type = base_types.get(class_name, "Resource")
+            uml.append(f'class {class_name} <<{base_type}>> '
+                       f'[[{FHIR_DOCS_BASE_URL}{class_name.lower()}.html {class_name} _blank]] {{')
+            uml.append('}')
+        defined_classes.add(class_name)
+
+    uml.append("")
+    for node in graph.nodes + graph.fetched:
+        for ref in node.diagram_references():
+            uml.append(f'{get_resource_name(node.name)} "{ref.cardinality}" --> {get_resource_name(ref.target)} : "{ref.name}"')
+    uml.extend(["", "@enduml"])
+    return "\n".join(uml)
+
+
+def render_plantuml_simple(node: ProfileNode) -> str:
+    """Én profil med direkte referanser (første type og første mål på hvert toppnivåelement)."""
+    uml = list(PLANTUML_HEADER)
+    uml.extend([f"class {node.simple_name}", ""])
+    references: Dict[str, ReferenceEdge] = {}
+    for ref in node.references.values():
+        if ref.depth == 1 and ref.is_first:
+            references[ref.element_name] = ref
+    for ref in references.values():
+        uml.append(f'{node.simple_name} "{ref.cardinality}" -- {get_resource_name(ref.target)} : "{ref.element_name}"')
+    uml.append("")
+    uml.append("@enduml")
+    return "\n".join(uml)
+
+
+def _overview(graph: ProfileGraph):
+    """(klassenavn -> (basetype, lenke), kanter) for oversiktsdiagrammene."""
+    classes: Dict[str, tuple] = {}
+    edges = []
+    by_name = {node.display_name: node for node in graph.nodes}
+    for node in graph.nodes:
+        for ref in node.diagram_references():
+            if ref.in_extension:
+                continue
+            target = get_resource_name(ref.target)
+            edges.append((node.display_name, target, ref))
+            classes.setdefault(node.display_name, None)
+            classes.setdefault(target, None)
+    for class_name in classes:
+        node = by_name.get(class_name)
+        if node is not None:
+            classes[class_name] = (get_resource_name(node.base_type) if node.base_type else "Resource",
+                                   f"{LMDI_DOCS_BASE_URL}{node.resource_id}.html")
+        else:
+            classes[class_name] = ("", f"{FHIR_DOCS_BASE_URL}{class_name.lower()}.html")
+    return dict(sorted(classes.items())), edges
+
+
+def _identifier(name: str) -> str:
+    return re.sub(r'\W', '_', name)
+
+
+def render_mermaid(graph: ProfileGraph) -> str:
+    """Oversikten som Mermaid classDiagram."""
+    classes, edges = _overview(graph)
+    lines = ["classDiagram"]
+    for class_name, (base_type, link) in classes.items():
+        identifier = _identifier(class_name)
+        if base_type:
+            lines.append(f"    class {identifier} {{")
+            lines.append(f"        <<{base_type}>>")
+            lines.append("    }")
+        else:
+            lines.append(f"    class {identifier}")
+        lines.append(f'    click {identifier} href "{link}" _blank')
+    for source, target, ref in edges:
+        lines.append(f'    {_identifier(source)} "{ref.cardinality}" --> {_identifier(target)} : {ref.name}')
+    return "\n".join(lines)
+
+
+def render_dot(graph: ProfileGraph) -> str:
+    """Oversikten som Graphviz DOT."""
+    classes, edges = _overview(graph)
+    lines = ["digraph profiles {",
+             '    node [shape=box, fontname="Helvetica"];',
+             '    edge [fontname="Helvetica", fontsize=10];']
+    for class_name, (base_type, link) in classes.items():
+        label = f"«{base_type}»\\n{class_name}" if base_type else class_name
+        lines.append(f'    "{class_name}" [label="{label}", URL="{link}", target="_blank"];')
+    for source, target, ref in edges:
+        lines.append(f'    "{source}" -> "{target}" [label="{ref.name}", taillabel="{ref.cardinality}"];')
+    lines.append("}")
+    return "\n".join(lines)
+
+
+# Diagramvarianter for hele grafen
+RENDERERS: Dict[str, Callable[[ProfileGraph], str]] = {
+    'plantuml': render_plantuml,
+    'plantuml-komplett': render_plantuml_complete,
+    'mermaid': render_mermaid,
+    'dot': render_dot,
+}
@@ -0,0 +1,123 @@
+"""
+Kompakte elementposter for analyse- og diagramskriptene.
+
+Skriptene lager én post per ElementDefinition ved siden av rå-dictene fra
+JSON. Postene her har __slots__, internerte path-/navnestrenger og
+kardinalitet som heltall (max = UNBOUNDED for '*'), slik at de tar en
+brøkdel av plassen til en dataclass med strengfelter.
+"""
+import sys
+from typing import Any, Optional
+
+UNBOUNDED = -1
+
+
+def intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+def parse_max(value: Any) -> int:
+    """'*' -> UNBOUNDED, '1' -> 1. Ugyldige verdier tolkes som '*'."""
+    if value == '*' or value is None:
+        return UNBOUNDED
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return UNBOUNDED
+
+
+def format_max(value: int) -> str:
+    return '*' if value == UNBOUNDED else str(value)
+
+
+class Cardinality:
+    """min..max som heltall."""
+    __slots__ = ('min', 'max')
+
+    def __init__(self, min: int = 0, max: int = UNBOUNDED):
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_element(cls, element: dict, default_min: Any = 0, default_max: Any = '*') -> 'Cardinality':
+        return cls(int(element.get('min', default_min)), parse_max(element.get('max', default_max)))
+
+    @property
+    def is_removed(self) -> bool:
+        return self.max == 0
+
+    def combine(self, child: 'Cardinality') -> 'Cardinality':
+        """Effektiv kardinalitet for child når forelderen har denne kardinaliteten."""
+        # Forelder 0..n: barnet kan mangle; forelder med min > 0 gir produktet
+        combined_min = 0 if self.min == 0 else self.min * child.min
+        if self.min == 0 and self.max == 0:
+            combined_max = 0
+        elif self.max == UNBOUNDED or child.max == UNBOUNDED:
+            combined_max = UNBOUNDED
+        else:
+            combined_max = self.max * child.max
+        return Cardinality(combined_min, combined_max)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Cardinality):
+            return NotImplemented
+        return self.min == other.min and self.max == other.max
+
+    def __hash__(self) -> int:
+        return hash((self.min, self.max))
+
+    def __str__(self) -> str:
+        return f"{self.min}..{format_max(self.max)}"
+
+    def __repr__(self) -> str:
+        return f"Cardinality({self})"
+
+
+class ElementRecord:
+    """
+    Én analysert ElementDefinition. Felles for skriptene; felter et skript
+    ikke bruker står som None. base_min/base_max er None når basen ikke
+    er kjent.
+    """
+    __slots__ = ('path', 'name', 'type', 'min', 'max', 'base_min', 'base_max',
+                 'slice_name', 'binding_name', 'slicing', 'value_set', 'attributes', 'changes')
+
+    def __init__(self, path: str, type: str = '', min: int = 0, max: int = UNBOUNDED,
+                 name: Optional[str] = None, base_min: Optional[int] = None,
+                 base_max: Optional[int] = None, slice_name: Optional[str] = None,
+                 binding_name: str = '', slicing: str = '', value_set: str = '',
+                 attributes: str = '', changes: str = ''):
+        self.path = intern(path)
+        self.name = intern(name)
+        self.type = intern(type)
+        self.min = min
+        self.max = max
+        self.base_min = base_min
+        self.base_max = base_max
+        self.slice_name = intern(slice_name)
+        self.binding_name = binding_name
+        self.slicing = slicing
+        self.value_set = value_set
+        self.attributes = attributes
+        self.changes = changes
+
+    @property
+    def cardinality(self) -> str:
+        return f"{self.min}..{format_max(self.max)}"
+
+    @property
+    def base_cardinality(self) -> str:
+        if self.base_min is None:
+            return ''
+        return f"{self.base_min}..{format_max(self.base_max)}"
+
+    @property
+    def is_removed(self) -> bool:
+        return self.max == 0
+
+    @property
+    def cardinality_changed(self) -> bool:
+        return self.min != self.base_min or self.max != self.base_max
+
+    def __repr__(self) -> str:
+        return f"ElementRecord({self.path!r}, {self.type!r}, {self.cardinality})"
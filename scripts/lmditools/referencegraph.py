@@ -0,0 +1,289 @@
+"""
+Referansegraf over alle profilene, med transitive spørringer.
+
+Hver StructureDefinition gir en node, og kantene er det profilen kan peke
+på eller inneholde:
+
+    reference   Reference med targetProfile (som i lag-noe.py references)
+    profile     type.profile på Resource-elementer (f.eks. Bundle.entry.resource)
+    invariant   profil-URL-er i invarianter som meta.profile.where($this = '...')
+                (slik LegemiddelregisterBundle angir hvilke ressurser den kan inneholde)
+
+Kardinaliteten på en kant er elementets effektive kardinalitet, propagert
+fra foreldrene (PathCardinalities i profilegraph.py), og langs en sti
+kombineres kantene med Cardinality.combine. Mål uten egen profil (f.eks.
+http://hl7.org/fhir/StructureDefinition/Patient) blir løvnoder.
+
+Grafen bygges én gang per sett av inputfiler og lagres ferdig under
+cache-katalogen, med nøkkel fra hashene av alle filene (og av koden som
+bygger grafen):
+
+    <cache>/referencegraph/<nøkkel>.pickle
+
+En spørring mot uendrede filer hasher bare filene og leser grafen; ingen
+StructureDefinition parses.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from lmditools.loader import default_cache_dir
+from lmditools.manifest import file_hash
+from lmditools.profilegraph import PathCardinalities, get_resource_name, strip_structure_prefix
+from lmditools.records import Cardinality
+from lmditools.stream import load_structure_definition
+
+logger = logging.getLogger(__name__)
+
+GRAPH_VERSION = 1
+CACHE_KEEP = 16
+RESOURCE_TYPE_CODES = {'Resource', 'DomainResource'}
+
+_PROFILE_URL = re.compile(r"'([^'\s]+/StructureDefinition/[^'\s]+)'")
+_PROFILE_TEST = re.compile(r'meta\.profile|conformsTo')
+# entry.all(resource.meta.profile... -> entry.resource
+_ALL_PROFILE = re.compile(r'^\s*([\w.]+)\.all\(\s*([\w.]+)\.meta\.profile')
+
+
+class GraphNode:
+    """Én profil (eller et mål uten profil). key er visningsnavnet, f.eks. Pasient."""
+    __slots__ = ('key', 'resource_id', 'name', 'url', 'type', 'is_local_profile', 'source')
+
+    def __init__(self, key: str, resource_id: str = '', name: str = '', url: str = '', type: str = '',
+                 is_local_profile: bool = False, source: str = ''):
+        self.key = key
+        self.resource_id = resource_id
+        self.name = name
+        self.url = url
+        self.type = type
+        self.is_local_profile = is_local_profile
+        self.source = source
+
+
+class GraphEdge:
+    __slots__ = ('source', 'target', 'path', 'kind', 'cardinality')
+
+    def __init__(self, source: str, target: str, path: str, kind: str, cardinality: Cardinality):
+        self.source = source
+        self.target = target
+        self.path = path
+        self.kind = kind
+        self.cardinality = cardinality
+
+    def to_dict(self) -> dict:
+        return {'source': self.source, 'target': self.target, 'path': self.path, 'kind': self.kind,
+                'cardinality': str(self.cardinality)}
+
+
+# (mål-URL, path, kanttype, kardinalitet)
+EdgeSpec = Tuple[str, str, str, Cardinality]
+
+
+def element_edges(elements: List[dict]) -> List[EdgeSpec]:
+    """Kantene fra én profils elementer, med effektiv kardinalitet. Fjernede elementer gir ingen kanter."""
+    cardinalities = PathCardinalities(elements)
+    edges: List[EdgeSpec] = []
+    for element in elements:
+        path = element.get('path', '')
+        if not path or cardinalities.is_removed(path):
+            continue
+        if '.' in path:
+            cardinality = cardinalities.effective(path)
+            for type_def in element.get('type', []):
+                code = type_def.get('code')
+                if code == 'Reference':
+                    edges.extend((target, path, 'reference', cardinality)
+                                 for target in type_def.get('targetProfile', []) if 'Extension' not in target)
+                elif code in RESOURCE_TYPE_CODES:
+                    edges.extend((target, path, 'profile', cardinality) for target in type_def.get('profile', []))
+        for constraint in element.get('constraint', []):
+            expression = constraint.get('expression', '')
+            if not _PROFILE_TEST.search(expression):
+                continue
+            match = _ALL_PROFILE.match(expression)
+            target_path = f"{path}.{match.group(1)}.{match.group(2)}" if match else path
+            if cardinalities.is_removed(target_path):
+                continue
+            # Hver profil er ett av flere tillatte alternativer, så ingen er påkrevd alene
+            cardinality = Cardinality(0, cardinalities.effective(target_path).max)
+            edges.extend((target, target_path, 'invariant', cardinality)
+                         for target in _PROFILE_URL.findall(expression))
+    return edges
+
+
+def path_cardinality(edges: Iterable[GraphEdge]) -> Cardinality:
+    """Kardinaliteten langs en sti: kantene kombinert fra starten."""
+    cardinality = Cardinality(1, 1)
+    for edge in edges:
+        cardinality = cardinality.combine(edge.cardinality)
+    return cardinality
+
+
+class ReferenceGraph:
+    """Nodene og kantene i begge retninger, med oppslag på navn, Id og URL."""
+
+    def __init__(self):
+        self.nodes: Dict[str, GraphNode] = {}
+        self.outgoing: Dict[str, List[GraphEdge]] = {}
+        self.incoming: Dict[str, List[GraphEdge]] = {}
+        self.aliases: Dict[str, str] = {}
+        self._edge_keys = set()
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str]) -> 'ReferenceGraph':
+        graph = cls()
+        pending: List[Tuple[str, List[EdgeSpec]]] = []
+        for path in paths:
+            try:
+                resource = load_structure_definition(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Kunne ikke lese {path}: {e}")
+                continue
+            if resource.get('resourceType') != 'StructureDefinition' or resource.get('kind') != 'resource':
+                continue
+            node = graph._add_profile(resource, path)
+            elements = (resource.get('snapshot', {}).get('element', []) or
+                        resource.get('differential', {}).get('element', []))
+            pending.append((node.key, element_edges(elements)))
+
+        # Målene løses når alle profilene er lest, så rekkefølgen på filene ikke spiller inn
+        by_url = {node.url: node.key for node in graph.nodes.values() if node.url}
+        for source, specs in pending:
+            for target_url, path, kind, cardinality in specs:
+                target = by_url.get(target_url.split('|')[0]) or graph._add_external(target_url)
+                graph._add_edge(GraphEdge(source, target, path, kind, cardinality))
+        return graph
+
+    def _alias(self, node: GraphNode) -> None:
+        for alias in (node.key, node.resource_id, node.name, node.url):
+            if alias:
+                self.aliases.setdefault(alias.lower(), node.key)
+
+    def _add_profile(self, resource: dict, path: str) -> GraphNode:
+        resource_id = resource.get('id') or strip_structure_prefix(Path(path).stem)
+        node = GraphNode(get_resource_name(resource_id), resource_id, resource.get('name', ''),
+                         resource.get('url', ''), resource.get('type', ''), True, os.path.basename(path))
+        if node.key in self.nodes:
+            logger.warning(f"{path}: {node.key} finnes fra før ({self.nodes[node.key].source})")
+            return self.nodes[node.key]
+        self.nodes[node.key] = node
+        self._alias(node)
+        return node
+
+    def _add_external(self, url: str) -> str:
+        url = url.split('|')[0]
+        key = get_resource_name(strip_structure_prefix(url.rstrip('/').split('/')[-1]))
+        if key not in self.nodes:
+            self.nodes[key] = GraphNode(key, key, key, url, key)
+            self._alias(self.nodes[key])
+        return key
+
+    def _add_edge(self, edge: GraphEdge) -> None:
+        edge_key = (edge.source, edge.target, edge.path, edge.kind)
+        if edge_key in self._edge_keys:
+            return
+        self._edge_keys.add(edge_key)
+        self.outgoing.setdefault(edge.source, []).append(edge)
+        self.incoming.setdefault(edge.target, []).append(edge)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._edge_keys)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Nodenøkkelen for et visningsnavn, Id, profilnavn eller URL (uavhengig av store/små bokstaver)."""
+        return self.aliases.get(name.split('|')[0].lower())
+
+    # ---------------------------------------------------------------- spørringer
+
+    def _shortest(self, start: str, reverse: bool = False) -> Dict[str, List[GraphEdge]]:
+        """Korteste kantliste mellom start og hver node den henger sammen med (bredde først)."""
+        chains: Dict[str, List[GraphEdge]] = {start: []}
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for edge in (self.incoming if reverse else self.outgoing).get(current, []):
+                following = edge.source if reverse else edge.target
+                if following not in chains:
+                    # Kjedene leses alltid i kantretningen
+                    chains[following] = [edge] + chains[current] if reverse else chains[current] + [edge]
+                    queue.append(following)
+        return chains
+
+    def reachable(self, start: str, via: Optional[str] = None) -> Dict[str, List[GraphEdge]]:
+        """Alle noder start når transitivt (gjennom via hvis gitt), med korteste sti til hver."""
+        chains = self._shortest(start)
+        if via is None:
+            chains.pop(start)
+            return chains
+        if via not in chains:
+            return {}
+        prefix = chains[via]
+        return {node: prefix + chain for node, chain in self._shortest(via).items() if node not in (start, via)}
+
+    def dependents(self, target: str) -> Dict[str, List[GraphEdge]]:
+        """Alle noder som transitivt refererer til target, med korteste sti fra hver."""
+        chains = self._shortest(target, reverse=True)
+        chains.pop(target)
+        return chains
+
+    def shortest_path(self, start: str, end: str, via: Optional[str] = None) -> Optional[List[GraphEdge]]:
+        if via is not None:
+            first = self.shortest_path(start, via)
+            second = self.shortest_path(via, end)
+            return None if first is None or second is None else first + second
+        return self._shortest(start).get(end)
+
+
+# ---------------------------------------------------------------- cache
+
+def _code_hash() -> str:
+    """Endres når koden som bygger grafen endres, så gamle grafer ikke brukes."""
+    modules = ('referencegraph.py', 'profilegraph.py', 'records.py', 'stream.py')
+    return ''.join(file_hash(str(Path(__file__).parent / name)) for name in modules)
+
+
+def graph_key(paths: Iterable[str]) -> str:
+    """Nøkkel fra filnavn og innholdshash for hver inputfil (rekkefølgen spiller ingen rolle)."""
+    digest = hashlib.sha256(f"{GRAPH_VERSION}:{_code_hash()}".encode('ascii'))
+    for name, content in sorted((os.path.basename(p), file_hash(p)) for p in paths):
+        digest.update(f"\n{name}:{content}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def default_graph_dir() -> Path:
+    return default_cache_dir() / 'referencegraph'
+
+
+def load_graph(paths: List[str], cache_dir: Optional[Path] = None,
+               rebuild: bool = False) -> Tuple[ReferenceGraph, bool]:
+    """
+    Grafen for filene, fra cache hvis den finnes for nøyaktig disse filene.
+    Returnerer (graf, hentet_fra_cache).
+    """
+    root = Path(cache_dir) if cache_dir else default_graph_dir()
+    cache_path = root / f"{graph_key(paths)}.pickle"
+    if not rebuild and cache_path.exists():
+        try:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f), True
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Ødelagt referansegraf i cache {cache_path}: {e}")
+
+    graph = ReferenceGraph.from_files(paths)
+    root.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=root, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_path)
+    # Behold bare de nyeste grafene
+    stored = sorted(root.glob('*.pickle'), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in stored[CACHE_KEEP:]:
+        old.unlink(missing_ok=True)
+    return graph, False
@@ -0,0 +1,291 @@
+"""
+Generering av snapshot fra differential og basedefinisjon.
+
+Basens snapshot bygges til et tre (element -> barn -> slices) i én
+gjennomgang. Differential-elementene legges deretter på ved å følge id-en
+segment for segment:
+
+- slices (identifier:FNR) opprettes som kopi av det slicede elementet
+- omdøpte choice-typer (effectiveDateTime) blir type-slices på effective[x]
+- datatyper (Identifier, CodeableConcept, ...) ekspanderes først når
+  differential peker inn i dem, og ekspansjonene gjenbrukes på tvers av
+  profiler
+- contentReference (#Bundle.link) ekspanderes fra det refererte elementet
+
+Resultatet skrives ut i snapshot-rekkefølge: element, barn, deretter slices.
+"""
+import copy
+import logging
+from typing import Dict, List, Optional
+
+from lmditools.loader import StructureDefinitionLoader, get_default_loader
+
+logger = logging.getLogger(__name__)
+
+# Datatype-/profil-URL -> elementene under roten, delt mellom alle generatorer
+_DATATYPE_CACHE: Dict[str, List[dict]] = {}
+
+_SKIP_ON_MERGE = {'id', 'path'}
+_APPEND_ON_MERGE = {'constraint', 'condition', 'mapping'}
+
+
+def _split_id(element_id: str) -> List[str]:
+    """'Patient.identifier:FNR.system' -> ['Patient', 'identifier:FNR', 'system']."""
+    parts = []
+    current = []
+    in_slice = False
+    for char in element_id:
+        if char == ':':
+            in_slice = True
+        elif char == '.' and not in_slice:
+            parts.append(''.join(current))
+            current = []
+            continue
+        elif char == '.' and in_slice:
+            # Slicenavn kan ikke inneholde punktum; neste segment starter her
+            in_slice = False
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append(''.join(current))
+    return parts
+
+
+def _element_id(element: dict) -> str:
+    if element.get('id'):
+        return element['id']
+    path = element.get('path', '')
+    if element.get('sliceName'):
+        return f"{path}:{element['sliceName']}"
+    return path
+
+
+class _Node:
+    __slots__ = ('name', 'element', 'children', 'slices', 'expanded')
+
+    def __init__(self, name: str, element: dict):
+        self.name = name
+        self.element = element
+        self.children: Dict[str, '_Node'] = {}
+        self.slices: Dict[str, '_Node'] = {}
+        self.expanded = False
+
+    def clone(self, path: str, element_id: str) -> '_Node':
+        """Dyp kopi av noden med ny path/id (elementene kopieres grunt)."""
+        node = _Node(self.name, dict(self.element, path=path, id=element_id))
+        node.expanded = self.expanded
+        for name, child in self.children.items():
+            node.children[name] = child.clone(f"{path}.{name}", f"{element_id}.{name}")
+        for name, slice_node in self.slices.items():
+            node.slices[name] = slice_node.clone(path, f"{element_id}:{name}")
+        return node
+
+
+def merge_element(base: dict, constraint: dict) -> dict:
+    """Legger differential-felter oppå et base-element uten å endre noen av dem."""
+    merged = dict(base)
+    for key, value in constraint.items():
+        if key in _SKIP_ON_MERGE:
+            continue
+        if key in _APPEND_ON_MERGE and isinstance(value, list):
+            existing = base.get(key, [])
+            seen = {item.get('key') for item in existing if isinstance(item, dict)}
+            merged[key] = existing + [item for item in value
+                                      if not (isinstance(item, dict) and item.get('key') in seen)]
+        else:
+            merged[key] = value
+    return merged
+
+
+class SnapshotGenerator:
+    """Lager snapshot for profiler; ekspanderte datatyper huskes mellom kall."""
+
+    def __init__(self, loader: Optional[StructureDefinitionLoader] = None):
+        self.loader = loader or get_default_loader()
+
+    # ---------------------------------------------------------------- tre
+
+    def _build_tree(self, elements: List[dict]) -> Optional[_Node]:
+        """Bygger treet for en flat elementliste; første element er roten."""
+        root = None
+        nodes: Dict[str, _Node] = {}
+        for element in elements:
+            element_id = _element_id(element)
+            parts = _split_id(element_id)
+            name, _, slice_name = parts[-1].partition(':')
+            node = _Node(name, element)
+            nodes[element_id] = node
+            if root is None:
+                root = node
+            elif slice_name:
+                owner = nodes.get(element_id[:element_id.rindex(':')])
+                if owner is not None:
+                    owner.slices[slice_name] = node
+            else:
+                parent = nodes.get('.'.join(parts[:-1]))
+                if parent is not None:
+                    parent.children[name] = node
+                    parent.expanded = True
+        return root
+
+    def _type_elements(self, type_def: dict) -> List[dict]:
+        """Elementene under roten til datatypen/profilen type_def peker på."""
+        urls = [p for p in type_def.get('profile', []) if self.loader.is_cached(p)]
+        code = type_def.get('code', '')
+        if not urls and code:
+            if code.startswith('http://hl7.org/fhirpath/'):
+                return []
+            urls = [f"http://hl7.org/fhir/StructureDefinition/{code}"]
+        for url in urls:
+            if url in _DATATYPE_CACHE:
+                return _DATATYPE_CACHE[url]
+            definition = self.loader.get(url)
+            if not definition:
+                continue
+            elements = definition.get('snapshot', {}).get('element', [])
+            if not elements and definition.get('differential'):
+                elements = self.generate(definition)
+            _DATATYPE_CACHE[url] = elements[1:]
+            return _DATATYPE_CACHE[url]
+        return []
+
+    def _expand(self, node: _Node, index: Dict[str, _Node]) -> None:
+        """Fyller inn barna til node fra datatypen eller contentReference."""
+        element = node.element
+        path, element_id = element['path'], _element_id(element)
+
+        reference = element.get('contentReference')
+        if reference:
+            node.expanded = True
+            target = index.get(reference.split('#')[-1])
+            if target is not None:
+                for name, child in target.children.items():
+                    node.children[name] = child.clone(f"{path}.{name}", f"{element_id}.{name}")
+            return
+
+        types = element.get('type', [])
+        if len(types) != 1:
+            # Choice-typer ekspanderes først når typen er innsnevret (i en type-slice)
+            return
+        node.expanded = True
+        elements = self._type_elements(types[0])
+        if not elements:
+            return
+        type_root = elements[0]['path'].split('.')[0]
+        rebased = []
+        for type_element in elements:
+            suffix = type_element['path'][len(type_root):]
+            type_id = _element_id(type_element)
+            rebased.append(dict(type_element,
+                                path=f"{path}{suffix}",
+                                id=f"{element_id}{type_id[len(type_root):]}"))
+        subtree = self._build_tree([dict(element, id=element_id)] + rebased)
+        if subtree is not None:
+            node.children = subtree.children
+            node.slices.update(subtree.slices)
+
+    # ---------------------------------------------------------------- differential
+
+    def _child(self, node: _Node, name: str, index: Dict[str, _Node]) -> Optional[_Node]:
+        if name in node.children:
+            return node.children[name]
+        if not node.expanded:
+            self._expand(node, index)
+            if name in node.children:
+                return node.children[name]
+        # Omdøpt choice-type: effectiveDateTime -> effective[x]:effectiveDateTime
+        for child_name, child in node.children.items():
+            if not child_name.endswith('[x]'):
+                continue
+            stem = child_name[:-3]
+            if name.startswith(stem) and len(name) > len(stem):
+                return self._slice(child, name, index, choice_type=name[len(stem):])
+        return None
+
+    def _slice(self, node: _Node, slice_name: str, index: Dict[str, _Node],
+               choice_type: Optional[str] = None) -> _Node:
+        if slice_name in node.slices:
+            return node.slices[slice_name]
+        if not node.expanded:
+            self._expand(node, index)
+        base_id = _element_id(node.element)
+        slice_node = node.clone(node.element['path'], f"{base_id}:{slice_name}")
+        slice_node.slices = {}
+        element = slice_node.element
+        element.pop('slicing', None)
+        element['sliceName'] = slice_name
+        if choice_type:
+            wanted = choice_type.lower()
+            element['type'] = [t for t in element.get('type', [])
+                               if t.get('code', '').lower() == wanted] or element.get('type', [])
+            if 'slicing' not in node.element:
+                node.element = dict(node.element, slicing={
+                    'discriminator': [{'type': 'type', 'path': '$this'}],
+                    'ordered': False, 'rules': 'open'})
+        if not slice_node.children:
+            # Typen er innsnevret her eller blir det av differential; barna hentes
+            # fra den innsnevrede typen når differential peker inn i slicen
+            slice_node.expanded = False
+        node.slices[slice_name] = slice_node
+        return slice_node
+
+    def _locate(self, root: _Node, element: dict, index: Dict[str, _Node]) -> Optional[_Node]:
+        parts = _split_id(_element_id(element))
+        node = root
+        if parts[0].split(':')[0] != root.name:
+            return None
+        for part in parts[1:]:
+            name, _, slice_name = part.partition(':')
+            node = self._child(node, name, index)
+            if node is None:
+                return None
+            if slice_name:
+                # effective[x]:effectivePeriod er en type-slice på samme måte som effectivePeriod
+                stem = name[:-3] if name.endswith('[x]') else None
+                choice_type = slice_name[len(stem):] if stem and slice_name.startswith(stem) else None
+                node = self._slice(node, slice_name, index, choice_type=choice_type or None)
+        return node
+
+    # ---------------------------------------------------------------- ut
+
+    def _flatten(self, node: _Node, out: List[dict]) -> None:
+        out.append(node.element)
+        for child in node.children.values():
+            self._flatten(child, out)
+        for slice_node in node.slices.values():
+            self._flatten(slice_node, out)
+
+    def generate(self, profile: dict, base: Optional[dict] = None) -> List[dict]:
+        """Returnerer snapshot-elementene for profile (differential + base)."""
+        differential = profile.get('differential', {}).get('element', [])
+        if base is None:
+            base = self.loader.get(profile.get('baseDefinition', ''))
+        if not base:
+            return copy.deepcopy(differential)
+        base_elements = base.get('snapshot', {}).get('element', [])
+        if not base_elements and base.get('differential'):
+            base_elements = self.generate(base)
+
+        root = self._build_tree(base_elements)
+        if root is None:
+            return copy.deepcopy(differential)
+        index: Dict[str, _Node] = {}
+
+        def register(node: _Node) -> None:
+            index[_element_id(node.element)] = node
+            for child in node.children.values():
+                register(child)
+
+        register(root)
+
+        for element in differential:
+            node = self._locate(root, element, index)
+            if node is None:
+                logger.warning(f"Fant ikke {_element_id(element)} i basen; hopper over")
+                continue
+            node.element = merge_element(node.element, element)
+
+        out: List[dict] = []
+        self._flatten(root, out)
+        return out
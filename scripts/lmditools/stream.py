@@ -0,0 +1,239 @@
+"""
+Strømmende lesing av StructureDefinition-filer.
+
+json.load leser hele filen inn som én streng og bygger hele dokumentet før
+noe element kan brukes. Ekspanderte snapshots for Bundle-baserte profiler
+er flere titalls MB. Her leses filen i blokker, og snapshot.element og
+differential.element gis ut ett element om gangen mens de parses. Alt
+annet som ikke trengs (narrativ, den andre seksjonen, ...) hoppes over uten
+å bygges opp som Python-objekter.
+
+- iter_elements(path, 'snapshot') gir elementene ett og ett
+- read_header(path) gir toppnivåfeltene og antall elementer per seksjon
+- load_structure_definition(path) bygger en dict med bare feltene og
+  seksjonene som trengs, uten å holde rådataene i minnet
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO
+
+SECTIONS = ('snapshot', 'differential')
+
+_CHUNK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_NUMBER = re.compile(r'-?[0-9][0-9.eE+\-]*|-')
+_DECODER = json.JSONDecoder()
+
+
+class _Reader:
+    """Blokkvis JSON-leser som holder bare den uleste delen av filen i minnet."""
+
+    def __init__(self, f: TextIO, chunk_size: int = _CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Leser mer inn i bufferen; false ved slutten av filen."""
+        if self.eof:
+            return False
+        # Les minst like mye som allerede ligger i bufferen, så store verdier
+        # ikke parses på nytt for hver blokk
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Neste tegn etter whitespace, uten å flytte posisjonen forbi det."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Uventet slutt på JSON-filen")
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Forventet '{char}', fant '{found}' i JSON-filen")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Parser én verdi fra posisjonen."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Et tall som går helt til bufferslutt kan fortsette i neste blokk,
+            # også når raw_decode stoppet før (f.eks. '1.' eller '2e')
+            number = _NUMBER.match(self.buf, self.pos)
+            if number is not None and number.end() == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self) -> None:
+        """Hopper over én verdi uten å bygge den."""
+        if self.peek() not in '{[':
+            self.decode()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Uventet slutt på JSON-filen")
+                continue
+            if match.group() == '"':
+                string = _STRING.match(self.buf, match.start())
+                if string is None:
+                    self.pos = match.start()
+                    if not self._fill():
+                        raise ValueError("Uavsluttet streng i JSON-filen")
+                    continue
+                self.pos = string.end()
+                continue
+            self.pos = match.end()
+            depth += 1 if match.group() in '{[' else -1
+            if depth == 0:
+                return
+
+    def members(self) -> Iterator[str]:
+        """Gir nøklene i et objekt; kalleren må lese eller hoppe over hver verdi."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def items(self) -> Iterator[None]:
+        """Gir én gang per element i en liste; kalleren leser verdien."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+@dataclass
+class StructureDefinitionHeader:
+    """Toppnivåfeltene i en StructureDefinition, uten elementlistene."""
+    path: str
+    fields: Dict[str, Any] = field(default_factory=dict)
+    keys: List[str] = field(default_factory=list)
+    element_counts: Dict[str, int] = field(default_factory=dict)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.fields.get(key, default)
+
+    def elements(self, section: str = 'snapshot') -> Iterator[dict]:
+        """Strømmer elementene i section fra filen på nytt."""
+        return iter_elements(self.path, section)
+
+    def primary_section(self) -> str:
+        """'snapshot' hvis den har elementer, ellers 'differential'."""
+        return 'snapshot' if self.element_counts.get('snapshot') else 'differential'
+
+
+def _walk(path: str, on_elements) -> Dict[str, Any]:
+    """
+    Går gjennom filen én gang. For hver seksjon kalles on_elements(section,
+    reader) når elementlisten starter; den må lese eller hoppe over listen.
+    Returnerer toppnivåfeltene med seksjonene uten 'element'.
+    """
+    fields: Dict[str, Any] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        for key in reader.members():
+            if key not in SECTIONS or reader.peek() != '{':
+                fields[key] = reader.decode()
+                continue
+            section: Dict[str, Any] = {}
+            for section_key in reader.members():
+                if section_key == 'element' and reader.peek() == '[':
+                    on_elements(key, reader)
+                else:
+                    section[section_key] = reader.decode()
+            fields[key] = section
+    return fields
+
+
+def iter_elements(path: str, section: str = 'snapshot') -> Iterator[dict]:
+    """Gir elementene i section.element ett og ett mens filen leses."""
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _Reader(f)
+        for key in reader.members():
+            if key != section or reader.peek() != '{':
+                reader.skip()
+                continue
+            for section_key in reader.members():
+                if section_key != 'element' or reader.peek() != '[':
+                    reader.skip()
+                    continue
+                for _ in reader.items():
+                    yield reader.decode()
+
+
+def read_header(path: str) -> StructureDefinitionHeader:
+    """Toppnivåfelter og antall elementer per seksjon, uten å bygge elementene."""
+    counts: Dict[str, int] = {}
+
+    def count(section: str, reader: _Reader) -> None:
+        total = 0
+        for _ in reader.items():
+            reader.skip()
+            total += 1
+        counts[section] = total
+
+    fields = _walk(path, count)
+    return StructureDefinitionHeader(
+        path=path, fields={k: v for k, v in fields.items() if k not in SECTIONS},
+        keys=list(fields), element_counts=counts)
+
+
+def load_structure_definition(path: str, sections: Optional[Sequence[str]] = SECTIONS) -> dict:
+    """
+    Bygger StructureDefinition-dicten i én gjennomgang, men bare med
+    elementene i sections; øvrige seksjoner tas med uten 'element'.
+    """
+    wanted = set(sections or ())
+    collected: Dict[str, List[dict]] = {}
+
+    def collect(section: str, reader: _Reader) -> None:
+        if section not in wanted:
+            reader.skip()
+            return
+        collected[section] = [reader.decode() for _ in reader.items()]
+
+    resource = _walk(path, collect)
+    for section, elements in collected.items():
+        resource[section]['element'] = elements
+    return resource
@@ -0,0 +1,285 @@
+"""
+Syntetiske StructureDefinitions og FSH-profiler for ytelsesmåling.
+
+Korpuset består av én basedefinisjon med valgfritt antall elementer, og et
+sett profiler på den. Størrelsen styres av CorpusSpec:
+
+- elements: antall elementer i basen (toppnivåfelter og BackboneElement-
+  grupper med barn, slik at det blir nivåer i treet)
+- slice_depth: hvor mange nivåer med slices/reslices profilene har på
+  identifier (identifier:s1, identifier:s1/s2, ...)
+- references: antall Reference-elementer per profil; de peker til andre
+  profiler i korpuset, så diagrammene får kanter
+- profiles: antall profiler
+
+Basen legges i en lokal FHIR-pakke, så skriptene løser den opp uten nett
+(LMDI_PACKAGE_DIRS + LMDI_OFFLINE=1).
+"""
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List
+
+from lmditools.loader import FHIR_CORE_CANONICAL
+from lmditools.snapshot import SnapshotGenerator
+
+BASE_TYPE = 'SyntheticResource'
+BASE_URL = f"{FHIR_CORE_CANONICAL}{BASE_TYPE}"
+PROFILE_CANONICAL = 'http://example.org/fhir/StructureDefinition/'
+PACKAGE_ID = 'synthetic.fhir.base#1.0.0'
+
+# Antall barn per BackboneElement-gruppe
+GROUP_SIZE = 8
+
+
+@dataclass
+class CorpusSpec:
+    elements: int = 100
+    slice_depth: int = 1
+    references: int = 5
+    profiles: int = 10
+
+
+@dataclass
+class Corpus:
+    """Stier til et skrevet korpus."""
+    root: Path
+    package_dir: Path
+    profiles_dir: Path
+    fsh_dir: Path
+    snapshot_file: Path
+
+
+def profile_id(index: int) -> str:
+    return f"SyntheticProfile{index}"
+
+
+def _element(path: str, min: int, max: str, type_code: str, short: str, **extra) -> dict:
+    element = {
+        'id': path,
+        'path': path,
+        'short': short,
+        'definition': f"Definisjon av {path}.",
+        'comment': f"Kommentar til {path}.",
+        'min': min,
+        'max': max,
+        'base': {'path': path, 'min': min, 'max': max},
+        'type': [{'code': type_code}],
+    }
+    element.update(extra)
+    return element
+
+
+def _field_names(spec: CorpusSpec) -> List[str]:
+    """Toppnivåfeltene i basen (uten identifier og referansene)."""
+    budget = max(spec.elements - 4 - 3 * max(spec.references, 0), 0)
+    names = []
+    group = 0
+    while budget > 0:
+        if len(names) % 5 == 4 and budget > GROUP_SIZE:
+            names.append(f"group{group}")
+            group += 1
+            budget -= GROUP_SIZE + 1
+        else:
+            names.append(f"field{len(names)}")
+            budget -= 1
+    return names
+
+
+def base_definition(spec: CorpusSpec) -> dict:
+    """Basedefinisjonen med snapshot på spec.elements elementer."""
+    elements = [{
+        'id': BASE_TYPE, 'path': BASE_TYPE, 'short': 'Syntetisk ressurs',
+        'definition': 'Syntetisk ressurs for ytelsesmåling.', 'min': 0, 'max': '*',
+        'base': {'path': BASE_TYPE, 'min': 0, 'max': '*'},
+    }]
+    elements.append(_element(f"{BASE_TYPE}.identifier", 0, '*', 'BackboneElement', 'Identifikator'))
+    elements.append(_element(f"{BASE_TYPE}.identifier.system", 0, '1', 'uri', 'System'))
+    elements.append(_element(f"{BASE_TYPE}.identifier.value", 0, '1', 'string', 'Verdi'))
+    for name in _field_names(spec):
+        path = f"{BASE_TYPE}.{name}"
+        if name.startswith('group'):
+            elements.append(_element(path, 0, '*', 'BackboneElement', f"Gruppe {name}"))
+            for child in range(GROUP_SIZE):
+                elements.append(_element(f"{path}.item{child}", 0, '1', 'string', f"Felt {child} i {name}"))
+        else:
+            elements.append(_element(path, 0, '1', 'string', f"Felt {name}"))
+    for ref in range(spec.references):
+        path = f"{BASE_TYPE}.ref{ref}"
+        elements.append(_element(path, 0, '1', 'BackboneElement', f"Referansegruppe {ref}"))
+        elements.append(_element(f"{path}.target", 0, '1', 'Reference', f"Referanse {ref}"))
+        elements.append(_element(f"{path}.note", 0, '1', 'string', f"Merknad {ref}"))
+    return {
+        'resourceType': 'StructureDefinition',
+        'id': BASE_TYPE,
+        'url': BASE_URL,
+        'name': BASE_TYPE,
+        'status': 'draft',
+        'fhirVersion': '4.0.1',
+        'kind': 'resource',
+        'abstract': False,
+        'type': BASE_TYPE,
+        'baseDefinition': f"{FHIR_CORE_CANONICAL}DomainResource",
+        'derivation': 'specialization',
+        'snapshot': {'element': elements},
+    }
+
+
+def _slice_names(depth: int) -> List[str]:
+    """['s1', 's1/s2', ...] for reslicing ned til depth nivåer."""
+    names = []
+    for level in range(1, depth + 1):
+        names.append('/'.join(f"s{n}" for n in range(1, level + 1)))
+    return names
+
+
+def profile_differential(spec: CorpusSpec, index: int) -> List[dict]:
+    """Differential for profil nummer index."""
+    root = BASE_TYPE
+    elements: List[dict] = [{'id': root, 'path': root}]
+    for slice_name in _slice_names(spec.slice_depth):
+        owner = f"{root}.identifier" if '/' not in slice_name else \
+            f"{root}.identifier:{slice_name.rsplit('/', 1)[0]}"
+        elements.append({'id': owner, 'path': f"{root}.identifier", 'slicing': {
+            'discriminator': [{'type': 'value', 'path': 'system'}], 'rules': 'open'}})
+        slice_id = f"{root}.identifier:{slice_name}"
+        elements.append({'id': slice_id, 'path': f"{root}.identifier", 'sliceName': slice_name,
+                         'min': 0, 'max': '1', 'short': f"Slice {slice_name}"})
+        elements.append({'id': f"{slice_id}.system", 'path': f"{root}.identifier.system",
+                         'min': 1, 'patternUri': f"urn:oid:2.16.578.1.{index}.{slice_name.count('/')}"})
+    for position, name in enumerate(_field_names(spec)):
+        path = f"{root}.{name}"
+        if position % 7 == 6:
+            elements.append({'id': path, 'path': path, 'max': '0'})
+        elif position % 3 == 0:
+            elements.append({'id': path, 'path': path, 'min': 1, 'mustSupport': True,
+                             'short': f"Profilert {name}"})
+        elif name.startswith('group'):
+            elements.append({'id': f"{path}.item0", 'path': f"{path}.item0", 'min': 1,
+                             'definition': f"Profilert definisjon av {name}.item0."})
+    for ref in range(spec.references):
+        path = f"{root}.ref{ref}.target"
+        target = profile_id((index + ref + 1) % max(spec.profiles, 1))
+        elements.append({'id': path, 'path': path, 'min': ref % 2,
+                         'type': [{'code': 'Reference',
+                                   'targetProfile': [f"{PROFILE_CANONICAL}{target}"]}]})
+    return elements
+
+
+def profile_definition(spec: CorpusSpec, index: int, base: dict,
+                       generator: SnapshotGenerator) -> dict:
+    name = profile_id(index)
+    profile = {
+        'resourceType': 'StructureDefinition',
+        'id': name,
+        'url': f"{PROFILE_CANONICAL}{name}",
+        'name': name,
+        'title': f"Syntetisk profil {index}",
+        'status': 'draft',
+        'description': f"Syntetisk profil {index} for ytelsesmåling.",
+        'purpose': 'Ytelsesmåling.',
+        'fhirVersion': '4.0.1',
+        'kind': 'resource',
+        'abstract': False,
+        'type': BASE_TYPE,
+        'baseDefinition': BASE_URL,
+        'derivation': 'constraint',
+        'differential': {'element': profile_differential(spec, index)},
+    }
+    profile['snapshot'] = {'element': generator.generate(profile, base)}
+    return profile
+
+
+def _fsh_string(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def fsh_profile(spec: CorpusSpec, index: int) -> str:
+    """Samme profil som profile_definition, skrevet som FSH."""
+    name = profile_id(index)
+    lines = [
+        f"Profile: {name}",
+        f"Parent: {BASE_TYPE}",
+        f"Id: {name}",
+        f'Title: "Syntetisk profil {index}"',
+        'Description: """',
+        f"Syntetisk profil {index} for ytelsesmåling.",
+        'Beskrivelsen går over flere linjer.',
+        '"""',
+        '* insert SyntheticMetadata',
+    ]
+    slice_names = _slice_names(spec.slice_depth)
+    if slice_names:
+        lines.extend([
+            '* identifier ^slicing.discriminator.type = #value',
+            '* identifier ^slicing.discriminator.path = "system"',
+            '* identifier ^slicing.rules = #open',
+            f"* identifier contains {slice_names[0]} 0..1",
+            f'* identifier[{slice_names[0]}] ^short = "Slice {slice_names[0]}"',
+            f"* identifier[{slice_names[0]}].system 1..1",
+            f"* identifier[{slice_names[0]}].system = \"urn:oid:2.16.578.1.{index}.0\" (exactly)",
+        ])
+        for slice_name in slice_names[1:]:
+            owner, _, child = slice_name.rpartition('/')
+            lines.extend([
+                f"* identifier[{owner}] contains {child} 0..1",
+                f"* identifier[{slice_name}].system 1..1",
+            ])
+    for position, field_name in enumerate(_field_names(spec)):
+        if position % 7 == 6:
+            lines.append(f"* {field_name} 0..0")
+        elif position % 3 == 0:
+            lines.append(f"* {field_name} 1..1 MS")
+            lines.append(f'* {field_name} ^short = "{_fsh_string("Profilert " + field_name)}"')
+        elif field_name.startswith('group'):
+            lines.append(f"* {field_name}.item0 1..1")
+            lines.append(f'* {field_name}.item0 ^definition = "Profilert definisjon av {field_name}.item0."')
+    for ref in range(spec.references):
+        target = profile_id((index + ref + 1) % max(spec.profiles, 1))
+        lines.append(f"* ref{ref}.target {ref % 2}..1")
+        lines.append(f"* ref{ref}.target only Reference({target})")
+    return '\n'.join(lines) + '\n'
+
+
+FSH_RULESET = '''RuleSet: SyntheticMetadata
+* ^status = #draft
+* ^publisher = "Syntetisk"
+'''
+
+
+def write_corpus(spec: CorpusSpec, directory: str) -> Corpus:
+    """Skriver base-pakke, JSON-profiler og FSH-profiler under directory."""
+    root = Path(directory)
+    package_dir = root / 'packages'
+    package = package_dir / PACKAGE_ID / 'package'
+    profiles_dir = root / 'profiles'
+    fsh_dir = root / 'fsh'
+    for path in (package, profiles_dir, fsh_dir):
+        path.mkdir(parents=True, exist_ok=True)
+
+    base = base_definition(spec)
+    base_file = f"StructureDefinition-{BASE_TYPE}.json"
+    name, version = PACKAGE_ID.split('#')
+    _write_json(package / 'package.json', {'name': name, 'version': version, 'fhirVersions': ['4.0.1']})
+    _write_json(package / '.index.json', {'index-version': 1, 'files': [{
+        'filename': base_file, 'resourceType': 'StructureDefinition', 'id': BASE_TYPE,
+        'url': BASE_URL, 'kind': 'resource', 'type': BASE_TYPE}]})
+    _write_json(package / base_file, base)
+
+    generator = SnapshotGenerator()
+    for index in range(spec.profiles):
+        profile = profile_definition(spec, index, base, generator)
+        _write_json(profiles_dir / f"StructureDefinition-{profile['id']}.json", profile)
+        with open(fsh_dir / f"{profile['id']}.fsh", 'w', encoding='utf-8') as f:
+            f.write(fsh_profile(spec, index))
+    with open(fsh_dir / 'rulesets.fsh', 'w', encoding='utf-8') as f:
+        f.write(FSH_RULESET)
+    _write_json(root / 'spec.json', asdict(spec))
+
+    return Corpus(root=root, package_dir=package_dir, profiles_dir=profiles_dir, fsh_dir=fsh_dir,
+                  snapshot_file=profiles_dir / f"StructureDefinition-{profile_id(0)}.json")
+
+
+def _write_json(path: Path, data: dict) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,205 @@
+"""
+Radmodell og utskrift for tekstrapporten i analyser-tekster.py.
+
+Analysen bygger én TextReport per profil med én TextRow per egenskap
+(short, definition, comment og binding) for hvert element og hver slice,
+med både profilens verdi og baseverdien. Emitterne skriver rapporten som
+Markdown (samme tabell som før), CSV eller JSON. Hver rapport formateres
+ferdig i minnet og skrives til filhåndtaket med ett kall.
+"""
+import csv
+import io
+import json
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+BINDING_NAME_URL = 'http://hl7.org/fhir/StructureDefinition/elementdefinition-bindingName'
+
+CSV_COLUMNS = ['file', 'profile', 'element', 'path', 'slice', 'property', 'value', 'base_value', 'changed']
+
+
+class TextRow:
+    """
+    Én egenskap for ett element eller én slice. value er teksten som vises
+    (profilens tekst, ellers basens); for bindinger er binding satt og
+    value er valueSet.
+    """
+    __slots__ = ('element', 'path', 'slice_name', 'property', 'value', 'base_value', 'binding')
+
+    def __init__(self, element: str, path: str, property: str, value: str = '', base_value: str = '',
+                 slice_name: str = '', binding: Optional[dict] = None):
+        self.element = element
+        self.path = path
+        self.slice_name = slice_name
+        self.property = property
+        self.value = value
+        self.base_value = base_value
+        self.binding = binding
+
+    @property
+    def is_slice(self) -> bool:
+        return bool(self.slice_name)
+
+    @property
+    def changed(self) -> bool:
+        """Teksten er satt i profilen (slices regnes alltid som endret)."""
+        return bool(self.value) and (self.is_slice or self.value != self.base_value)
+
+    def to_dict(self) -> dict:
+        data = {'element': self.element, 'path': self.path, 'slice': self.slice_name or None,
+                'property': self.property, 'value': self.value, 'base_value': self.base_value,
+                'changed': self.changed}
+        if self.binding is not None:
+            data['binding'] = self.binding
+        return data
+
+
+class TextReport:
+    """Tekstene i én profil sammenlignet med basen."""
+
+    def __init__(self, source: str, name: str, base_type: str):
+        self.source = source
+        self.name = name
+        self.base_type = base_type
+        self.profile_properties: List[Tuple[str, str]] = []
+        self.rows: List[TextRow] = []
+
+
+# ---------------------------------------------------------------- Markdown
+
+def escape_markdown(text: str) -> str:
+    if not text:
+        return ''
+
+    escaped = text
+    escaped = escaped.replace('\\', '\\\\')
+    escaped = escaped.replace('|', '\\|')
+    special_chars = ['*', '_', '`', '[', ']', '(', ')', '#', '+', '-', '.', '!']
+    for char in special_chars:
+        escaped = escaped.replace(char, '\\' + char)
+    escaped = escaped.replace('\n', '<br>')
+    escaped = escaped.replace('\r', '')
+
+    return escaped
+
+
+def format_value(value: str, base_value: str, is_slice: bool = False) -> str:
+    if not value:
+        return ''
+
+    escaped_value = escape_markdown(value)
+
+    # For slices eller når verdien er forskjellig fra base
+    if is_slice or value != base_value:
+        return f"**{escaped_value}**"
+
+    return escaped_value
+
+
+def binding_name(binding: dict) -> str:
+    for ext in binding.get('extension', []):
+        if ext.get('url') == BINDING_NAME_URL:
+            return ext.get('valueString', '')
+    return ''
+
+
+def format_binding(binding: dict) -> str:
+    if not binding:
+        return ''
+
+    # Capitalize strength
+    strength = binding.get('strength', '')
+    if strength:
+        strength = strength[0].upper() + strength[1:]
+
+    # Escape alle verdier individuelt før de kombineres
+    strength = escape_markdown(strength)
+    name = escape_markdown(binding_name(binding))
+    value_set = escape_markdown(binding.get('valueSet', ''))
+    description = escape_markdown(binding.get('description', ''))
+
+    binding_text = f"{strength} binding: "
+    if name and value_set:
+        binding_text += f"[{name}]({value_set})"
+    elif value_set:
+        binding_text += f"[{value_set}]({value_set})"
+    if description:
+        binding_text += f": <br> {description}"
+
+    return binding_text
+
+
+def markdown_lines(report: TextReport) -> List[str]:
+    lines = [f"# {escape_markdown(report.name)} : {report.base_type}", "",
+             "## Profilinformasjon", "",
+             "| Egenskap | Verdi |",
+             "|-----------|-------|"]
+    for prop, value in report.profile_properties:
+        lines.append(f"| {prop.capitalize()} | {escape_markdown(value)} |")
+    lines.extend(["", "## Elementinformasjon", "",
+                  "| Elementnavn | Egenskap | Tekst |",
+                  "|------------------|-----------|-----------------------------------------------|"])
+    previous = None
+    for row in report.rows:
+        if row.binding is not None:
+            formatted = format_binding(row.binding)
+            if formatted:
+                lines.append(f"| | Binding | {formatted} |")
+            continue
+        # Elementnavnet står bare på første rad for elementet eller slicen
+        name = row.element if (row.element, row.slice_name) != previous else ''
+        previous = (row.element, row.slice_name)
+        formatted = format_value(row.value, row.base_value, row.is_slice)
+        lines.append(f"| {name} | {row.property.capitalize()} | {formatted} |" if name
+                     else f"| | {row.property.capitalize()} | {formatted} |")
+    return lines
+
+
+def write_markdown(report: TextReport, out: TextIO) -> None:
+    out.write('\n'.join(markdown_lines(report)) + '\n')
+
+
+# ---------------------------------------------------------------- CSV og JSON
+
+def _plain_binding(binding: Optional[dict]) -> str:
+    if not binding:
+        return ''
+    return f"{binding.get('strength', '')} {binding_name(binding) or binding.get('valueSet', '')}".strip()
+
+
+def write_csv_header(out: TextIO) -> None:
+    csv.writer(out, lineterminator='\n').writerow(CSV_COLUMNS)
+
+
+def write_csv(report: TextReport, out: TextIO, header: bool = True) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for prop, value in report.profile_properties:
+        writer.writerow([report.source, report.name, '', '', '', prop, value, '', ''])
+    for row in report.rows:
+        value = _plain_binding(row.binding) if row.binding is not None else row.value
+        writer.writerow([report.source, report.name, row.element, row.path, row.slice_name,
+                         row.property, value, row.base_value, 'true' if row.changed else 'false'])
+    out.write(buffer.getvalue())
+
+
+def report_dict(report: TextReport) -> dict:
+    return {
+        'file': report.source,
+        'profile': report.name,
+        'baseType': report.base_type,
+        'properties': dict(report.profile_properties),
+        'rows': [row.to_dict() for row in report.rows],
+    }
+
+
+def write_json(report: TextReport, out: TextIO) -> None:
+    out.write(json.dumps(report_dict(report), ensure_ascii=False, indent=2) + '\n')
+
+
+EMITTERS: Dict[str, Callable[[TextReport, TextIO], None]] = {
+    'markdown': write_markdown,
+    'csv': write_csv,
+    'json': write_json,
+}
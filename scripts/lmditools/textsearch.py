@@ -0,0 +1,210 @@
+"""
+Fulltekstsøk i dokumentasjonen til profilene og basepakkene.
+
+Indeksen er en SQLite-database med en FTS5-tabell (invertert indeks med
+BM25-rangering) over short, definition, comment, description og purpose.
+Hver tekst lagres med kilden (profilfil eller pakke), profilnavn, path,
+slice og egenskap, slik at treffene kan vises i sammenheng.
+
+Indeksen oppdateres per kilde: en profilfil indekseres på nytt bare når
+innholdet er endret (mtime og størrelse, deretter sha256), og en pakke
+indekseres én gang per versjon. Søk går mot den ferdige indeksen og tar
+millisekunder også med hele R4-kjernepakken.
+
+    <cache>/tekstsok.sqlite
+"""
+import re
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from lmditools.loader import default_cache_dir
+
+SCHEMA_VERSION = 1
+SEARCH_PROPERTIES = ('short', 'definition', 'comment', 'description', 'purpose')
+ELEMENT_PROPERTIES = ('short', 'definition', 'comment')
+RESOURCE_PROPERTIES = ('description', 'purpose')
+
+PROFILE_KIND = 'profil'
+PACKAGE_KIND = 'pakke'
+
+# (profil, path, slice, egenskap, tekst)
+Entry = Tuple[str, str, str, str, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sources(source TEXT PRIMARY KEY, kind TEXT, fingerprint TEXT);
+CREATE TABLE IF NOT EXISTS entries(
+    id INTEGER PRIMARY KEY, source TEXT, profile TEXT, path TEXT, slice TEXT, property TEXT, text TEXT);
+CREATE INDEX IF NOT EXISTS entries_source ON entries(source);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    text, content='entries', content_rowid='id', tokenize='unicode61 remove_diacritics 0');
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts(entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def default_index_path() -> Path:
+    return default_cache_dir() / 'tekstsok.sqlite'
+
+
+def match_expression(query: str) -> str:
+    """
+    Gjør et søk om til et FTS5-uttrykk der alle ordene må finnes. "..." er en
+    frase, og ord* matcher prefiks. Spesialtegn i søket tolkes aldri som
+    FTS5-syntaks.
+    """
+    terms = []
+    for phrase, word in _QUERY_TOKEN.findall(query):
+        words = _WORD.findall(phrase or word)
+        if not words:
+            continue
+        if phrase:
+            terms.append('"' + ' '.join(words) + '"')
+        else:
+            prefix = '*' if word.endswith('*') else ''
+            terms.extend(f'"{w}"' for w in words[:-1])
+            terms.append(f'"{words[-1]}"{prefix}')
+    return ' AND '.join(terms)
+
+
+def structure_entries(resource: dict, section: str = 'differential') -> Iterator[Entry]:
+    """
+    Tekstene en StructureDefinition selv definerer: description og purpose,
+    og short/definition/comment for elementene i section (snapshot hvis
+    section mangler). Like tekster på samme path gis bare én gang.
+    """
+    name = resource.get('name', '') or resource.get('id', '')
+    for prop in RESOURCE_PROPERTIES:
+        if resource.get(prop):
+            yield name, '', '', prop, resource[prop]
+    elements = (resource.get(section) or resource.get('snapshot') or {}).get('element', [])
+    seen = set()
+    for element in elements:
+        path = element.get('path', '')
+        slice_name = element.get('sliceName', '')
+        for prop in ELEMENT_PROPERTIES:
+            text = element.get(prop)
+            if not text or (path, slice_name, prop, text) in seen:
+                continue
+            seen.add((path, slice_name, prop, text))
+            yield name, path, slice_name, prop, text
+
+
+class SearchHit:
+    """Ett treff, med snippet der søkeordene er markert med [ ]."""
+    __slots__ = ('source', 'kind', 'profile', 'path', 'slice_name', 'property', 'snippet', 'score')
+
+    def __init__(self, source: str, kind: str, profile: str, path: str, slice_name: str, property: str,
+                 snippet: str, score: float):
+        self.source = source
+        self.kind = kind
+        self.profile = profile
+        self.path = path
+        self.slice_name = slice_name
+        self.property = property
+        self.snippet = snippet
+        self.score = score
+
+    @property
+    def location(self) -> str:
+        """'Pasient Patient.identifier:fnr' (path og slice i profilen)."""
+        path = f"{self.path}:{self.slice_name}" if self.slice_name else self.path
+        return f"{self.profile} {path}".strip()
+
+    def to_dict(self) -> dict:
+        return {'source': self.source, 'kind': self.kind, 'profile': self.profile, 'path': self.path,
+                'slice': self.slice_name or None, 'property': self.property, 'snippet': self.snippet,
+                'score': round(-self.score, 3)}
+
+
+class TextSearchIndex:
+    """Den inverterte indeksen på disk."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else default_index_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(_SCHEMA)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(SCHEMA_VERSION):
+            self.clear()
+
+    def __enter__(self) -> 'TextSearchIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def clear(self) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM sources")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+
+    # ---------------------------------------------------------------- kilder
+
+    def fingerprint(self, source: str) -> Optional[str]:
+        row = self.db.execute("SELECT fingerprint FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def sources(self, kind: str, prefix: str = '') -> List[str]:
+        rows = self.db.execute("SELECT source FROM sources WHERE kind = ? AND substr(source, 1, ?) = ?",
+                               (kind, len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    def set_fingerprint(self, source: str, fingerprint: str) -> None:
+        with self.db:
+            self.db.execute("UPDATE sources SET fingerprint = ? WHERE source = ?", (fingerprint, source))
+
+    def replace_source(self, source: str, kind: str, fingerprint: str, entries: Iterable[Entry]) -> int:
+        """Erstatter alle tekstene fra source i én transaksjon."""
+        rows = [(source, *entry) for entry in entries]
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE source = ?", (source,))
+            self.db.executemany(
+                "INSERT INTO entries(source, profile, path, slice, property, text) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (source, kind, fingerprint))
+        return len(rows)
+
+    def remove_source(self, source: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE source = ?", (source,))
+            self.db.execute("DELETE FROM sources WHERE source = ?", (source,))
+
+    def count(self) -> int:
+        return self.db.execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    # ---------------------------------------------------------------- søk
+
+    def search(self, query: str, limit: int = 20, properties: Optional[Sequence[str]] = None,
+               kind: Optional[str] = None) -> List[SearchHit]:
+        """Treffene rangert med BM25 (best først)."""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        sql = ["SELECT e.source, s.kind, e.profile, e.path, e.slice, e.property,",
+               "       snippet(entries_fts, 0, '[', ']', '…', 16), bm25(entries_fts)",
+               "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid",
+               "JOIN sources s ON s.source = e.source",
+               "WHERE entries_fts MATCH ?"]
+        params: list = [expression]
+        if properties:
+            sql.append(f"AND e.property IN ({', '.join('?' * len(properties))})")
+            params.extend(properties)
+        if kind:
+            sql.append("AND s.kind = ?")
+            params.append(kind)
+        sql.append("ORDER BY bm25(entries_fts) LIMIT ?")
+        params.append(limit)
+        return [SearchHit(*row) for row in self.db.execute('\n'.join(sql), params)]
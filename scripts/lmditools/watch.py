@@ -0,0 +1,81 @@
+"""
+Overvåking av kildekataloger for overvak-profiler.py.
+
+Poller sammenligner (mtime, størrelse) for filene i katalogene mellom hver
+runde og gir stiene som er lagt til, endret eller slettet. Det brukes bare
+os.scandir, så det virker likt på Windows, macOS og Linux uten inotify.
+Et intervall på et halvt sekund koster lite for noen hundre filer.
+"""
+import importlib.util
+import os
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+Stamp = Tuple[int, int]
+
+
+def scan(directories: Iterable[str], suffixes: Tuple[str, ...]) -> Dict[str, Stamp]:
+    """sti -> (mtime_ns, størrelse) for alle filer med suffixes under directories."""
+    stamps: Dict[str, Stamp] = {}
+    pending: List[str] = [d for d in directories if os.path.isdir(d)]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(entry.path)
+            elif entry.name.endswith(suffixes):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                stamps[os.path.abspath(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def changed_paths(before: Dict[str, Stamp], after: Dict[str, Stamp]) -> Set[str]:
+    """Stier som er lagt til, endret eller slettet."""
+    changed = {path for path, stamp in after.items() if before.get(path) != stamp}
+    changed.update(path for path in before if path not in after)
+    return changed
+
+
+class Poller:
+    def __init__(self, directories: List[str], suffixes: Tuple[str, ...], interval: float = 0.5):
+        self.directories = directories
+        self.suffixes = suffixes
+        self.interval = interval
+        self.stamps = scan(directories, suffixes)
+
+    def poll(self) -> Set[str]:
+        """Endringer siden forrige kall."""
+        stamps = scan(self.directories, self.suffixes)
+        changed = changed_paths(self.stamps, stamps)
+        self.stamps = stamps
+        return changed
+
+    def changes(self) -> Iterator[Set[str]]:
+        """Gir hver ikke-tomme endringsmengde; venter til skrivingen har roet seg."""
+        while True:
+            time.sleep(self.interval)
+            changed = self.poll()
+            if not changed:
+                continue
+            # Editorer skriver ofte i flere steg; ta med det som kommer like etter
+            time.sleep(min(self.interval, 0.1))
+            changed |= self.poll()
+            yield changed
+
+
+def load_script(path: Path) -> ModuleType:
+    """Importerer et skript med bindestrek i navnet (f.eks. les-tekster.py) som modul."""
+    name = path.stem.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Måler ytelsen til skriptene på syntetiske korpus av økende størrelse.
+
+For hver størrelse skrives et korpus (se lmditools/synthetic.py) til en
+midlertidig katalog, og hvert skript kjøres ende til ende som egen prosess
+med base-pakken i LMDI_PACKAGE_DIRS og uten nettverk. Korteste tid av
+--repeat kjøringer brukes. Resultatet skrives som JSON.
+
+Skaleringseksponenten per skript beregnes mellom påfølgende størrelser
+(log(t2/t1) / log(n2/n1), etter at oppstartstiden til Python er trukket
+fra). Eksponent over --max-exponent flagges som kvadratisk oppførsel.
+Med --compare sammenlignes tidene med en tidligere resultatfil.
+Avslutningskoden er 1 hvis noe er flagget, slik at CI kan feile på det.
+
+Eksempel:
+    python mal-ytelse.py --sizes 100,400,1600 -o ytelse.json
+    python mal-ytelse.py --compare ytelse.json -o ytelse-ny.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from lmditools.synthetic import Corpus, CorpusSpec, write_corpus
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+RESULTS_VERSION = 1
+
+# Skript -> argumenter for et korpus
+TOOLS: Dict[str, Callable[[Corpus], List[str]]] = {
+    'lag-noe': lambda c: [str(c.snapshot_file), 'tree'],
+    'analyser-elementer': lambda c: [str(c.profiles_dir)],
+    'analyser-tekster': lambda c: [str(c.profiles_dir)],
+    'les-tekster': lambda c: [str(c.fsh_dir)],
+    'vis-profilendringer': lambda c: [str(c.profiles_dir)],
+    'lag-diagrammer': lambda c: [str(c.fsh_dir)],
+    'lag-plantuml-diagrammer': lambda c: [str(c.profiles_dir)],
+    'lag-plantuml-enkel-diagrammer': lambda c: [str(c.snapshot_file)],
+    'lag-plantuml-komplette-diagrammer': lambda c: [str(c.profiles_dir)],
+}
+
+# Tider under dette (sekunder, etter oppstart) er for støyete til å si noe om skalering
+NOISE_FLOOR = 0.05
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Mål ytelsen til skriptene på syntetiske profiler.")
+    parser.add_argument("--sizes", default="100,400,1600",
+                        help="Antall elementer i basen, kommaseparert (standard: 100,400,1600)")
+    parser.add_argument("--profiles", type=int, default=10, help="Antall profiler per korpus (standard: 10)")
+    parser.add_argument("--references", type=int, default=5, help="Referanser per profil (standard: 5)")
+    parser.add_argument("--slice-depth", type=int, default=2, help="Nivåer med slices (standard: 2)")
+    parser.add_argument("--repeat", type=int, default=3, help="Kjøringer per måling (standard: 3)")
+    parser.add_argument("--tools", help=f"Kommaseparert utvalg av: {', '.join(TOOLS)}")
+    parser.add_argument("--timeout", type=float, default=600, help="Tidsgrense per kjøring i sekunder")
+    parser.add_argument("--max-exponent", type=float, default=1.5,
+                        help="Skaleringseksponent som flagges (standard: 1.5)")
+    parser.add_argument("--compare", help="Tidligere resultatfil å sammenligne med")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Relativ økning mot --compare som flagges (standard: 1.25)")
+    parser.add_argument("--keep", help="Behold korpusene i denne katalogen")
+    parser.add_argument("-o", "--output", default="ytelse.json", help="Resultatfil (standard: ytelse.json)")
+    return parser.parse_args()
+
+
+def time_command(command: List[str], env: Dict[str, str], repeat: int, timeout: float) -> dict:
+    runs = []
+    returncode = 0
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        try:
+            completed = subprocess.run(command, env=env, cwd=SCRIPTS_DIR, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+            returncode = completed.returncode
+        except subprocess.TimeoutExpired:
+            runs.append(timeout)
+            returncode = -1
+            break
+        runs.append(time.perf_counter() - start)
+        if returncode != 0:
+            print(completed.stderr.decode('utf-8', 'replace')[-2000:], file=sys.stderr)
+            break
+    return {'seconds': min(runs), 'runs': runs, 'returncode': returncode}
+
+
+def startup_time(env: Dict[str, str], repeat: int) -> float:
+    """Tiden det tar å starte Python og importere lmditools."""
+    command = [sys.executable, '-c', 'import lmditools.loader']
+    return time_command(command, env, repeat, 60)['seconds']
+
+
+def scaling(results: List[dict], startup: float, max_exponent: float) -> Dict[str, dict]:
+    """Skaleringseksponent mellom påfølgende størrelser per skript."""
+    by_tool: Dict[str, List[dict]] = {}
+    for result in results:
+        if result['returncode'] == 0:
+            by_tool.setdefault(result['tool'], []).append(result)
+    report = {}
+    for tool, rows in by_tool.items():
+        rows.sort(key=lambda r: r['elements'])
+        exponents = []
+        for small, large in zip(rows, rows[1:]):
+            t1 = small['seconds'] - startup
+            t2 = large['seconds'] - startup
+            if t2 < NOISE_FLOOR or t1 <= 0:
+                continue
+            exponents.append(math.log(t2 / t1) / math.log(large['elements'] / small['elements']))
+        worst = max(exponents) if exponents else None
+        report[tool] = {
+            'exponents': [round(e, 3) for e in exponents],
+            'flagged': worst is not None and worst > max_exponent,
+        }
+    return report
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> List[dict]:
+    """Målinger som er mer enn threshold ganger tregere enn i baseline."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['tool'], r['elements']): r['seconds'] for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['tool'], result['elements']))
+        if before and result['seconds'] > before * threshold:
+            regressions.append({'tool': result['tool'], 'elements': result['elements'],
+                                'before': before, 'after': result['seconds'],
+                                'ratio': round(result['seconds'] / before, 3)})
+    return regressions
+
+
+def main():
+    args = parse_arguments()
+    sizes = sorted(int(s) for s in args.sizes.split(',') if s.strip())
+    tools = [t.strip() for t in args.tools.split(',')] if args.tools else list(TOOLS)
+    unknown = [t for t in tools if t not in TOOLS]
+    if unknown:
+        print(f"Feil: Ukjente skript: {', '.join(unknown)}")
+        sys.exit(2)
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='lmdi-ytelse-')
+    results: List[dict] = []
+    startup = None
+    for size in sizes:
+        spec = CorpusSpec(elements=size, slice_depth=args.slice_depth,
+                          references=args.references, profiles=args.profiles)
+        corpus_dir = Path(work_dir) / f"korpus-{size}"
+        corpus = write_corpus(spec, str(corpus_dir))
+        env = dict(os.environ,
+                   LMDI_OFFLINE='1',
+                   LMDI_PACKAGE_DIRS=str(corpus.package_dir),
+                   LMDI_CACHE_DIR=str(corpus_dir / 'cache'))
+        if startup is None:
+            startup = startup_time(env, args.repeat)
+        for tool in tools:
+            command = [sys.executable, str(SCRIPTS_DIR / f"{tool}.py")] + TOOLS[tool](corpus)
+            measurement = time_command(command, env, args.repeat, args.timeout)
+            results.append(dict(tool=tool, elements=size, spec=asdict(spec), **measurement))
+            status = '' if measurement['returncode'] == 0 else f" (feil, kode {measurement['returncode']})"
+            print(f"{tool:36} {size:>7} elementer {measurement['seconds']:8.3f} s{status}")
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'startup_seconds': startup,
+        'results': results,
+        'scaling': scaling(results, startup or 0.0, args.max_exponent),
+    }
+    if args.compare:
+        report['regressions'] = compare(results, args.compare, args.threshold)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultater skrevet til {args.output}")
+
+    flagged = [tool for tool, s in report['scaling'].items() if s['flagged']]
+    failed = sorted({r['tool'] for r in results if r['returncode'] != 0})
+    for tool in flagged:
+        print(f"Advarsel: {tool} skalerer superlineært {report['scaling'][tool]['exponents']}")
+    for regression in report.get('regressions', []):
+        print(f"Advarsel: {regression['tool']} ({regression['elements']} elementer) "
+              f"{regression['ratio']}x tregere enn før")
+    for tool in failed:
+        print(f"Advarsel: {tool} feilet")
+    if flagged or failed or report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
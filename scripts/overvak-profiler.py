@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Overvåker FSH-kildene og SUSHI-output og lager rapporter og diagrammer på
+nytt når filer endres.
+
+Skriptene les-tekster og lag-diagrammer lastes inn i samme prosess, og de
+tre lag-plantuml-variantene lages fra felles grafmodell (profilegraph). FSH-prosjektet, parsede StructureDefinitions og
+basedefinisjonene (loaderen) holdes i minnet mellom endringer. Når en fil
+endres parses bare den filen på nytt, og bare utdata som avhenger av den
+lages på nytt. Filer skrives bare når innholdet faktisk er endret.
+
+Utdata under --output:
+    les-tekster/<fsh-fil>.html
+    lag-diagrammer.puml
+    lag-plantuml-diagrammer.puml
+    lag-plantuml-komplette-diagrammer.puml
+    lag-plantuml-enkel-diagrammer/<StructureDefinition-fil>.puml
+
+Eksempel:
+    python overvak-profiler.py --fsh ../LMDI/input/fsh -o ../generert
+    python overvak-profiler.py --once    # bygg alt én gang og avslutt
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from lmditools.batch import capture_stdout
+from lmditools.fshproject import FSHProject, find_project_root
+from lmditools.profilegraph import (ProfileGraph, ProfileNode, build_profile_node, parse_structure_definition,
+                                    render_plantuml, render_plantuml_complete, render_plantuml_simple)
+from lmditools.stream import load_structure_definition
+from lmditools.watch import Poller, load_script
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_FSH_DIR = SCRIPTS_DIR.parent / 'LMDI' / 'input' / 'fsh'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Lag rapporter og diagrammer på nytt når FSH-filer endres.")
+    parser.add_argument("--fsh", default=str(DEFAULT_FSH_DIR), help="FSH-katalogen (standard: LMDI/input/fsh)")
+    parser.add_argument("--resources",
+                        help="SUSHI-output med StructureDefinition-*.json (standard: fsh-generated/resources i prosjektet)")
+    parser.add_argument("-o", "--output", default="generert", help="Katalog for utdata (standard: generert)")
+    parser.add_argument("--interval", type=float, default=0.5, help="Sekunder mellom hver sjekk (standard: 0.5)")
+    parser.add_argument("--once", action="store_true", help="Bygg alt én gang og avslutt")
+    return parser.parse_args()
+
+
+class Outputs:
+    """Skriver utdatafiler bare når innholdet er endret."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.written: List[Path] = []
+
+    def write(self, relative: str, content: str) -> None:
+        path = self.directory / relative
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == content:
+                    return
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.written.append(path)
+
+    def remove(self, relative: str) -> None:
+        path = self.directory / relative
+        if path.exists():
+            path.unlink()
+            self.written.append(path)
+
+
+class FSHTargets:
+    """les-tekster per profilfil og lag-diagrammer for hele profilkatalogen."""
+
+    def __init__(self, fsh_dir: Path):
+        self.fsh_dir = fsh_dir
+        self.profiles_dir = fsh_dir / 'profiles' if (fsh_dir / 'profiles').is_dir() else fsh_dir
+        self.les_tekster = load_script(SCRIPTS_DIR / 'les-tekster.py')
+        self.lag_diagrammer = load_script(SCRIPTS_DIR / 'lag-diagrammer.py')
+        self.project = FSHProject.load(str(fsh_dir))
+        self.analyzer = self.les_tekster.FSHProfileAnalyzer(self.project)
+
+    def profile_files(self) -> List[str]:
+        return [document.path for document in self.project.documents_under(str(self.profiles_dir))
+                if document.first('Profile') is not None]
+
+    def _affected_profiles(self, changed: Set[str]) -> List[str]:
+        changed_documents = [self.project.by_file.get(path) for path in changed]
+        if any(document is not None and document.aliases for document in changed_documents):
+            return self.profile_files()
+        affected = []
+        for file_path in self.profile_files():
+            profile = self.project.by_file[str(Path(file_path).resolve())].first('Profile')
+            if self.project.dependencies(profile) & changed:
+                affected.append(file_path)
+        return affected
+
+    def update(self, changed: Optional[Set[str]], outputs: Outputs) -> None:
+        """changed=None bygger alt."""
+        if changed is None:
+            affected = self.profile_files()
+        else:
+            for path in changed:
+                self.project.update_file(path)
+            affected = self._affected_profiles(changed)
+            for path in changed:
+                if not os.path.exists(path) and Path(path).parent == self.profiles_dir.resolve():
+                    outputs.remove(f"les-tekster/{Path(path).stem}.html")
+
+        for file_path in affected:
+            text = capture_stdout(self.analyzer.analyze_profile, file_path)
+            outputs.write(f"les-tekster/{Path(file_path).stem}.html", text)
+
+        parser = self.lag_diagrammer.FHIRProfileParser(self.project)
+        for file_path in self.profile_files():
+            parser.parse_file(file_path)
+        outputs.write("lag-diagrammer.puml", parser.generate_plantuml() + "\n")
+
+
+class ResourceTargets:
+    """PlantUML fra SUSHI-genererte StructureDefinitions; hver fil parses bare når den endres."""
+
+    def __init__(self, resources_dir: Path):
+        self.resources_dir = resources_dir
+        self.nodes: Dict[str, Optional[ProfileNode]] = {}
+
+    def structure_files(self) -> List[str]:
+        return sorted(str(p.resolve()) for p in self.resources_dir.glob('StructureDefinition-*.json'))
+
+    @staticmethod
+    def _quiet(func, *args):
+        """Kaller func uten meldingene om basetyper som ikke kunne hentes på stdout."""
+        result = []
+        capture_stdout(lambda: result.append(func(*args)))
+        return result[0]
+
+    def update(self, changed: Optional[Set[str]], outputs: Outputs) -> None:
+        files = self.structure_files()
+        targets = files if changed is None else [p for p in changed if p.endswith('.json')]
+        if not targets:
+            return
+        for path in targets:
+            name = Path(path).stem
+            if not os.path.exists(path):
+                self.nodes.pop(path, None)
+                outputs.remove(f"lag-plantuml-enkel-diagrammer/{name}.puml")
+                continue
+            try:
+                profile_json = load_structure_definition(path)
+                # Oversiktene har bare ressurser og datatyper; enkel-diagrammet lages for alle
+                self.nodes[path] = parse_structure_definition(profile_json, path)
+            except Exception as e:
+                print(f"Feil ved lesing av {path}: {e}")
+                continue
+            outputs.write(f"lag-plantuml-enkel-diagrammer/{name}.puml",
+                          render_plantuml_simple(self.nodes[path] or build_profile_node(profile_json, path)) + "\n")
+
+        # Samme noder brukes for begge oversiktene; grafen lages på nytt så hentede basetyper ikke blir med videre
+        nodes = [self.nodes[p] for p in files if self.nodes.get(p)]
+        if nodes:
+            outputs.write("lag-plantuml-diagrammer.puml", render_plantuml(ProfileGraph(nodes)) + "\n")
+            outputs.write("lag-plantuml-komplette-diagrammer.puml",
+                          self._quiet(render_plantuml_complete, ProfileGraph(nodes)) + "\n")
+
+
+def rebuild(targets, changed: Optional[Set[str]], outputs: Outputs) -> None:
+    start = time.perf_counter()
+    outputs.written = []
+    fsh_targets, resource_targets = targets
+    fsh_changed = None if changed is None else {p for p in changed if p.endswith('.fsh')}
+    json_changed = None if changed is None else {p for p in changed if p.endswith('.json')}
+    if fsh_targets is not None and (fsh_changed is None or fsh_changed):
+        fsh_targets.update(fsh_changed, outputs)
+    if resource_targets is not None and (json_changed is None or json_changed):
+        resource_targets.update(json_changed, outputs)
+    elapsed = (time.perf_counter() - start) * 1000
+    if changed:
+        for path in sorted(changed):
+            print(f"Endret: {path}")
+    for path in outputs.written:
+        print(f"  skrev {path}")
+    print(f"Ferdig på {elapsed:.0f} ms ({len(outputs.written)} filer oppdatert)")
+
+
+def main():
+    args = parse_arguments()
+    fsh_dir = Path(args.fsh).resolve()
+    if not fsh_dir.is_dir():
+        print(f"Feil: Fant ikke FSH-katalogen: {fsh_dir}")
+        sys.exit(1)
+    if args.resources:
+        resources_dir = Path(args.resources).resolve()
+    else:
+        root = find_project_root(str(fsh_dir))
+        resources_dir = (root or fsh_dir) / 'fsh-generated' / 'resources'
+
+    fsh_targets = FSHTargets(fsh_dir)
+    resource_targets = ResourceTargets(resources_dir) if resources_dir.is_dir() else None
+    if resource_targets is None:
+        print(f"Fant ikke {resources_dir}; PlantUML fra StructureDefinitions lages når katalogen finnes")
+
+    outputs = Outputs(Path(args.output))
+    targets = [fsh_targets, resource_targets]
+    rebuild(targets, None, outputs)
+    if args.once:
+        return
+
+    poller = Poller([str(fsh_dir), str(resources_dir)], ('.fsh', '.json'), args.interval)
+    print(f"Overvåker {fsh_dir} og {resources_dir} (Ctrl+C for å avslutte)")
+    try:
+        for changed in poller.changes():
+            if targets[1] is None and resources_dir.is_dir():
+                targets[1] = ResourceTargets(resources_dir)
+                rebuild([None, targets[1]], None, outputs)
+            rebuild(targets, changed, outputs)
+    except KeyboardInterrupt:
+        print("\nAvsluttet")
+
+
+if __name__ == "__main__":
+    main()
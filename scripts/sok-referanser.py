@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Transitive spørringer i referansegrafen mellom profilene.
+
+lag-noe.py references viser bare de direkte referansene i én profil. Her
+bygges grafen over alle profilene (lmditools/referencegraph.py) og lagres i
+cache-katalogen med nøkkel fra hashene av inputfilene, så senere spørringer
+ikke parser noen StructureDefinition.
+
+    reachable   ressursene en profil når transitivt, eventuelt via en annen profil
+    dependents  profilene som transitivt refererer til en profil (hva berøres hvis den endres)
+    path        korteste sti mellom to profiler, eventuelt via en tredje
+
+Hver sti vises med elementene den går gjennom og kardinaliteten langs
+stien (kantenes effektive kardinaliteter kombinert).
+
+Eksempel:
+    python sok-referanser.py reachable LegemiddelregisterBundle --via Legemiddeladministrering
+    python sok-referanser.py dependents Pasient
+    python sok-referanser.py path LegemiddelregisterBundle Pasient --via Legemiddelrekvirering
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from lmditools.profilegraph import find_structure_definitions
+from lmditools.referencegraph import GraphEdge, ReferenceGraph, load_graph, path_cardinality
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_SOURCE_DIR = SCRIPTS_DIR.parent / 'LMDI' / 'fsh-generated' / 'resources'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Spørringer i referansegrafen mellom profilene.")
+    parser.add_argument("--source", action="append",
+                        help=f"StructureDefinition-fil eller katalog; kan gis flere ganger (standard: {DEFAULT_SOURCE_DIR})")
+    parser.add_argument("--format", choices=['text', 'json'], default='text', help="Utdataformat (standard: text)")
+    parser.add_argument("--rebuild", action="store_true", help="Bygg grafen på nytt selv om den ligger i cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reachable = commands.add_parser("reachable", help="Ressursene profilen når transitivt")
+    reachable.add_argument("start", help="Profil (navn, Id eller URL)")
+    reachable.add_argument("--via", help="Bare stier gjennom denne profilen")
+
+    dependents = commands.add_parser("dependents", help="Profilene som transitivt refererer til profilen")
+    dependents.add_argument("target", help="Profil (navn, Id eller URL)")
+
+    path = commands.add_parser("path", help="Korteste sti mellom to profiler")
+    path.add_argument("start", help="Profil (navn, Id eller URL)")
+    path.add_argument("end", help="Profil (navn, Id eller URL)")
+    path.add_argument("--via", help="Stien må gå gjennom denne profilen")
+    return parser.parse_args()
+
+
+def resolve(graph: ReferenceGraph, name: Optional[str]) -> Optional[str]:
+    if name is None:
+        return None
+    key = graph.resolve(name)
+    if key is None:
+        known = ', '.join(sorted(node.key for node in graph.nodes.values() if node.is_local_profile))
+        print(f"Feil: Fant ingen profil '{name}'. Kjente profiler: {known}")
+        sys.exit(1)
+    return key
+
+
+def format_chain(chain: List[GraphEdge]) -> str:
+    """'A --Bundle.entry.resource [0..*]--> B --...--> C'."""
+    if not chain:
+        return ''
+    parts = [chain[0].source]
+    for edge in chain:
+        parts.append(f"--{edge.path} [{edge.cardinality}]--> {edge.target}")
+    return ' '.join(parts)
+
+
+def chain_dict(node: str, chain: List[GraphEdge]) -> dict:
+    return {'node': node, 'distance': len(chain), 'cardinality': str(path_cardinality(chain)),
+            'path': [edge.to_dict() for edge in chain]}
+
+
+def print_chains(title: str, chains: Dict[str, List[GraphEdge]], graph: ReferenceGraph, fmt: str) -> None:
+    ordered = sorted(chains.items(), key=lambda item: (len(item[1]), item[0]))
+    if fmt == 'json':
+        print(json.dumps([chain_dict(node, chain) for node, chain in ordered], ensure_ascii=False, indent=2))
+        return
+    print(f"{title}: {len(ordered)}")
+    for node, chain in ordered:
+        marker = '' if graph.nodes[node].is_local_profile else ' (ingen profil)'
+        print(f"  {node}{marker} [{path_cardinality(chain)}] avstand {len(chain)}")
+        print(f"      {format_chain(chain)}")
+
+
+def main():
+    args = parse_arguments()
+    sources = args.source or [str(DEFAULT_SOURCE_DIR)]
+    files = sorted({path for source in sources for path in find_structure_definitions(source)})
+    if not files:
+        print(f"Feil: Fant ingen StructureDefinition-filer i {', '.join(sources)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    graph, cached = load_graph(files, rebuild=args.rebuild)
+    print(f"Referansegraf med {len(graph.nodes)} noder og {graph.edge_count} kanter "
+          f"{'fra cache' if cached else 'bygget'} på {(time.perf_counter() - start) * 1000:.1f} ms",
+          file=sys.stderr)
+
+    if args.command == "reachable":
+        origin, via = resolve(graph, args.start), resolve(graph, args.via)
+        title = f"Nåbare fra {origin}" + (f" via {via}" if via else "")
+        print_chains(title, graph.reachable(origin, via), graph, args.format)
+    elif args.command == "dependents":
+        target = resolve(graph, args.target)
+        print_chains(f"Avhenger av {target}", graph.dependents(target), graph, args.format)
+    elif args.command == "path":
+        origin, end, via = resolve(graph, args.start), resolve(graph, args.end), resolve(graph, args.via)
+        if origin == end and via is None:
+            if args.format == 'json':
+                print(json.dumps(chain_dict(end, []), ensure_ascii=False, indent=2))
+            else:
+                print(f"Start og slutt er samme profil: {origin}")
+            return
+        chain = graph.shortest_path(origin, end, via)
+        if args.format == 'json':
+            print(json.dumps(chain_dict(end, chain) if chain is not None else None, ensure_ascii=False, indent=2))
+        elif chain is None:
+            print(f"Ingen sti fra {origin} til {end}" + (f" via {via}" if via else ""))
+        else:
+            print(f"{format_chain(chain)}")
+            print(f"Kardinalitet langs stien: {path_cardinality(chain)} (avstand {len(chain)})")
+
+
+if __name__ == "__main__":
+    main()
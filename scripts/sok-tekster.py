@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Fulltekstsøk i short, definition, comment, description og purpose for alle
+genererte StructureDefinitions og basepakkene.
+
+Profilene indekseres med tekstene analyser-tekster.py trekker ut (bare
+tekster profilen selv setter, ikke arvede basetekster). Basepakkene
+(R4-kjernen, no-basis, ...) indekseres med tekstene hver StructureDefinition
+definerer i differential. Før hvert søk oppdateres indeksen inkrementelt:
+bare endrede profilfiler og nye pakkeversjoner leses. Se
+lmditools/textsearch.py for indeksen.
+
+Eksempel:
+    python sok-tekster.py Feilregistrert
+    python sok-tekster.py "TODO 12" --property comment
+    python sok-tekster.py "snomed*" --profiles-only -n 50
+    python sok-tekster.py --source ../LMDI/fsh-generated/resources    # bare oppdater indeksen
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from lmditools.loader import get_default_loader
+from lmditools.manifest import file_hash
+from lmditools.stream import load_structure_definition
+from lmditools.textsearch import (PACKAGE_KIND, PROFILE_KIND, SEARCH_PROPERTIES, Entry, TextSearchIndex,
+                                  structure_entries)
+from lmditools.watch import load_script
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_SOURCE_DIR = SCRIPTS_DIR.parent / 'LMDI' / 'fsh-generated' / 'resources'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Søk i tekstene til profilene og basepakkene.")
+    parser.add_argument("query", nargs='?',
+                        help='Søkeord; alle må finnes. "..." er en frase, ord* matcher prefiks')
+    parser.add_argument("--source", action="append",
+                        help=f"Katalog med StructureDefinitions; kan gis flere ganger (standard: {DEFAULT_SOURCE_DIR})")
+    parser.add_argument("--property", action="append", choices=SEARCH_PROPERTIES,
+                        help="Søk bare i denne egenskapen; kan gis flere ganger")
+    parser.add_argument("--profiles-only", action="store_true", help="Bare treff i profilene, ikke basepakkene")
+    parser.add_argument("--no-packages", action="store_true", help="Ikke oppdater basepakkene i indeksen")
+    parser.add_argument("--no-update", action="store_true", help="Søk i indeksen uten å oppdatere den først")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Antall treff (standard: 20)")
+    parser.add_argument("--format", choices=['text', 'json'], default='text', help="Utdataformat (standard: text)")
+    parser.add_argument("--index", help="Sti til indeksfilen (standard: i cache-katalogen)")
+    return parser.parse_args()
+
+
+class TextExtractor:
+    """Tekstene for én profil, fra radmodellen til analyser-tekster."""
+
+    def __init__(self):
+        analyser_tekster = load_script(SCRIPTS_DIR / 'analyser-tekster.py')
+        self.analyzer = analyser_tekster.FHIRProfileAnalyzer()
+        # Meldinger om baser som ikke kan lastes hører ikke hjemme i søket
+        self.analyzer.message_file = open(os.devnull, 'w')
+
+    def profile_entries(self, file_path: str) -> Iterator[Entry]:
+        report = self.analyzer.build_report(file_path)
+        if report is None:
+            # Ingen base å sammenligne med (f.eks. offline): bruk differential direkte
+            resource = load_structure_definition(file_path, sections=('differential',))
+            if resource.get('resourceType') == 'StructureDefinition':
+                yield from structure_entries(resource)
+            return
+        for prop, value in report.profile_properties:
+            if value:
+                yield report.name, '', '', prop, value
+        for row in report.rows:
+            if row.property in SEARCH_PROPERTIES and row.changed:
+                yield report.name, row.path, row.slice_name, row.property, row.value
+
+
+def _stat_key(stat: os.stat_result) -> str:
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def update_directory(index: TextSearchIndex, extractor: TextExtractor, directory: str) -> int:
+    """Indekserer endrede filer i katalogen og fjerner slettede. Returnerer antall leste filer."""
+    directory = os.path.abspath(directory)
+    files = {str(p): p.stat() for p in sorted(Path(directory).glob('*.json'))}
+    for source in index.sources(PROFILE_KIND, directory + os.sep):
+        if source not in files:
+            index.remove_source(source)
+
+    updated = 0
+    for source, stat in files.items():
+        # Fingeravtrykk "mtime:størrelse:sha256"; hashen beregnes bare når stat er endret
+        stored_stat, _, stored_digest = (index.fingerprint(source) or '').rpartition(':')
+        if stored_stat == _stat_key(stat):
+            continue
+        digest = file_hash(source)
+        fingerprint = f"{_stat_key(stat)}:{digest}"
+        if stored_digest == digest:
+            index.set_fingerprint(source, fingerprint)
+            continue
+        try:
+            entries = list(extractor.profile_entries(source))
+        except (OSError, ValueError) as e:
+            print(f"Feil ved lesing av {source}: {e}", file=sys.stderr)
+            continue
+        index.replace_source(source, PROFILE_KIND, fingerprint, entries)
+        updated += 1
+    return updated
+
+
+def package_entries(package) -> Iterator[Entry]:
+    for url, filename in sorted(package.urls.items()):
+        if not filename.startswith('StructureDefinition-'):
+            continue
+        try:
+            resource = json.loads(package.read(filename))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Kunne ikke lese {filename} i {package.package_id}: {e}", file=sys.stderr)
+            continue
+        if resource.get('resourceType') == 'StructureDefinition':
+            yield from structure_entries(resource)
+
+
+def update_packages(index: TextSearchIndex) -> int:
+    """Indekserer hver pakkeversjon én gang og fjerner pakker som ikke lenger finnes."""
+    packages = {f"{PACKAGE_KIND}:{package.package_id}": package
+                for package in get_default_loader().packages.packages}
+    for source in index.sources(PACKAGE_KIND):
+        if source not in packages:
+            index.remove_source(source)
+    updated = 0
+    for source, package in packages.items():
+        if index.fingerprint(source) == package.package_id:
+            continue
+        index.replace_source(source, PACKAGE_KIND, package.package_id, package_entries(package))
+        updated += 1
+    return updated
+
+
+def print_hits(hits: list, fmt: str) -> None:
+    if fmt == 'json':
+        print(json.dumps([hit.to_dict() for hit in hits], ensure_ascii=False, indent=2))
+        return
+    for number, hit in enumerate(hits, 1):
+        origin = os.path.basename(hit.source) if hit.kind == PROFILE_KIND else hit.source
+        print(f"{number:3}. {hit.location} ({hit.property}) [{origin}]")
+        print(f"     {' '.join(hit.snippet.split())}")
+
+
+def main():
+    args = parse_arguments()
+    sources: List[str] = args.source or ([str(DEFAULT_SOURCE_DIR)] if DEFAULT_SOURCE_DIR.is_dir() else [])
+    with TextSearchIndex(Path(args.index) if args.index else None) as index:
+        if not args.no_update:
+            start = time.perf_counter()
+            extractor: Optional[TextExtractor] = None
+            updated = 0
+            for directory in sources:
+                if not os.path.isdir(directory):
+                    print(f"Feil: Kunne ikke finne katalog: {directory}", file=sys.stderr)
+                    continue
+                extractor = extractor or TextExtractor()
+                updated += update_directory(index, extractor, directory)
+            if not args.no_packages:
+                updated += update_packages(index)
+            if updated or not args.query:
+                print(f"Oppdaterte {updated} kilder på {time.perf_counter() - start:.3f} s "
+                      f"({index.count()} tekster i indeksen)", file=sys.stderr)
+
+        if args.query:
+            start = time.perf_counter()
+            hits = index.search(args.query, args.limit, args.property,
+                                PROFILE_KIND if args.profiles_only else None)
+            elapsed = time.perf_counter() - start
+            print_hits(hits, args.format)
+            print(f"{len(hits)} treff på {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Snapshot-generering (lmditools/snapshot.py) for type-slices på choice-elementer,
+med begge id-formene SUSHI og FSH bruker for barna under slicen.
+"""
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lmditools import snapshot  # noqa: E402
+from lmditools.loader import StructureDefinitionLoader  # noqa: E402
+from lmditools.packages import PackageResolver  # noqa: E402
+
+CORE = 'http://hl7.org/fhir/StructureDefinition/'
+
+QUANTITY = {
+    'resourceType': 'StructureDefinition', 'url': f"{CORE}Quantity", 'type': 'Quantity',
+    'snapshot': {'element': [
+        {'id': 'Quantity', 'path': 'Quantity', 'min': 0, 'max': '*'},
+        {'id': 'Quantity.value', 'path': 'Quantity.value', 'min': 0, 'max': '1', 'type': [{'code': 'decimal'}]},
+        {'id': 'Quantity.unit', 'path': 'Quantity.unit', 'min': 0, 'max': '1', 'type': [{'code': 'string'}]},
+    ]},
+}
+
+OBSERVATION = {
+    'resourceType': 'StructureDefinition', 'url': f"{CORE}Observation", 'type': 'Observation',
+    'snapshot': {'element': [
+        {'id': 'Observation', 'path': 'Observation', 'min': 0, 'max': '*'},
+        {'id': 'Observation.value[x]', 'path': 'Observation.value[x]', 'min': 0, 'max': '1',
+         'type': [{'code': 'Quantity'}, {'code': 'string'}, {'code': 'CodeableConcept'}]},
+    ]},
+}
+
+
+def _profile(elements):
+    return {'resourceType': 'StructureDefinition', 'url': 'http://example.org/StructureDefinition/obs',
+            'type': 'Observation', 'baseDefinition': f"{CORE}Observation",
+            'differential': {'element': [{'id': 'Observation', 'path': 'Observation'}] + elements}}
+
+
+class ChoiceSliceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        loader = StructureDefinitionLoader(cache_dir=self.directory.name, packages=PackageResolver([]),
+                                           offline=True)
+        for definition in (QUANTITY, OBSERVATION):
+            loader.store(definition['url'], json.dumps(definition).encode('utf-8'))
+        snapshot._DATATYPE_CACHE.clear()
+        self.generator = snapshot.SnapshotGenerator(loader)
+
+    def tearDown(self):
+        snapshot._DATATYPE_CACHE.clear()
+        self.directory.cleanup()
+
+    def _elements(self, differential):
+        return {element['id']: element for element in self.generator.generate(_profile(differential))}
+
+    def test_children_under_sliced_choice_id(self):
+        elements = self._elements([
+            {'id': 'Observation.value[x]:valueQuantity', 'path': 'Observation.value[x]',
+             'sliceName': 'valueQuantity', 'type': [{'code': 'Quantity'}]},
+            {'id': 'Observation.value[x]:valueQuantity.unit', 'path': 'Observation.value[x].unit', 'min': 1},
+        ])
+        self.assertEqual(elements['Observation.value[x]:valueQuantity']['type'], [{'code': 'Quantity'}])
+        self.assertIn('Observation.value[x]:valueQuantity.value', elements)
+        self.assertEqual(elements['Observation.value[x]:valueQuantity.unit']['min'], 1)
+
+    def test_children_under_renamed_choice_id(self):
+        elements = self._elements([
+            {'id': 'Observation.valueQuantity.unit', 'path': 'Observation.valueQuantity.unit', 'min': 1},
+        ])
+        self.assertEqual(elements['Observation.value[x]:valueQuantity']['type'], [{'code': 'Quantity'}])
+        self.assertIn('Observation.value[x]:valueQuantity.value', elements)
+        self.assertEqual(elements['Observation.value[x]:valueQuantity.unit']['min'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Strømmeleseren i lmditools/stream.py mot json.load, med små blokker slik at
+tall, strenger og strukturer deles på tvers av blokkgrensene.
+"""
+import io
+import json
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lmditools.stream import _Reader  # noqa: E402
+
+
+def _read_value(reader: _Reader):
+    """Bygger verdien via members/items, slik _walk leser filene."""
+    char = reader.peek()
+    if char == '{':
+        return {key: _read_value(reader) for key in reader.members()}
+    if char == '[':
+        return [_read_value(reader) for _ in reader.items()]
+    return reader.decode()
+
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(8 if depth < 4 else 5)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.choice([0.5, -1.25, 1e-7, 3.14159e12, 2.0, -0.0])
+    if kind == 2:
+        return ''.join(rng.choice('ab"\\\\æø\\n {}[],:') for _ in range(rng.randrange(12)))
+    if kind == 3:
+        return rng.choice([True, False, None])
+    if kind == 4:
+        return rng.uniform(-1000, 1000)
+    if kind == 5:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {f"k{i}": _random_value(rng, depth + 1) for i in range(rng.randrange(5))}
+
+
+class ReaderRoundTripTest(unittest.TestCase):
+    def test_matches_json_load_with_tiny_chunks(self):
+        rng = random.Random(1)
+        for _ in range(600):
+            document = {'resourceType': 'StructureDefinition', 'value': _random_value(rng)}
+            text = json.dumps(document, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+            for chunk_size in (1, 2, 3, 7):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    reader = _Reader(io.StringIO(text), chunk_size=chunk_size)
+                    self.assertEqual(_read_value(reader), json.loads(text))
+
+    def test_number_split_after_point_and_exponent(self):
+        for text in ('{"a": 1.5}', '{"a": 2e10}', '{"a": -3.25E-4}', '[10, 1.0, 7]'):
+            for chunk_size in range(1, len(text) + 1):
+                with self.subTest(text=text, chunk_size=chunk_size):
+                    reader = _Reader(io.StringIO(text), chunk_size=chunk_size)
+                    self.assertEqual(_read_value(reader), json.loads(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
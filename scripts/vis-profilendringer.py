@@ -1,21 +1,17 @@
 import json
 from typing import Dict, List, Optional
-from dataclasses import dataclass
 from pathlib import Path
-import requests
 import argparse
 import os
 
-DEFAULT_PATH = r"c:\dev\lmdi\lmdi\fsh-generated\resources"
+from lmditools.batch import capture_stdout, open_manifest, run_batch
+from lmditools.loader import get_default_loader
+from lmditools.prefetch import prefetch_for_files
+from lmditools.records import Cardinality, ElementRecord
 
-@dataclass
-class FHIRElementInfo:
-    path: str
-    type_code: str
-    cardinality: str
-    changes: str
+DEFAULT_PATH = r"c:\dev\lmdi\lmdi\fsh-generated\resources"
 
-def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dict:
+def generate_example(resource_type: str, elements: List[ElementRecord]) -> dict:
     """Generate example data based on resource type and elements."""
     example = {
         "resourceType": resource_type,
@@ -27,7 +23,7 @@ def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dic
     }
     
     # Hent alle elementer som skal inkluderes (cardinality ikke 0..0)
-    required_elements = [elem for elem in elements if not (elem.cardinality == '0..0')]
+    required_elements = [elem for elem in elements if not elem.is_removed]
     
     for element in required_elements:
         if '.' not in element.path:
@@ -38,44 +34,44 @@ def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dic
         
         for i, part in enumerate(path_parts[1:]):
             if i == len(path_parts[1:]) - 1:
-                if element.type_code == "string":
+                if element.type == "string":
                     current[part] = f"Eksempel {part}"
-                elif element.type_code == "code":
+                elif element.type == "code":
                     current[part] = "active"
-                elif element.type_code == "uri":
+                elif element.type == "uri":
                     current[part] = "urn:oid:2.16.578.1.12.4.1.4.1"
-                elif element.type_code == "boolean":
+                elif element.type == "boolean":
                     current[part] = True
-                elif element.type_code == "integer":
+                elif element.type == "integer":
                     current[part] = 42
-                elif element.type_code == "decimal":
+                elif element.type == "decimal":
                     current[part] = 37.5
-                elif element.type_code == "positiveInt":
+                elif element.type == "positiveInt":
                     current[part] = 42
-                elif element.type_code == "unsignedInt":
+                elif element.type == "unsignedInt":
                     current[part] = 42
-                elif element.type_code == "base64Binary":
+                elif element.type == "base64Binary":
                     current[part] = "SGVsbG8="
-                elif element.type_code == "instant":
+                elif element.type == "instant":
                     current[part] = "2024-02-05T13:28:17+01:00"
-                elif element.type_code == "date":
+                elif element.type == "date":
                     current[part] = "2024-02-05"
-                elif element.type_code == "dateTime":
+                elif element.type == "dateTime":
                     current[part] = "2024-02-05T13:28:17+01:00"
-                elif element.type_code == "time":
+                elif element.type == "time":
                     current[part] = "13:28:17"
-                elif element.type_code == "Identifier":
+                elif element.type == "Identifier":
                     current[part] = {
                         "system": "urn:oid:2.16.578.1.12.4.1.4.1",
                         "value": "04021550123"
                     }
-                elif element.type_code == "HumanName":
+                elif element.type == "HumanName":
                     current[part] = {
                         "use": "official",
                         "family": "Olsen",
                         "given": ["Erik"]
                     }
-                elif element.type_code == "Address":
+                elif element.type == "Address":
                     current[part] = {
                         "use": "home",
                         "line": ["Storgata 55"],
@@ -83,24 +79,24 @@ def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dic
                         "postalCode": "0182",
                         "country": "NO"
                     }
-                elif element.type_code == "ContactPoint":
+                elif element.type == "ContactPoint":
                     current[part] = {
                         "system": "phone",
                         "value": "+47 99887766",
                         "use": "work"
                     }
-                elif element.type_code == "Period":
+                elif element.type == "Period":
                     current[part] = {
                         "start": "2024-02-05",
                         "end": "2024-03-05"
                     }
-                elif element.type_code == "Coding":
+                elif element.type == "Coding":
                     current[part] = {
                         "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
                         "code": "MR",
                         "display": "Medical record number"
                     }
-                elif element.type_code == "CodeableConcept":
+                elif element.type == "CodeableConcept":
                     current[part] = {
                         "coding": [{
                             "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
@@ -109,13 +105,13 @@ def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dic
                         }],
                         "text": "Medical record number"
                     }
-                elif element.type_code == "Reference":
+                elif element.type == "Reference":
                     current[part] = {
                         "reference": f"Organization/example",
                         "display": "Example Organization"
                     }
                 else:
-                    current[part] = f"Example {element.type_code}"
+                    current[part] = f"Example {element.type}"
             else:
                 if part not in current:
                     current[part] = {}
@@ -124,12 +120,8 @@ def generate_example(resource_type: str, elements: List[FHIRElementInfo]) -> dic
     return example
 
 class FHIRResourceAnalyzer:
-    FHIR_BASE_URL = "http://hl7.org/fhir/R4"
-    
-    def __init__(self, profile_path: str, base_definitions_dir: str = "base_definitions"):
+    def __init__(self, profile_path: str):
         self.profile_path = profile_path
-        self.base_definitions_dir = Path(base_definitions_dir)
-        self.base_definitions_dir.mkdir(exist_ok=True)
         
         self.profile_data = self._load_profile()
         self.base_resource_type = self._get_base_resource_type()
@@ -144,22 +136,13 @@ class FHIRResourceAnalyzer:
             return json.load(f)
     
     def _load_base_definition(self) -> dict:
-        base_file = self.base_definitions_dir / f"{self.base_resource_type}.json"
-        if not base_file.exists():
-            url = f"{self.FHIR_BASE_URL}/StructureDefinition/{self.base_resource_type}"
-            try:
-                response = requests.get(url)
-                response.raise_for_status()
-                with open(base_file, 'w', encoding='utf-8') as f:
-                    json.dump(response.json(), f, indent=2)
-            except requests.exceptions.RequestException as e:
-                print(f"Kunne ikke laste base-definisjon: {e}")
-                return {}
-                
-        with open(base_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        base = get_default_loader().get(self.profile_data.get('baseDefinition', ''))
+        if base is None:
+            print(f"Kunne ikke laste base-definisjon: {self.base_resource_type}")
+            return {}
+        return base
     
-    def analyze_elements(self) -> List[FHIRElementInfo]:
+    def analyze_elements(self) -> List[ElementRecord]:
         # Hent baseprofilens elementer
         base_elements = self.base_definition.get('snapshot', {}).get('element', [])
         base_dict = {elem['path']: elem for elem in base_elements}
@@ -205,17 +188,15 @@ class FHIRResourceAnalyzer:
                 changes.append("pattern")
     
             # Bruk profilkardinalitet kun dersom den er endret, ellers vis basekardinalitet
-            if (profile_elem.get('min', base_min) != base_min) or (profile_elem.get('max', base_max) != base_max):
-                cardinality = f"{profile_elem.get('min', base_min)}..{profile_elem.get('max', base_max)}"
-            else:
-                cardinality = f"{base_min}..{base_max}"
+            cardinality = Cardinality.from_element(profile_elem, base_min, base_max)
             
             display_path = path.split('.')[-1] if '.' in path else path
             
-            element_info = FHIRElementInfo(
+            element_info = ElementRecord(
                 path=display_path,
-                type_code=base_type,
-                cardinality=cardinality,
+                type=base_type,
+                min=cardinality.min,
+                max=cardinality.max,
                 changes=", ".join(changes) if changes else "-"
             )
             analyzed_elements.append(element_info)
@@ -226,7 +207,7 @@ def analyze_profile(path: str):
     analyzer = FHIRResourceAnalyzer(path)
     elements = analyzer.analyze_elements()
     
-    table_data = [(e.path, e.type_code, e.cardinality, e.changes) for e in elements]
+    table_data = [(e.path, e.type, e.cardinality, e.changes) for e in elements]
     
     # Skriv ut profiloverskrift
     print(f"\n\n# {analyzer.profile_data.get('title', analyzer.profile_data.get('name', 'Ukjent'))}")
@@ -248,30 +229,46 @@ def analyze_profile(path: str):
     print("\n")
 
 def get_structure_definitions(directory: str) -> List[str]:
-    return [str(p) for p in Path(directory).glob("StructureDefinition-*.json")]
+    return sorted(str(p) for p in Path(directory).glob("StructureDefinition-*.json"))
 
-def get_profile_path() -> str:
+def get_profile_path() -> Optional[argparse.Namespace]:
     parser = argparse.ArgumentParser(description='Analyser FHIR-profil')
     parser.add_argument('path', nargs='?', help='Sti til FHIR-profil eller mappe')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Gjenbruk resultat for profiler som ikke er endret siden forrige kjøring')
+    parser.add_argument('--manifest', help='Sti til manifestfil (standard: i cache-katalogen)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Antall prosesser når en katalog analyseres (standard: 1)')
     args = parser.parse_args()
 
-    path = args.path or input(f"\nAngi sti til FHIR-profil [trykk Enter for {DEFAULT_PATH}]: ").strip() or DEFAULT_PATH
+    args.path = args.path or input(f"\nAngi sti til FHIR-profil [trykk Enter for {DEFAULT_PATH}]: ").strip() or DEFAULT_PATH
     
-    if not os.path.exists(path):
-        print(f"Finner ikke: {path}")
+    if not os.path.exists(args.path):
+        print(f"Finner ikke: {args.path}")
         return None
         
-    return path
+    return args
+
+def analyze_profile_text(profile: str) -> str:
+    try:
+        return capture_stdout(analyze_profile, profile)
+    except Exception as e:
+        return f"Feil ved analyse av {profile}: {e}\n"
 
 if __name__ == '__main__':
-    path = get_profile_path()
-    if path:
+    args = get_profile_path()
+    if args:
+        path = args.path
         if os.path.isdir(path):
             profiles = get_structure_definitions(path)
-            for profile in profiles:
-                try:
-                    analyze_profile(profile)
-                except Exception as e:
-                    print(f"Feil ved analyse av {profile}: {e}")
+            if args.jobs > 1:
+                prefetch_for_files(profiles)
+            manifest = None
+            if args.incremental or args.manifest:
+                manifest = open_manifest(__file__, path, args.manifest)
+            for profile, output in run_batch(profiles, analyze_profile_text, manifest, jobs=args.jobs):
+                print(output, end='')
+            if manifest:
+                manifest.save()
         else:
             analyze_profile(path)